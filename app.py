@@ -1,192 +1,27 @@
 import streamlit as st
 import pandas as pd
 from datetime import datetime , timezone
-import requests ,json ,time , sqlite3 , os , re , ast
+import requests ,json ,time , sqlite3 , os , re , ast , subprocess , sys
 from bs4 import BeautifulSoup 
 from io import BytesIO
 import plotly.graph_objects as go
+from functools import partial
+from html import escape
+from db import (DB_FILE, init_db, clear_all_data, query_listings, count_listings, top_deals, get_brands,
+                data_version, thumbnail_version, get_runs, request_cancel, image_urls, get_thumbnails, price_drops,
+                time_on_market, get_metrics, search_listings, price_history)
+from exports import EXPORT_FORMATS, available_formats, export
+from titles import MAKE_MATCHER
+from marketguide import MarketGuideError, market_guide_for_title, parse_token
+import kijiji, autotrader
+import thumbnails, metrics
 
 # ---------------- CONFIG ----------------
 st.set_page_config(page_title="Car Listings App", layout="wide")
-DB_FILE = os.path.join(os.path.dirname(__file__), "cars.db")
+RUNNER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "runner.py")
 
 
 # ---------------- DATABASE ----------------
-def clear_all_data(db_file):
-    conn = sqlite3.connect(db_file)
-    c = conn.cursor()
-
-    try:
-        # Delete all rows
-        c.execute("DELETE FROM autotrader")
-        c.execute("DELETE FROM kjiji")
-
-        # Reset autoincrement counters
-        c.execute("DELETE FROM sqlite_sequence WHERE name='autotrader'")
-        c.execute("DELETE FROM sqlite_sequence WHERE name='kjiji'")
-
-        conn.commit()
-        print("✅ All data cleared from 'autotrader' and 'kjiji' tables.")
-    except Exception as e:
-        print(f"❌ Error clearing data: {e}")
-    finally:
-        conn.close()
-
-def init_db():
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute("""
-        CREATE TABLE IF NOT EXISTS autotrader (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            title TEXT NOT NULL,
-            price TEXT,
-            location TEXT,
-            odometer TEXT,
-            image_src TEXT,
-            ad_link TEXT,
-            created_at TEXT DEFAULT CURRENT_TIMESTAMP
-        )
-    """)
-
-    c.execute("""
-        CREATE TABLE IF NOT EXISTS kjiji (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            type TEXT,
-            name TEXT,
-            description TEXT,
-            image TEXT,
-            price TEXT,
-            priceCurrency TEXT,
-            url TEXT UNIQUE,
-            brand_name TEXT,
-            mileage_value TEXT,
-            mileage_unitCode TEXT,
-            model TEXT,
-            vehicleModelDate TEXT,
-            bodyType TEXT,
-            color TEXT,
-            numberOfDoors TEXT,
-            fuelType TEXT,
-            vehicleTransmission TEXT,
-            activationDate TEXT,
-            sortingDate TEXT,
-            time_since_activation,
-            created_at TEXT DEFAULT CURRENT_TIMESTAMP
-        )
-    """)
-
-    conn.commit()
-    conn.close()
-
-def insert_car_autotreader(title, price, location, odometer, image_src,ad_link):
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    c.execute("""
-        INSERT INTO autotrader (title, price, location, odometer, image_src, ad_link, created_at)
-        VALUES (?, ?, ?, ?, ?, ?, ?)
-    """, (title, price, location, odometer, image_src, ad_link,now))
-    conn.commit()
-    conn.close()
-
-def insert_car_kijiji(car):
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-
-    c.execute("""
-        INSERT OR IGNORE INTO kjiji (
-            type, name, description, image, price, priceCurrency, url,
-            brand_name, mileage_value, mileage_unitCode, model,
-            vehicleModelDate, bodyType, color, numberOfDoors,
-            fuelType, vehicleTransmission, activationDate, sortingDate, time_since_activation, created_at
-        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?,?, ?)
-    """, (
-        str(car.get("type")),
-        str(car.get("name")),
-        str(car.get("Description")),   # <--- main suspect
-        str(car.get("image")),
-        str(car.get("price")),
-        str(car.get("priceCurrency")),
-        str(car.get("url")),
-        str(car.get("brand_name")),
-        str(car.get("mileage_value")),
-        str(car.get("mileage_unitCode")),
-        str(car.get("model")),
-        str(car.get("vehicleModelDate")),
-        str(car.get("bodyType")),
-        str(car.get("color")),
-        str(car.get("numberOfDoors")),
-        str(car.get("fuelType")),
-        str(car.get("vehicleTransmission")),
-        str(car.get("activationDate")),
-        str(car.get("sortingDate")),
-        str(car.get("time_since_activation")),
-        now
-    ))
-    conn.commit()
-    conn.close()
-
-
-
-def get_all_autotrader_cars():
-    conn = sqlite3.connect(DB_FILE)
-    df = pd.read_sql_query("SELECT * FROM autotrader ORDER BY id ASC", conn)
-    conn.close()
-    return df
-
-def get_all_kijiji_cars():
-    conn = sqlite3.connect(DB_FILE)
-    df = pd.read_sql_query("SELECT * FROM kjiji ORDER BY id ASC", conn)
-    conn.close()
-    return df
-
-
-def merge_car_data():
-    kdf = get_all_kijiji_cars()
-    adf = get_all_autotrader_cars()
-
-    # Add a source column
-    kdf["source"] = "Kijiji"
-    adf["source"] = "Autotrader"
-
-    # --- Kijiji normalization ---
-    kdf = kdf.rename(columns={
-        "name": "title",
-        "priceCurrency": "currency",
-        "brand_name": "brand",
-        "mileage_value": "odometer",
-        "url": "ad_link",
-        "image": "image_src"
-    })[[
-        "source", "title", "price", "currency", "brand",
-        "model", "vehicleModelDate", "bodyType", "color",
-        "fuelType", "vehicleTransmission", "odometer",
-        "image_src", "ad_link", "created_at"
-    ]]
-
-    # --- Autotrader normalization ---
-    # Add missing columns if not present
-    for col in ["title", "price", "odometer", "image_src", "ad_link", "created_at"]:
-        if col not in adf.columns:
-            adf[col] = None
-
-    # Add optional fields missing from Autotrader
-    for col in ["currency", "brand", "model", "vehicleModelDate", "bodyType", "color", "fuelType", "vehicleTransmission"]:
-        adf[col] = None
-
-    adf = adf[[
-        "source", "title", "price", "currency", "brand",
-        "model", "vehicleModelDate", "bodyType", "color",
-        "fuelType", "vehicleTransmission", "odometer",
-        "image_src", "ad_link", "created_at"
-    ]]
-
-    # Merge both
-    merged = pd.concat([kdf, adf], ignore_index=True)
-    merged.sort_values(by="created_at", ascending=False, inplace=True)
-    return merged
-    
 def parse_kijiji_date1(date_str):
     if not date_str:
         return None
@@ -201,715 +36,586 @@ def parse_kijiji_date1(date_str):
             return None
     
 
-def to_excel_bytes(df):
-    output = BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        df.to_excel(writer, index=False, sheet_name='Merged Cars')
-    return output.getvalue()
-# Initialize the database
-init_db()
+
+# ---------------- CACHE ----------------
+# Everything the View page reads is cached on db.data_version(), which the
+# ingest path bumps. A rerun with unchanged data hits these caches only.
+# Export payloads are shared objects (cache_resource, no copy per rerun).
+@st.cache_data(max_entries=256, show_spinner=False)
+def cached_listing_page(version, view, sort, after, limit, filter_items):
+    return query_listings(view=view, sort=sort, after=after, limit=limit, **dict(filter_items))
+
+
+@st.cache_data(max_entries=256, show_spinner=False)
+def cached_count(version, view, filter_items):
+    return count_listings(view=view, **dict(filter_items))
+
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def cached_top_deals(version, limit, filter_items):
+    return top_deals(limit=limit, **dict(filter_items))
+
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def cached_search(version, text, limit, filter_items):
+    return search_listings(text, limit=limit, highlight=SEARCH_HIGHLIGHT, **dict(filter_items))
+
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def cached_price_drops(version, since_ts, limit):
+    return price_drops(since_ts=since_ts, limit=limit)
+
+
+@st.cache_data(max_entries=4, show_spinner=False)
+def cached_time_on_market(version):
+    return time_on_market()
+
+
+@st.cache_data(max_entries=256, show_spinner=False)
+def cached_thumbnails(version, urls):
+    # Keyed on db.thumbnail_version(), bumped whenever a thumbnail is stored
+    return get_thumbnails(urls)
+
+
+@st.cache_data(max_entries=256, show_spinner=False)
+def cached_price_history(version, listings):
+    return price_history(listings)
+
+
+@st.cache_data(max_entries=4, show_spinner=False)
+def cached_brands(version):
+    return get_brands()
+
+
+@st.cache_resource(max_entries=12, show_spinner=False)
+def cached_export(version, source, fmt):
+    return export(source, fmt)
+
+
+def download_button(label, version, source, fmt, file_name):
+    # The payload is a callable: nothing is generated until the button is
+    # clicked, and a second click on unchanged data reuses the cached bytes.
+    if fmt not in available_formats():
+        return
+    st.download_button(
+        label=label,
+        data=partial(cached_export, version, source, fmt),
+        file_name=file_name,
+        mime=EXPORT_FORMATS[fmt],
+        key=f"download_{source}_{fmt}",
+        on_click="ignore",
+    )
+
+
+# ---------------- SCRAPE RUNNER ----------------
+def launch_runner(command, *args, env=None):
+    subprocess.Popen(
+        [sys.executable, RUNNER, command, "--trigger", "dashboard", *args],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True, env=env,
+    )
+
+
+# ---------------- LISTING QUERIES ----------------
+SORT_LABELS = {
+    "Newest first": "newest",
+    "Oldest first": "oldest",
+    "Price: low to high": "price_asc",
+    "Price: high to low": "price_desc",
+    "Mileage: low to high": "mileage_asc",
+    "Year: newest model": "year_desc",
+    "Best deal first": "deal",
+}
+
+AGE_OPTIONS = {"Any time": None, "Last 24 hours": 1, "Last 7 days": 7, "Last 30 days": 30}
+
+
+def listing_filters(version):
+    st.sidebar.subheader("🔎 Filters")
+    filters = {}
+
+    brand = st.sidebar.selectbox("Brand", ["Any"] + cached_brands(version))
+    if brand != "Any":
+        filters["brand"] = brand
+    model = st.sidebar.text_input("Model starts with")
+    if model:
+        filters["model"] = model
+
+    year_min, year_max = st.sidebar.slider("Year", 1940, 2027, (1940, 2027))
+    if (year_min, year_max) != (1940, 2027):
+        filters["year_min"], filters["year_max"] = year_min, year_max
+
+    price_min = st.sidebar.number_input("Min price ($)", min_value=0, value=0, step=1000)
+    price_max = st.sidebar.number_input("Max price ($)", min_value=0, value=0, step=1000, help="0 = no limit")
+    if price_min:
+        filters["price_min"] = price_min
+    if price_max:
+        filters["price_max"] = price_max
+
+    max_age_days = AGE_OPTIONS[st.sidebar.selectbox("Listed", list(AGE_OPTIONS))]
+    if max_age_days is not None:
+        filters["max_age_days"] = max_age_days
+
+    sort = SORT_LABELS[st.sidebar.selectbox("Sort by", list(SORT_LABELS))]
+    page_size = st.sidebar.selectbox("Cards per page", [10, 20, 50, 100], index=1)
+    return filters, sort, page_size
+
+
+def listing_page(version, key, view, filters, sort, page_size):
+    # Keyset pagination: the session keeps the cursor stack of visited pages
+    # and starts over whenever the filters change.
+    signature = (view, sort, page_size, tuple(sorted(filters.items())))
+    if st.session_state.get(f"{key}_signature") != signature:
+        st.session_state[f"{key}_signature"] = signature
+        st.session_state[f"{key}_cursors"] = [None]
+    cursors = st.session_state[f"{key}_cursors"]
+    return cached_listing_page(version, view, sort, cursors[-1], page_size, tuple(sorted(filters.items())))
+
+
+def page_nav(version, key, view, filters, next_cursor):
+    cursors = st.session_state[f"{key}_cursors"]
+    cols = st.columns([1, 1, 4])
+    cols[0].button("◀ Previous", key=f"{key}_prev", disabled=len(cursors) == 1, on_click=cursors.pop)
+    cols[1].button("Next ▶", key=f"{key}_next", disabled=next_cursor is None,
+                   on_click=cursors.append, args=(next_cursor,))
+    cols[2].caption(f"Page {len(cursors)} · {cached_count(version, view, tuple(sorted(filters.items())))} matching listings")
+# Initialize the database: schema and migrations once per server process,
+# not on every rerun
+@st.cache_resource(show_spinner=False)
+def initialized_db():
+    init_db()
+    return DB_FILE
+
+
+initialized_db()
+
+# ---------------- CARDS ----------------
+# Only the current page of listings is rendered, each card as a single
+# markdown block (no per-field widgets), with images loaded lazily by the
+# browser as they scroll into view. Photos with a cached thumbnail (see
+# thumbnails.py) are served locally instead of from the sites' CDNs.
+PLACEHOLDER_IMAGE = "https://via.placeholder.com/180x120?text=No+Image"
+
+
+def card_images(values):
+    # One image src per row of the page: local thumbnail, remote photo or placeholder
+    first = [next(iter(image_urls(value)), None) for value in values]
+    digests = cached_thumbnails(thumbnail_version(), tuple(first))
+    return [thumbnails.thumbnail_url(digests[url]) if url in digests else url or PLACEHOLDER_IMAGE
+            for url in first]
+
+
+def _text(value):
+    if value is None or value == "" or (not isinstance(value, str) and pd.isna(value)):
+        return "N/A"
+    return escape(str(value))
+
+
+def sparkline_html(prices_cents, width=120, height=24):
+    # Observed prices, oldest first, as an inline SVG line with the first
+    # and last price; empty until the price has changed at least once
+    if len(set(prices_cents)) < 2:
+        return ""
+    low, high = min(prices_cents), max(prices_cents)
+    step = width / (len(prices_cents) - 1)
+    points = " ".join(f"{i * step:.1f},{(high - price) / (high - low) * height:.1f}"
+                      for i, price in enumerate(prices_cents))
+    return (f'<div><b>Price history:</b> <svg width="{width}" height="{height}" '
+            'style="vertical-align:middle;overflow:visible">'
+            f'<polyline points="{points}" fill="none" stroke="currentColor" stroke-width="1.5"/></svg> '
+            f"${prices_cents[0] / 100:,.0f} → ${prices_cents[-1] / 100:,.0f}</div>")
+
+
+def card_html(title, image, fields, notes=(), link=None, history=()):
+    # fields: (label, value) pairs; notes: captions under the details;
+    # history: the listing's observed prices in cents, oldest first
+    rows = "".join(f"<div><b>{escape(label)}:</b> {_text(value)}</div>" for label, value in fields)
+    rows += sparkline_html(history)
+    captions = "".join(f'<div style="opacity:.6;font-size:.85em">{escape(note)}</div>' for note in notes)
+    link = f'<div><a href="{escape(link)}" target="_blank">🔗 View Ad</a></div>' if link else ""
+    return (
+        '<div style="display:flex;gap:1.5rem;align-items:flex-start">'
+        f'<img src="{escape(image)}" loading="lazy" width="180" '
+        'style="border-radius:4px;flex:none">'
+        f'<div><h4 style="margin:0 0 .4rem">{_text(title or "Unknown Vehicle")}</h4>{rows}{captions}{link}</div>'
+        "</div>"
+    )
+
+
+# Search snippets come back with the matches between these control
+# characters, which survive escaping and are then swapped for <mark> tags
+SEARCH_HIGHLIGHT = ("\x02", "\x03")
+
+
+def search_result_html(row):
+    price = row["price_cents"] / 100 if pd.notna(row["price_cents"]) else None
+    details = " · ".join(str(part) for part in (
+        row["source"],
+        f"${price:,.0f}" if price is not None else None,
+        f"{row['mileage_km']:,} km" if pd.notna(row["mileage_km"]) else None,
+    ) if part)
+    snippet = (escape(row["snippet"] or "").replace(SEARCH_HIGHLIGHT[0], "<mark>")
+               .replace(SEARCH_HIGHLIGHT[1], "</mark>"))
+    title = _text(row["title"] or "Unknown Vehicle")
+    if isinstance(row["ad_link"], str) and row["ad_link"]:
+        title = f'<a href="{escape(row["ad_link"])}" target="_blank">{title}</a>'
+    return (f'<div style="margin-bottom:.9rem"><div><b>{title}</b> '
+            f'<span style="opacity:.6;font-size:.85em">{escape(details)}</span></div>'
+            f'<div style="font-size:.9em">{snippet}</div></div>')
+
+
+def show_card(title, image, fields, notes=(), link=None, market_guide=None, history=()):
+    # market_guide: (button label, kwargs for show_market_guide), or None
+    st.markdown(card_html(title, image, fields, notes, link, history), unsafe_allow_html=True)
+    if market_guide:
+        label, kwargs = market_guide
+        if st.button(label):
+            show_market_guide(**kwargs)
+    st.divider()
+
+
+def time_since(date_str):
+    activation = parse_kijiji_date1(date_str)
+    return (datetime.now(timezone.utc) - activation) if activation else None
+
+
+# ---------------- MARKET GUIDE ----------------
+def show_market_guide(token, title, odometer, make=None, price=None, label=None):
+    # Lookups are cached in cars.db (see marketguide.py), so clicking the same
+    # make/model/year/odometer bucket again does not call the API.
+    try:
+        data = market_guide_for_title(title, odometer, token, make=make)
+    except (MarketGuideError, requests.RequestException) as e:
+        st.warning(f"{e}")
+        return
+
+    if price is not None:
+        fig = go.Figure(go.Indicator(
+        mode="gauge+number+delta",
+        value=int(price),
+        title={'text': f" Market Guide Vehicles For {label} "},
+        delta={'reference': int(data['priceAggAve'])},
+        gauge={
+            'axis': {'range': [int(data['priceAggMin']), int(data['priceAggMax'])]},
+            'bar': {'color': 'red'},
+            'steps': [
+                {'range': [int(data['priceAggMin']), int(data['priceAggAve'])], 'color': "lightgreen"},
+                {'range': [data['priceAggAve'], data['priceAggMax']], 'color': "lightcoral"}
+            ],
+            'threshold': {'line': {'color': "black", 'width': 4}, 'value': int(data['priceAggAve'])}
+                }
+            ))
+
+        fig.update_layout(height=300)
+        st.plotly_chart(fig, use_container_width=True)
+
+    st.write(data)
+
 
 # ---------------- SIDEBAR ----------------
 st.sidebar.title("Navigation")
-page = st.sidebar.radio("Go to", ["📊 View Cars", "📝 Add Car"])
+page = st.sidebar.radio("Go to", ["📊 View Cars", "📝 Add Car", "🩺 Diagnostics"])
+render_started = time.perf_counter()
 
 # ---------------- PAGE 1: VIEW ----------------
 if page == "📊 View Cars":
     tokenTitle = st.text_input("Add your token", "enterprise-api.kdp.kardataservices")
+    version = data_version()
+    filters, sort, page_size = listing_filters(version)
+    source_filter = st.sidebar.selectbox("Source (combined view)", ["All", "Kijiji", "Autotrader"])
+    one_per_vehicle = st.sidebar.checkbox("Hide duplicate listings", value=True,
+                                          help="Show the same car listed on both sites (or reposted) once")
+    # Filters of the combined listings: best deals, search and the combined view
+    combined_filters = dict(filters)
+    if source_filter != "All":
+        combined_filters["source"] = source_filter
+    if one_per_vehicle:
+        combined_filters["one_per_vehicle"] = True
+
+    search_text = st.text_input("🔎 Search titles and descriptions",
+                                placeholder="e.g. manual awd, civic si, one owner")
+    if search_text.strip():
+        results = cached_search(version, search_text.strip(), 50, tuple(sorted(combined_filters.items())))
+        if results.empty:
+            st.info("No listings match the search and filters.")
+        else:
+            st.caption(f"{len(results)} best matches" if len(results) == 50 else f"{len(results)} matches")
+            st.markdown("".join(search_result_html(row) for _, row in results.iterrows()),
+                        unsafe_allow_html=True)
+
+    with st.expander("🔥 Best deals", expanded=True):
+        deals = cached_top_deals(version, 20, tuple(sorted(combined_filters.items())))
+        if deals.empty:
+            st.info("No valued listings yet. Run the market guide valuation on the 'Add Car' page.")
+        else:
+            deals["price"] = deals["price_cents"] / 100
+            deals["market avg"] = deals["guide_avg_cents"] / 100
+            deals["deal score"] = deals["deal_score"] * 100
+            st.dataframe(
+                deals[["source", "title", "price", "market avg", "deal score", "mileage_km", "ad_link"]],
+                column_config={
+                    "price": st.column_config.NumberColumn(format="$%d"),
+                    "market avg": st.column_config.NumberColumn(format="$%d"),
+                    "deal score": st.column_config.NumberColumn(format="%.1f%%", help="% under the market average, mileage-adjusted"),
+                    "ad_link": st.column_config.LinkColumn("ad"),
+                },
+                hide_index=True, use_container_width=True,
+            )
+
+    with st.expander("📉 Price drops"):
+        drop_days = st.selectbox("Cut in the last", [1, 7, 30, 365], index=1, format_func=lambda d: f"{d} days")
+        since_ts = int(time.time() // 3600 * 3600) - drop_days * 86400   # hour-aligned, so the cache is reused
+        drops = cached_price_drops(version, since_ts, 50)
+        if drops.empty:
+            st.info("No price cuts seen yet. Listings are re-checked on every scrape.")
+        else:
+            drops["was"] = drops["previous_cents"] / 100
+            drops["now"] = drops["price_cents"] / 100
+            drops["cut"] = drops["drop_ratio"] * 100
+            drops["seen"] = pd.to_datetime(drops["dropped_ts"], unit="s")
+            st.dataframe(
+                drops[["source", "title", "was", "now", "cut", "seen", "ad_link"]],
+                column_config={
+                    "was": st.column_config.NumberColumn(format="$%d"),
+                    "now": st.column_config.NumberColumn(format="$%d"),
+                    "cut": st.column_config.NumberColumn(format="%.1f%%"),
+                    "ad_link": st.column_config.LinkColumn("ad"),
+                },
+                hide_index=True, use_container_width=True,
+            )
+        st.caption("Days on market by model (listed to last seen)")
+        st.dataframe(cached_time_on_market(version).head(50), hide_index=True, use_container_width=True)
+
     st.title("🚗 Autotrader Car Listings")
     with st.expander("See Autotrader explanation"):
-        df = get_all_autotrader_cars()
+        df, next_cursor = listing_page(version, "autotrader", "Autotrader", filters, sort, page_size)
 
         if df.empty:
             st.info("No cars found. Add new cars using the 'Add Car' page.")
         else:
             # Show DataFrame
             st.dataframe(df, use_container_width=True)
+            page_nav(version, "autotrader", "Autotrader", filters, next_cursor)
 
             # Card-style display
-            for _, row in df.iterrows():
-                with st.container():
-                    cols = st.columns([1, 3])
-                    with cols[0]:
-                        if row['image_src'] != 'N/A':
-                            st.image(row['image_src'], width=180)
-                    with cols[1]:
-                        st.subheader(row['title'])
-                        
-                        
-
-                        brands = ['AM General','Acura','Alfa Romeo','American Motors (AMC)','Aston Martin','Audi','BMW','Bentley','BrightDrop','Buick','Cadillac','Chevrolet','Chrysler','Daewoo','Datsun','Dodge','Ducati','Eagle','FIAT','Ferrari','Fiat','Fisker','Ford','Freightliner','GMC','Genesis','Geo','HUMMER','Harley-Davidson','Hino','Honda','Hyundai','INEOS','INFINITI','Indian','International','Isuzu','Jaguar','Jeep','KTM','Karma','Kawasaki','Kenworth','Kia','Lamborghini','Land Rover','Lexus','Lincoln','Lordstown','Lotus','Lucid','MINI','MV-1','Mack','Maserati','Maybach','Mazda','McLaren','Mercedes-Benz','Mercury','Merkur','Mitsubishi','Moto Guzzi','Nissan','Oldsmobile','Panoz','Peterbilt','Peugeot','Plymouth','Polestar','Pontiac','Porsche','Ram','Renault','Rivian','Rolls-Royce','Saab','Saturn','Scion','Smart','Sterling','Subaru','Suzuki','Tesla','Toyota','Triumph','VPG','Victory','VinFast','Volkswagen','Volvo','Western Star','Yamaha','Yugo','Zero','smart']
-                        matches = [brand for brand in brands if brand.lower() in row['title'].lower()]
-                        if tokenTitle:
-                            match = re.search(r'Authorization:\s*Bearer\s+([A-Za-z0-9\-\._]+)', tokenTitle)
-                            if match:
-                                token = match.group(1)
-                                print("====================")
-                                print(token)
-                                
-                                if st.button(f"{row['id']} - get market guide - {row['title'].lower()}"):
-                                    
-                                
-                                    headers = {
-                                        'Host': 'enterprise-api.kdp.kardataservices.com',
-                                        'Sec-Ch-Ua-Platform': '"Windows"',
-                                        'Authorization': f'Bearer {token}',
-                                        'Accept-Language': 'en-US,en;q=0.9',
-                                        'Sec-Ch-Ua': '"Chromium";v="141", "Not?A_Brand";v="8"',
-                                        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/141.0.0.0 Safari/537.36',
-                                        'Sec-Ch-Ua-Mobile': '?0',
-                                        'Accept': '*/*',
-                                        'Origin': 'https://app.openlane.ca',
-                                        'Sec-Fetch-Site': 'cross-site',
-                                        'Sec-Fetch-Mode': 'cors',
-                                        'Sec-Fetch-Dest': 'empty',
-                                        'Referer': 'https://app.openlane.ca/',
-                                        # 'Accept-Encoding': 'gzip, deflate, br',
-                                        'Priority': 'u=1, i',
-                                    }
-
-                                    params = {
-                                        'yearMin': '1940',
-                                        'yearMax': '2027',
-                                        'makeNames': f'{str(matches[0])}',
-                                    }
-
-                                    marketresponse = requests.get(
-                                        'https://enterprise-api.kdp.kardataservices.com/vehicle-retail-data/marketguide/models',
-                                        params=params,
-                                        headers=headers,
-                                        verify=False,
-                                    )
-
-
-                                    mdata = json.loads(marketresponse.text)['modelNames']
-                                    model = [brand for brand in mdata if brand.lower() in row['title'].lower()][0]
-
-                                    years = re.findall(r'\b(?:19|20)\d{2}\b', row['title'].lower())
-                                    if years:
-                                        year = str(int(years[0])-1)
-                                        
-                                        odometerMax = re.search(r'[\d,]+', row['odometer'])
-                                        if odometerMax:
-                                            num_int = int(odometerMax.group(0).replace(',', '')) + 5000
-                                        params = {
-                                            'teamId': 'ompProd',
-                                            'makeNames': f'{str(matches[0])}',
-                                            'modelNames': f'{str(model)}',
-                                            'yearMin': f'{year}',
-                                            'yearMax': '2027',
-                                            'odometerMin': '0',
-                                            'odometerMax': f'{str(num_int)}',
-                                            'saleDateFrom': '2025-08-02',
-                                            'saleDateTo': '2025-10-31',
-                                            'sortBy': 'sale_date',
-                                            'sortOrder': 'desc',
-                                            'page': '0',
-                                            'size': '10',
-                                            'countryCode': 'CA',
-                                            'organizationId': 'a10514a4-a594-4736-bcc8-3978ec88145a',
-                                        }
-
-                                        finalresponse = requests.get(
-                                            'https://enterprise-api.kdp.kardataservices.com/vehicle-retail-data/marketguide',
-                                            params=params,
-                                            headers=headers,
-                                            verify=False,
-                                        )
-                                        data = json.loads(finalresponse.text)
-                                        del data['marketGuideVehicles']
-                                        st.write(data)
-                            else:
-                                st.write(f"no token !!!")
-                            
-                        else:
-                            st.write(f"no token !!!")
-
-
-
-
-                        st.write(f"**Price:** {row['price']}")
-                        st.write(f"**Location:** {row['location']}")
-                        st.write(f"**Odometer:** {row['odometer']}")
-                        st.caption(f"🕒 Added on: {row['created_at']}")
-                        st.markdown(f"[🔗 View Ad]({row['ad_link']})", unsafe_allow_html=True)
-                    st.divider()
-
-            # Download CSV
-
-            excel_data = to_excel_bytes(df)
-            st.download_button(
-                label="📊 Download autotreader Excel",
-                data=excel_data,
-                file_name="autotreader.xlsx",
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-            )
-
+            makes = MAKE_MATCHER.extract(df['title'])
+            images = card_images(df['image_src'])
+            history = cached_price_history(version, tuple(("Autotrader", int(i)) for i in df['id']))
+            token = parse_token(tokenTitle) if tokenTitle else None
+            if not token:
+                st.write(f"no token !!!")
+            for idx, row in df.iterrows():
+                market_guide = None
+                if token:
+                    market_guide = (f"{row['id']} - get market guide - {row['title'].lower()}",
+                                    dict(token=token, title=row['title'], odometer=row['odometer'], make=makes[idx]))
+                show_card(
+                    row['title'], images[idx],
+                    [("Price", row['price']), ("Location", row['location']), ("Odometer", row['odometer'])],
+                    notes=[f"🕒 Added on: {row['created_at']}"], link=row['ad_link'], market_guide=market_guide,
+                    history=history[("Autotrader", int(row['id']))],
+                )
 
-            csv = df.to_csv(index=False).encode("utf-8")
-            st.download_button(
-                "📥 Download CSV",
-                data=csv,
-                file_name="cars.csv",
-                mime="text/csv",
-            )
+            # Downloads
+            download_button("📊 Download autotreader Excel", version, "Autotrader", "xlsx", "autotreader.xlsx")
+            download_button("📥 Download CSV", version, "Autotrader", "csv", "cars.csv")
+            download_button("🗃️ Download Parquet", version, "Autotrader", "parquet", "autotreader.parquet")
     with st.expander("See Kijiji Vehicles"):
-        kdf = get_all_kijiji_cars()
+        kdf, next_cursor = listing_page(version, "kijiji", "Kijiji", filters, sort, page_size)
 
         if kdf.empty:
             st.info("🚗 No Kijiji cars found. Add new cars or scrape data first.")
         else:
             # Display DataFrame overview
             st.dataframe(kdf, use_container_width=True)
+            page_nav(version, "kijiji", "Kijiji", filters, next_cursor)
 
             # Card-style view
-            for _, row in kdf.iterrows():
-                with st.container():
-                    cols = st.columns([1, 3])
-
-                    # Left column — image
-                    with cols[0]:
-                        if row["image"]:
-                            try:
-                                # Try to parse as a Python list
-                                parsed = ast.literal_eval(row["image"])
-                                if isinstance(parsed, list) and parsed:
-                                    first_image = parsed[0]   # ✅ first URL in list
-                                elif isinstance(parsed, str) and parsed.startswith("http"):
-                                    first_image = parsed
-                            except Exception:
-                                # Fallback: sometimes it's already a URL string
-                                if isinstance(row["image"], str) and row["image"].startswith("http"):
-                                    first_image = row["image"]
-                        
-                            st.image(first_image, width=180)
-                            activation = parse_kijiji_date1(row['activationDate'] )
-                            now = datetime.now(timezone.utc)
-                            time_since_activation = (now - activation) if activation else None
-                            st.write(f" { time_since_activation or 'N/A'} ⏱️")
-                        else:
-                            st.image("https://via.placeholder.com/180x120?text=No+Image", width=180)
-                            activation = parse_kijiji_date1(row['activationDate'] )
-                            now = datetime.now(timezone.utc)
-                            time_since_activation = (now - activation) if activation else None
-                            st.write(f" { time_since_activation or 'N/A'} ⏱️")
-
-
-
-                    # Right column — vehicle details
-                    with cols[1]:
-                        st.subheader(row["name"] or "Unknown Vehicle")
-
-
-
-                        brands = ['AM General','Acura','Alfa Romeo','American Motors (AMC)','Aston Martin','Audi','BMW','Bentley','BrightDrop','Buick','Cadillac','Chevrolet','Chrysler','Daewoo','Datsun','Dodge','Ducati','Eagle','FIAT','Ferrari','Fiat','Fisker','Ford','Freightliner','GMC','Genesis','Geo','HUMMER','Harley-Davidson','Hino','Honda','Hyundai','INEOS','INFINITI','Indian','International','Isuzu','Jaguar','Jeep','KTM','Karma','Kawasaki','Kenworth','Kia','Lamborghini','Land Rover','Lexus','Lincoln','Lordstown','Lotus','Lucid','MINI','MV-1','Mack','Maserati','Maybach','Mazda','McLaren','Mercedes-Benz','Mercury','Merkur','Mitsubishi','Moto Guzzi','Nissan','Oldsmobile','Panoz','Peterbilt','Peugeot','Plymouth','Polestar','Pontiac','Porsche','Ram','Renault','Rivian','Rolls-Royce','Saab','Saturn','Scion','Smart','Sterling','Subaru','Suzuki','Tesla','Toyota','Triumph','VPG','Victory','VinFast','Volkswagen','Volvo','Western Star','Yamaha','Yugo','Zero','smart']
-                        matches = [brand for brand in brands if brand.lower() in row['name'].lower()]
-                        if tokenTitle:
-                            match = re.search(r'Authorization:\s*Bearer\s+([A-Za-z0-9\-\._]+)', tokenTitle)
-                            if match:
-                                token = match.group(1)
-                                print("====================")
-                                print(token)
-                                
-                                if st.button(f"{row['id']} - get market guide - {row['name'].lower()}"):
-                                    
-                                
-                                    headers = {
-                                        'Host': 'enterprise-api.kdp.kardataservices.com',
-                                        'Sec-Ch-Ua-Platform': '"Windows"',
-                                        'Authorization': f'Bearer {token}',
-                                        'Accept-Language': 'en-US,en;q=0.9',
-                                        'Sec-Ch-Ua': '"Chromium";v="141", "Not?A_Brand";v="8"',
-                                        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/141.0.0.0 Safari/537.36',
-                                        'Sec-Ch-Ua-Mobile': '?0',
-                                        'Accept': '*/*',
-                                        'Origin': 'https://app.openlane.ca',
-                                        'Sec-Fetch-Site': 'cross-site',
-                                        'Sec-Fetch-Mode': 'cors',
-                                        'Sec-Fetch-Dest': 'empty',
-                                        'Referer': 'https://app.openlane.ca/',
-                                        # 'Accept-Encoding': 'gzip, deflate, br',
-                                        'Priority': 'u=1, i',
-                                    }
-
-                                    params = {
-                                        'yearMin': '1940',
-                                        'yearMax': '2027',
-                                        'makeNames': f'{str(matches[0])}',
-                                    }
-
-                                    marketresponse = requests.get(
-                                        'https://enterprise-api.kdp.kardataservices.com/vehicle-retail-data/marketguide/models',
-                                        params=params,
-                                        headers=headers,
-                                        verify=False,
-                                    )
-
-
-                                    mdata = json.loads(marketresponse.text)['modelNames']
-                                    
-                                    model = [brand for brand in mdata if brand.lower() in row['name'].lower()]
-                                    if model:
-
-                                        years = re.findall(r'\b(?:19|20)\d{2}\b', row['name'].lower())
-                                        if years:
-                                            year = str(int(years[0])-1)
-                                            
-                                            odometerMax = re.search(r'[\d,]+', row['mileage_value'])
-                                            if odometerMax:
-                                                num_int = int(odometerMax.group(0).replace(',', '')) + 5000
-                                            params = {
-                                                'teamId': 'ompProd',
-                                                'makeNames': f'{str(matches[0])}',
-                                                'modelNames': f'{str(model[0])}',
-                                                'yearMin': f'{year}',
-                                                'yearMax': '2027',
-                                                'odometerMin': '0',
-                                                'odometerMax': f'{str(num_int)}',
-                                                'saleDateFrom': '2025-08-02',
-                                                'saleDateTo': '2025-10-31',
-                                                'sortBy': 'sale_date',
-                                                'sortOrder': 'desc',
-                                                'page': '0',
-                                                'size': '10',
-                                                'countryCode': 'CA',
-                                                'organizationId': 'a10514a4-a594-4736-bcc8-3978ec88145a',
-                                            }
-
-                                            finalresponse = requests.get(
-                                                'https://enterprise-api.kdp.kardataservices.com/vehicle-retail-data/marketguide',
-                                                params=params,
-                                                headers=headers,
-                                                verify=False,
-                                            )
-                                            data = json.loads(finalresponse.text)
-                                            del data['marketGuideVehicles']
-                                            ############################################################
-                                            ############################################################
-                                            ############################################################
-                                            ########################################################################################################################
-                                            
-                                            ############################################################
-                                            ############################################################
-                                            ############################################################
-                                            ############################################################
-                                            ############################################################
-                                            
-                                            fig = go.Figure(go.Indicator(
-                                            mode="gauge+number+delta",
-                                            value=int(row['price']),
-                                            title={'text': f" Market Guide Vehicles For {row['model']} "},
-                                            delta={'reference': int(data['priceAggAve'])},
-                                            gauge={
-                                                'axis': {'range': [int(data['priceAggMin']), int(data['priceAggMax'])]},
-                                                'bar': {'color': 'red'},
-                                                'steps': [
-                                                    {'range': [int(data['priceAggMin']), int(data['priceAggAve'])], 'color': "lightgreen"},
-                                                    {'range': [data['priceAggAve'], data['priceAggMax']], 'color': "lightcoral"}
-                                                ],
-                                                'threshold': {'line': {'color': "black", 'width': 4}, 'value': int(data['priceAggAve'])}
-                                                    }
-                                                ))
-
-                                            fig.update_layout(height=300)
-                                            st.plotly_chart(fig, use_container_width=True)
-                                        
-                                            st.write(data)
-                                        else:
-                                            st.warning(f"no year matched !!!")
-                                    else:
-                                            st.warning(f"no model matched !!!")
-                                
-                                
-                            else:
-                                st.write(f"no token !!!")
-
-
-
-
-
-
-                        st.write(f"**Type:** {row['type'] or 'N/A'}")
-                        st.write(f"**Model:** {row['model'] or 'N/A'} ({row['vehicleModelDate'] or 'N/A'})")
-                        st.write(f"**Price:** {row['price'] or 'N/A'} {row['priceCurrency'] or ''}")
-                        st.write(f"**Brand:** {row['brand_name'] or 'N/A'}")
-                        st.write(f"**Body Type:** {row['bodyType'] or 'N/A'}")
-                        st.write(f"**Color:** {row['color'] or 'N/A'}")
-                        st.write(f"**Fuel Type:** {row['fuelType'] or 'N/A'}")
-                        st.write(f"**Transmission:** {row['vehicleTransmission'] or 'N/A'}")
-
-                        st.markdown("---")
-                        
-                        st.write(f"**Mileage:** {row['mileage_value'] or 'N/A'} {row['mileage_unitCode'] or ''}")
-                        st.write(f"**Doors:** {row['numberOfDoors'] or 'N/A'}")
-                        st.caption(f"🕒 Added on: {row['created_at']}")
-
-                        if row["url"]:
-                            st.markdown(f"[🔗 View Ad]({row['url']})", unsafe_allow_html=True)
-
-                    st.divider()
+            makes = MAKE_MATCHER.extract(kdf['name'])
+            images = card_images(kdf['image'])
+            history = cached_price_history(version, tuple(("Kijiji", int(i)) for i in kdf['id']))
+            token = parse_token(tokenTitle) if tokenTitle else None
+            if not token:
+                st.write(f"no token !!!")
+            for idx, row in kdf.iterrows():
+                market_guide = None
+                if token:
+                    market_guide = (f"{row['id']} - get market guide - {row['name'].lower()}",
+                                    dict(token=token, title=row['name'], odometer=row['mileage_value'], make=makes[idx],
+                                         price=row['price_cents'] / 100 if pd.notna(row['price_cents']) else None,
+                                         label=row['model']))
+                show_card(
+                    row["name"], images[idx],
+                    [
+                        ("Type", row['type']),
+                        ("Model", f"{row['model'] or 'N/A'} ({row['vehicleModelDate'] or 'N/A'})"),
+                        ("Price", f"{row['price'] or 'N/A'} {row['priceCurrency'] or ''}"),
+                        ("Brand", row['brand_name']),
+                        ("Body Type", row['bodyType']),
+                        ("Color", row['color']),
+                        ("Fuel Type", row['fuelType']),
+                        ("Transmission", row['vehicleTransmission']),
+                        ("Mileage", f"{row['mileage_value'] or 'N/A'} {row['mileage_unitCode'] or ''}"),
+                        ("Doors", row['numberOfDoors']),
+                    ],
+                    notes=[f"⏱️ {time_since(row['activationDate']) or 'N/A'}", f"🕒 Added on: {row['created_at']}"],
+                    link=row["url"], market_guide=market_guide, history=history[("Kijiji", int(row['id']))],
+                )
 
             # --- Download button ---
-            excel_data = to_excel_bytes(kdf)
-            st.download_button(
-                label="📊 Download kjiji Excel",
-                data=excel_data,
-                file_name="kijiji_cars.xlsx",
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-            )
-
-            csv = kdf.to_csv(index=False).encode("utf-8")
-            st.download_button(
-                "📥 Download All Cars (CSV)",
-                data=csv,
-                file_name="kijiji_cars.csv",
-                mime="text/csv",
-            )       
+            download_button("📊 Download kjiji Excel", version, "Kijiji", "xlsx", "kijiji_cars.xlsx")
+            download_button("📥 Download All Cars (CSV)", version, "Kijiji", "csv", "kijiji_cars.csv")
+            download_button("🗃️ Download Parquet", version, "Kijiji", "parquet", "kijiji_cars.parquet")
     with st.expander("🧩 Combined View: Kijiji + Autotrader"):
-        merged_df = merge_car_data()
+        merged_df, next_cursor = listing_page(version, "combined", None, combined_filters, sort, page_size)
 
         if merged_df.empty:
             st.info("No cars found in either table.")
         else:
             st.dataframe(merged_df, use_container_width=True)
+            page_nav(version, "combined", None, combined_filters, next_cursor)
 
             # Card-style display
-            for _, row in merged_df.iterrows():
-                with st.container():
-                    cols = st.columns([1, 3])
-                    with cols[0]:
-                        if row["image_src"]:
-                            try:
-                                # Try to parse as a Python list
-                                parsed = ast.literal_eval(row["image_src"])
-                                if isinstance(parsed, list) and parsed:
-                                    first_image = parsed[0]   # ✅ first URL in list
-                                elif isinstance(parsed, str) and parsed.startswith("http"):
-                                    first_image = parsed
-                            except Exception:
-                                # Fallback: sometimes it's already a URL string
-                                if isinstance(row["image_src"], str) and row["image_src"].startswith("http"):
-                                    first_image = row["image_src"]
-                    
-                            st.image(first_image, width=180)
-                        else:
-                            st.image("https://via.placeholder.com/180x120?text=No+Image", width=180)
-                    with cols[1]:
-                        st.subheader(row["title"] or "Unknown Vehicle")
-                        st.caption(f"📦 Source: {row['source']}")
-                        st.write(f"**Price:** {row['price'] or 'N/A'} {row['currency'] or ''}")
-                        st.write(f"**Brand:** {row['brand'] or 'N/A'}")
-                        st.write(f"**Model:** {row['model'] or 'N/A'} ({row['vehicleModelDate'] or 'N/A'})")
-                        st.write(f"**Body Type:** {row['bodyType'] or 'N/A'}")
-                        st.write(f"**Color:** {row['color'] or 'N/A'}")
-                        st.write(f"**Fuel Type:** {row['fuelType'] or 'N/A'}")
-                        st.write(f"**Transmission:** {row['vehicleTransmission'] or 'N/A'}")
-                        st.write(f"**Odometer:** {row['odometer'] or 'N/A'}")
-                        st.caption(f"🕒 Added on: {row['created_at']}")
-                        if row["ad_link"]:
-                            st.markdown(f"[🔗 View Ad]({row['ad_link']})", unsafe_allow_html=True)
-                    st.divider()
+            images = card_images(merged_df['image_src'])
+            history = cached_price_history(version, tuple((str(source), int(i)) for source, i in
+                                                        zip(merged_df['source'], merged_df['id'])))
+            for idx, row in merged_df.iterrows():
+                show_card(
+                    row["title"], images[idx],
+                    [
+                        ("Price", f"{row['price'] or 'N/A'} {row['currency'] or ''}"),
+                        ("Brand", row['brand']),
+                        ("Model", f"{row['model'] or 'N/A'} ({row['vehicleModelDate'] or 'N/A'})"),
+                        ("Body Type", row['bodyType']),
+                        ("Color", row['color']),
+                        ("Fuel Type", row['fuelType']),
+                        ("Transmission", row['vehicleTransmission']),
+                        ("Odometer", row['odometer']),
+                    ],
+                    notes=[f"📦 Source: {row['source']}", f"🕒 Added on: {row['created_at']}"],
+                    link=row["ad_link"], history=history[(str(row['source']), int(row['id']))],
+                )
 
             # Excel Download
-            excel_data = to_excel_bytes(merged_df)
-            st.download_button(
-                label="📊 Download Combined Excel",
-                data=excel_data,
-                file_name="merged_cars.xlsx",
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-            )
+            download_button("📊 Download Combined Excel", version, "Combined", "xlsx", "merged_cars.xlsx")
+            download_button("📥 Download Combined CSV", version, "Combined", "csv", "merged_cars.csv")
+            download_button("🗃️ Download Combined Parquet", version, "Combined", "parquet", "merged_cars.parquet")
 # ---------------- PAGE 2: ADD ----------------
 elif page == "📝 Add Car":
     st.title("📝 Add New Car Listing")
 
+    with st.expander("⚙️ Scrape settings"):
+        incremental = st.checkbox("Incremental (stop at listings already stored)", value=True)
+        scrape_pages = st.number_input("Max pages per search" if incremental else "Pages per search",
+                                       min_value=1, max_value=50, value=10 if incremental else 1)
+        kijiji_regions = st.multiselect("Kijiji regions", list(kijiji.REGIONS), default=["ontario"])
+        kijiji_concurrency = st.slider("Kijiji concurrent requests", 1, 16, 4)
+        kijiji_rate = st.slider("Kijiji max requests per second (per host)", 0.5, 10.0, 2.0, step=0.5)
+        autotrader_centers = st.multiselect(
+            "Autotrader sweep centers", list(autotrader.CENTERS),
+            help="Empty: the single London, ON search. Otherwise every price and year band is searched "
+                 "around each center, so far more than one page of listings is reached.")
+        sweep_concurrency = st.slider("Autotrader sweep concurrent requests", 1, 16, 4,
+                                      disabled=not autotrader_centers)
+        sweep_rate = st.slider("Autotrader sweep max requests per second", 0.5, 10.0, 1.0, step=0.5,
+                               disabled=not autotrader_centers)
+
+    with st.expander("💰 Market guide valuation"):
+        st.caption("Looks up the market guide once per make / model / year / mileage band and stores "
+                   "the sale-price range on every listing.")
+        valuation_token = st.text_input("Market guide token", type="password",
+                                        help="The bearer token, or the copied 'Authorization: Bearer ...' header")
+        valuation_concurrency = st.slider("Concurrent market guide requests", 1, 8, 4)
+        revalue = st.checkbox("Re-value listings already valued", value=False)
+        ValueSubmitted = st.button("Value listings", disabled=not valuation_token)
+
+    with st.expander("🖼️ Thumbnails"):
+        st.caption("Downloads the first photo of every listing once, downsized, so the cards load it "
+                   "from this server instead of the listing sites.")
+        ThumbnailsSubmitted = st.button("Fetch thumbnails", disabled=not thumbnails.available())
+
     AutotraderSubmitted = st.button("Updata Autotrader Car")
     KjijiSubmitted = st.button("Updata Kjiji Car")
     clear = st.button("reset all data (clear all)")
     if clear:
-        clear_all_data(DB_FILE)
-        st.success("✅ Reset Done! ")
+        try:
+            clear_all_data(DB_FILE)
+            st.success("✅ Reset Done! ")
+        except sqlite3.Error as e:
+            st.error(f"❌ Reset failed, no data was deleted: {e}")
+    # The dashboard never scrapes in its own process: the buttons start
+    # runner.py, which records progress in scrape_runs for the panel below.
+    scrape_args = ["--pages", str(scrape_pages)] + ([] if incremental else ["--full"])
     if KjijiSubmitted:
-
-        cookies = {
-            'kjses': 'a3ada55c-3dda-4d3b-a2f1-5a2dc3e6d11e^MSym5/LO9nctRVl8JS0kFA==',
-            'machId': '22fb321cba3b00c1b9e5ec088612772657052a66147091639177d4bb1d9b30c7619ed61ccc0c45ded10273971642021362cab9ba47cc83305e4d338bf26682f3',
-            'up': '%7B%22ln%22%3A%22725948023%22%2C%22ls%22%3A%22sv%3DLIST%26sf%3DdateDesc%22%7D',
-        }
-
-        headers = {
-            'Host': 'www.kijiji.ca',
-            'Cache-Control': 'max-age=0',
-            'Sec-Ch-Ua': '"Chromium";v="139", "Not;A=Brand";v="99"',
-            'Sec-Ch-Ua-Mobile': '?0',
-            'Sec-Ch-Ua-Platform': '"Windows"',
-            'Accept-Language': 'en-US,en;q=0.9',
-            'Upgrade-Insecure-Requests': '1',
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/139.0.0.0 Safari/537.36',
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7',
-            'Sec-Fetch-Site': 'none',
-            'Sec-Fetch-Mode': 'navigate',
-            'Sec-Fetch-User': '?1',
-            'Sec-Fetch-Dest': 'document',
-            # 'Accept-Encoding': 'gzip, deflate, br',
-            'Priority': 'u=0, i',
-            # 'Cookie': 'kjses=a3ada55c-3dda-4d3b-a2f1-5a2dc3e6d11e^MSym5/LO9nctRVl8JS0kFA==; machId=22fb321cba3b00c1b9e5ec088612772657052a66147091639177d4bb1d9b30c7619ed61ccc0c45ded10273971642021362cab9ba47cc83305e4d338bf26682f3; up=%7B%22ln%22%3A%22725948023%22%2C%22ls%22%3A%22sv%3DLIST%26sf%3DdateDesc%22%7D',
-        }
-
-        params = {
-            'for-sale-by': 'ownr',
-            'price': '0__',
-            'view': 'list',
-        }
-        flagKjiji = False
-        kresponse = requests.get(
-            'https://www.kijiji.ca/b-cars-trucks/ontario/c174l9004',
-            params=params,
-            cookies=cookies,
-            headers=headers,
-            verify=False,
-        )
-        if kresponse.status_code != 200:
-            st.warning("⚠️ Attempt failed. Retrying in 60 seconds...")
-
-            time.sleep(60)
-            for attempt in range(3):
-                kresponse = requests.get(
-                    'https://www.kijiji.ca/b-cars-trucks/ontario/c174l9004',
-                    params=params,
-                    cookies=cookies,
-                    headers=headers,
-                    verify=False,
-                )
-                if kresponse.status_code == 200:
-                    st.success("✅ Done! Kijiji Cars successfully connected in the api.")
-                    flagKjiji = True
-                    break
-                st.warning(f"⚠️ Attempt failed {attempt + 1}. Retrying in 60 seconds...")
-                
-                time.sleep(60)
-        else:
-            flagKjiji = True
-            st.success("✅ Done! Kijiji Cars successfully connected in the api.")
-        
-        if flagKjiji == True:
-           
-            html = kresponse.text
-
-            
-            match = re.search(r'<script[^>]+type="application/json"[^>]*>(.*?)</script>', html, re.DOTALL)
-            if match:
-                json_text = match.group(1).strip()
-                json_text = json_text.replace('&quot;', '"').replace('&amp;', '&')
-                data = json.loads(json_text)
-            else:
-                raise Exception("Could not find embedded JSON")
-
-            # Recursive search for "AutosListing:"
-            def find_autos_listings(obj):
-                results = {}
-                if isinstance(obj, dict):
-                    for k, v in obj.items():
-                        if k.startswith("AutosListing:"):
-                            results[k] = v
-                        else:
-                            results.update(find_autos_listings(v))
-                elif isinstance(obj, list):
-                    for item in obj:
-                        results.update(find_autos_listings(item))
-                return results
-
-            listings = find_autos_listings(data)
-          
-            st.success(f"Found {len(listings)} listings")
-            # Parse ISO date
-            def parse_kijiji_date(date_str):
-                if not date_str:
-                    return None
-                try:
-                    return datetime.strptime(date_str, "%Y-%m-%dT%H:%M:%S.%fZ").replace(tzinfo=timezone.utc)
-                except ValueError:
-                    return datetime.strptime(date_str, "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=timezone.utc)
-
-            # Current UTC time
-            now = datetime.now(timezone.utc)
-
-            # Collect all listings
-            all_listings = []
-            for key, listing in listings.items():
-                attributes = listing.get("attributes", {}).get("all", [])
-
-                def get_attr(name):
-                    for attr in attributes:
-                        if attr.get("canonicalName") == name:
-                            return attr.get("canonicalValues", [None])[0]
-                    return None
-
-                activation = parse_kijiji_date(listing.get("activationDate"))
-                sorting = parse_kijiji_date(listing.get("sortingDate"))
-
-                # Calculate time since activation and difference between sorting and activation
-                time_since_activation = (now - activation) if activation else None
-                sorting_diff = (sorting - activation) if (sorting and activation) else None
-
-                all_listings.append({
-                    "type": listing.get("__typename"),
-                    "name": listing.get("title"),
-                    "Description": listing.get("description"),
-                    "image": listing.get("imageUrls", [None]),
-                    "price": listing.get("price", {}).get("amount"),
-                    "priceCurrency": "CAD",
-                    "url": listing.get("url"),
-                    "brand_name": get_attr("carmake"),
-                    "mileage_value": get_attr("carmileageinkms"),
-                    "mileage_unitCode": "KMT",
-                    "model": get_attr("carmodel"),
-                    "vehicleModelDate": get_attr("caryear"),
-                    "bodyType": get_attr("carbodytype"),
-                    "color": get_attr("carcolor"),
-                    "numberOfDoors": get_attr("noofdoors"),
-                    "fuelType": get_attr("carfueltype"),
-                    "vehicleTransmission": get_attr("cartransmission"),
-                    "activationDate": activation.isoformat() if activation else None,
-                    "sortingDate": sorting.isoformat() if sorting else None,
-                    "time_since_activation": str(time_since_activation) if time_since_activation else None,
-                    "activation_to_sorting_diff": str(sorting_diff) if sorting_diff else None
-                })
-
-            # Sort by activationDate (newest first)
-            sorted_listings = sorted(all_listings, key=lambda x: x["activationDate"] or datetime.min, reverse=True)
-
-            for listing in sorted_listings:
-                insert_car_kijiji(listing)
-
-            st.success("✅ Done! Kjiji Cars successfully added to the database.")
-
-
-
-
+        launch_runner("once", "--sources", "kijiji", *scrape_args, "--regions", *kijiji_regions,
+                      "--concurrency", str(kijiji_concurrency), "--rate", str(kijiji_rate))
     if AutotraderSubmitted:
-   
-
-        cookies = {
-            'as24Visitor': 'c3c760d9-0878-408d-a19b-2180d1931375',
-            'ab_test_lp': '%7B%22abTest740ComparisonFeature%22%3A%22abtest-740_variation_a%22%7D',
-            'visid_incap_820541': 'PKiQE+rTTnqperHoTPBa4tLDEWkAAAAAQUIPAAAAAADlg8tQIlw7MRuZnv64x+pW',
-            'nlbi_820541_3122371': '5Qbyek4Vd00I5av4pRL4bAAAAAA9PPLlUlcN+ZpBnL9/m2b9',
-            'incap_ses_1776_820541': 'uW+LcvEvkjXjMEPdFJ+lGNPDEWkAAAAAlBI2pxFRiGU/kcvWgd8hPg==',
-            'nlbi_820541_3120041': 'pmRoSFKMVAJRVvvOpRL4bAAAAADfZdw2B4NIGxW0/vooNruv',
-            'nlbi_820541_3127200': '1mNKGNNWJya6qtEdpRL4bAAAAABvgkYRJ8QHpATlKN0ZRp6c',
-            'culture': 'en-CA',
-            'fallback-zip': '%7B%22label%22%3A%22N5X0E2%20London%2C%20ON%22%2C%22lat%22%3A43.029117584228516%2C%22lon%22%3A-81.26272583007812%7D',
-            'nlbi_820541_3163786': 'jHOsYtqQaQfhsKOFpRL4bAAAAADh1E3Y04D6Lc6xys2DCcl6',
-            'as24-gtmSearchCrit': '0010001-0020000:cc|cy|rn|cu',
-            'at_as24_site_exp': 'onemp',
-            '_cq_duid': '1.1762771930.cdR0NwW6AZPpu8aK',
-            '_cq_suid': '1.1762771930.MoGQGNTaKdpzGwnI',
-            '_gcl_au': '1.1.1886041771.1762771930',
-            '_ga': 'GA1.1.83325848.1762771931',
-            'FPID': 'FPID2.2.2IqdjODDjA3wGmtH4ZCNeesz9Gjk23y%2FPi3uMiuMmoI%3D.1762771931',
-            'FPLC': 'AW%2FNnyvZubMKO1%2FcghoA01cRyrAQ8iyffLogr3pk6IX%2B%2BV7rkhW5%2B7MA3AcRI7CI9lOyOaI1Xd3icyFAuEH%2B2PqS%2FbE4A9vJH%2B%2FR6OesPvOLJKnb21uz8YHqc%2F4pcA%3D%3D',
-            'FPAU': '1.1.1886041771.1762771930',
-            '_gtmeec': 'e30%3D',
-            '_fbp': 'fb.1.1762771930982.1774960817',
-            'nlbi_820541_3156894': 'cK7GZnlkmFBu4USEpRL4bAAAAABXW0bE1BNblaqCh8sJN0Ca',
-            '__T2CID__': 'eb28b989-4140-452d-ac76-75c851c5f553',
-            '_clck': 'v16eb9%5E2%5Eg0w%5E0%5E2140',
-            '_cc_id': '853619dbd287e54c74355720e04e8ef7',
-            'panoramaId': '1506e8abdd2ecdef53769d165cfea9fb927aad097ec22e82e8edcadb259f59ca',
-            'panoramaIdType': 'panoDevice',
-            'cc_audpid': '853619dbd287e54c74355720e04e8ef7',
-            'nlbi_820541_3181253': 'Rsj2QfBuZB3xaiPxpRL4bAAAAABiz5XD8ZEuqjsmv5JIS5pp',
-            '___iat_ses': '5474ECF60E041E03',
-            'cbnr': '1',
-            '__gads': 'ID=56760f4de69aba99:T=1762771964:RT=1762771964:S=ALNI_MY4KTjzzmGwdjMdJAwTuJNiFkIs-A',
-            '__gpi': 'UID=000012c7020b9b88:T=1762771964:RT=1762771964:S=ALNI_MZrhXe8JdXVj_z1BschzbBh3W2k6g',
-            '__eoi': 'ID=ef85606016a43971:T=1762771964:RT=1762771964:S=AA-AfjZ1d4CgH4oLZI_zGwocyQTS',
-            '_asse': 'cm:eyJzbSI6WyIxfDE3NjI3NzE5Mjk2NjJ8MHwwfDM5MTA0fG4iLDE4MjU4NDM5Njg3NjZdfQ==',
-            '_uetsid': '50f7c550be2311f0940e9bfe639c74a4',
-            '_uetvid': '50f7e640be2311f080c395e793823310',
-            '_cq_pxg': '3|p7540524170993107026644946499',
-            'FCCDCF': '%5Bnull%2Cnull%2Cnull%2Cnull%2Cnull%2Cnull%2C%5B%5B32%2C%22%5B%5C%226d740418-bc8a-4f2a-bd34-bf1c2ecf5a85%5C%22%2C%5B1762771964%2C96000000%5D%5D%22%5D%5D%5D',
-            'FCNEC': '%5B%5B%22AKsRol-5W8HZTX4B77SYl3I8RPx6vsdRq-o5IStvZsI-6goTReUCK5zkW1N-2I2eJv-UppQNQxOlM9z6oAEQr6WeCCPwNhMiJq06SplepUnGNCzzAfpPVqUGRaDGODvxhnMO2aHzLvt_4OYVUkhJOIxx7FsJO_HsSA%3D%3D%22%5D%5D',
-            'last-search-feed': 'atype%3DC%26custtype%3DP%26cy%3DCA%26damaged_listing%3Dexclude%26desc%3D1%26lat%3D43.029117584228516%26lon%3D-81.26272583007812%26offer%3DU%26size%3D40%26sort%3Dage%26ustate%3DN%252CU%26zip%3DN5X0E2%2520London%252C%2520ON%26zipr%3D1000',
-            '_ga_YKMVVRSW3Y': 'GS2.1.s1762771931$o1$g1$t1762772105$j10$l0$h0',
-            '_ga_TX2QRVWP93': 'GS2.1.s1762771931$o1$g1$t1762772105$j60$l0$h987418783',
-            '___iat_vis': '5474ECF60E041E03.d365e08ebc04d931d71f0f6e5c8b9051.1762772106907.6f92ff3b6ad04d7a6960250481c51d7a.ROAIMMMOOZ.11111111.1-0.d365e08ebc04d931d71f0f6e5c8b9051',
-            '_clsk': '1husmi%5E1762772107776%5E3%5E0%5Eo.clarity.ms%2Fcollect',
-            'panoramaId_expiry': '1762858506944',
-        }
-
-        headers = {
-            'Host': 'www.autotrader.ca',
-            'Cache-Control': 'max-age=0',
-            'Sec-Ch-Ua': '"Not_A Brand";v="99", "Chromium";v="142"',
-            'Sec-Ch-Ua-Mobile': '?0',
-            'Sec-Ch-Ua-Platform': '"Windows"',
-            'Accept-Language': 'en-US,en;q=0.9',
-            'Upgrade-Insecure-Requests': '1',
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/142.0.0.0 Safari/537.36',
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7',
-            'Sec-Fetch-Site': 'same-origin',
-            'Sec-Fetch-Mode': 'navigate',
-            'Sec-Fetch-User': '?1',
-            'Sec-Fetch-Dest': 'document',
-            # 'Accept-Encoding': 'gzip, deflate, br',
-            'Priority': 'u=0, i',
-            # 'Cookie': 'as24Visitor=c3c760d9-0878-408d-a19b-2180d1931375; ab_test_lp=%7B%22abTest740ComparisonFeature%22%3A%22abtest-740_variation_a%22%7D; visid_incap_820541=PKiQE+rTTnqperHoTPBa4tLDEWkAAAAAQUIPAAAAAADlg8tQIlw7MRuZnv64x+pW; nlbi_820541_3122371=5Qbyek4Vd00I5av4pRL4bAAAAAA9PPLlUlcN+ZpBnL9/m2b9; incap_ses_1776_820541=uW+LcvEvkjXjMEPdFJ+lGNPDEWkAAAAAlBI2pxFRiGU/kcvWgd8hPg==; nlbi_820541_3120041=pmRoSFKMVAJRVvvOpRL4bAAAAADfZdw2B4NIGxW0/vooNruv; nlbi_820541_3127200=1mNKGNNWJya6qtEdpRL4bAAAAABvgkYRJ8QHpATlKN0ZRp6c; culture=en-CA; fallback-zip=%7B%22label%22%3A%22N5X0E2%20London%2C%20ON%22%2C%22lat%22%3A43.029117584228516%2C%22lon%22%3A-81.26272583007812%7D; nlbi_820541_3163786=jHOsYtqQaQfhsKOFpRL4bAAAAADh1E3Y04D6Lc6xys2DCcl6; as24-gtmSearchCrit=0010001-0020000:cc|cy|rn|cu; at_as24_site_exp=onemp; _cq_duid=1.1762771930.cdR0NwW6AZPpu8aK; _cq_suid=1.1762771930.MoGQGNTaKdpzGwnI; _gcl_au=1.1.1886041771.1762771930; _ga=GA1.1.83325848.1762771931; FPID=FPID2.2.2IqdjODDjA3wGmtH4ZCNeesz9Gjk23y%2FPi3uMiuMmoI%3D.1762771931; FPLC=AW%2FNnyvZubMKO1%2FcghoA01cRyrAQ8iyffLogr3pk6IX%2B%2BV7rkhW5%2B7MA3AcRI7CI9lOyOaI1Xd3icyFAuEH%2B2PqS%2FbE4A9vJH%2B%2FR6OesPvOLJKnb21uz8YHqc%2F4pcA%3D%3D; FPAU=1.1.1886041771.1762771930; _gtmeec=e30%3D; _fbp=fb.1.1762771930982.1774960817; nlbi_820541_3156894=cK7GZnlkmFBu4USEpRL4bAAAAABXW0bE1BNblaqCh8sJN0Ca; __T2CID__=eb28b989-4140-452d-ac76-75c851c5f553; _clck=v16eb9%5E2%5Eg0w%5E0%5E2140; _cc_id=853619dbd287e54c74355720e04e8ef7; panoramaId=1506e8abdd2ecdef53769d165cfea9fb927aad097ec22e82e8edcadb259f59ca; panoramaIdType=panoDevice; cc_audpid=853619dbd287e54c74355720e04e8ef7; nlbi_820541_3181253=Rsj2QfBuZB3xaiPxpRL4bAAAAABiz5XD8ZEuqjsmv5JIS5pp; ___iat_ses=5474ECF60E041E03; cbnr=1; __gads=ID=56760f4de69aba99:T=1762771964:RT=1762771964:S=ALNI_MY4KTjzzmGwdjMdJAwTuJNiFkIs-A; __gpi=UID=000012c7020b9b88:T=1762771964:RT=1762771964:S=ALNI_MZrhXe8JdXVj_z1BschzbBh3W2k6g; __eoi=ID=ef85606016a43971:T=1762771964:RT=1762771964:S=AA-AfjZ1d4CgH4oLZI_zGwocyQTS; _asse=cm:eyJzbSI6WyIxfDE3NjI3NzE5Mjk2NjJ8MHwwfDM5MTA0fG4iLDE4MjU4NDM5Njg3NjZdfQ==; _uetsid=50f7c550be2311f0940e9bfe639c74a4; _uetvid=50f7e640be2311f080c395e793823310; _cq_pxg=3|p7540524170993107026644946499; FCCDCF=%5Bnull%2Cnull%2Cnull%2Cnull%2Cnull%2Cnull%2C%5B%5B32%2C%22%5B%5C%226d740418-bc8a-4f2a-bd34-bf1c2ecf5a85%5C%22%2C%5B1762771964%2C96000000%5D%5D%22%5D%5D%5D; FCNEC=%5B%5B%22AKsRol-5W8HZTX4B77SYl3I8RPx6vsdRq-o5IStvZsI-6goTReUCK5zkW1N-2I2eJv-UppQNQxOlM9z6oAEQr6WeCCPwNhMiJq06SplepUnGNCzzAfpPVqUGRaDGODvxhnMO2aHzLvt_4OYVUkhJOIxx7FsJO_HsSA%3D%3D%22%5D%5D; last-search-feed=atype%3DC%26custtype%3DP%26cy%3DCA%26damaged_listing%3Dexclude%26desc%3D1%26lat%3D43.029117584228516%26lon%3D-81.26272583007812%26offer%3DU%26size%3D40%26sort%3Dage%26ustate%3DN%252CU%26zip%3DN5X0E2%2520London%252C%2520ON%26zipr%3D1000; _ga_YKMVVRSW3Y=GS2.1.s1762771931$o1$g1$t1762772105$j10$l0$h0; _ga_TX2QRVWP93=GS2.1.s1762771931$o1$g1$t1762772105$j60$l0$h987418783; ___iat_vis=5474ECF60E041E03.d365e08ebc04d931d71f0f6e5c8b9051.1762772106907.6f92ff3b6ad04d7a6960250481c51d7a.ROAIMMMOOZ.11111111.1-0.d365e08ebc04d931d71f0f6e5c8b9051; _clsk=1husmi%5E1762772107776%5E3%5E0%5Eo.clarity.ms%2Fcollect; panoramaId_expiry=1762858506944',
-        }
-
-        params = {
-            'atype': 'C',
-            'custtype': 'P',
-            'cy': 'CA',
-            'damaged_listing': 'exclude',
-            'desc': '1',
-            'lat': '43.029117584228516',
-            'lon': '-81.26272583007812',
-            'offer': 'U',
-            'search_id': '1na5hpglm9v',
-            'size': '40',
-            'sort': 'age',
-            'source': 'homepage_search-mask',
-            'ustate': 'N,U',
-            'zip': 'N5X0E2 London, ON',
-            'zipr': '1000',
-        }
-
-        response = requests.get('https://www.autotrader.ca/lst', params=params, cookies=cookies, headers=headers, verify=False)
-        html = response.text 
-        match = re.search(r'<script[^>]+type="application/json"[^>]*>(.*?)</script>', html, re.DOTALL)
-        if match:
-            json_text = match.group(1).replace('&quot;', '"')
-            data = json.loads(json_text)
-            # print(json.dumps(data, indent=2))
-            cars = data['props']['pageProps']['listings']
-            
-            for car in cars:
-                make = car["vehicle"].get("make", "")
-                model = car["vehicle"].get("model", "")
-                year = car["vehicle"].get("modelYear", "")
-                price = car["price"].get("priceFormatted", "")
-                mileage = car["vehicle"].get("mileageInKm", "")
-                city = car["location"].get("city", "")
-                url = car.get("url", "")
-                description = car.get("description", "").split("<br")[0]  # short preview
-                image = car["images"][0] if car.get("images") else "N/A"
-                insert_car_autotreader(f"{year} {make} {model}", price, city, mileage, image, url)
-                
-
-                print(f"{year} {make} {model}")
-                print(f"  Price: {price}")
-                print(f"  Mileage: {mileage}")
-                print(f"  City: {city}")
-                print(f"  Image: {image}")
-                print(f"  URL: {url}")
-                print(f"  Description: {description}\n")
-        else:
-            st.warning("No embedded JSON found.")
-
-        st.success("✅ Done! Autotrader Cars successfully added to the database.")
-
-            # cars.append(car)
-
-        # print(json.dumps(cars, indent=4, ensure_ascii=False))
-
+        sweep_args = ["--sweep", *autotrader_centers, "--concurrency", str(sweep_concurrency),
+                      "--rate", str(sweep_rate)] if autotrader_centers else []
+        launch_runner("once", "--sources", "autotrader", *scrape_args, *sweep_args)
+    if ValueSubmitted:
+        # The token goes through the environment, not the (visible) command line
+        launch_runner("value", "--concurrency", str(valuation_concurrency), *(["--full"] if revalue else []),
+                      env=dict(os.environ, MARKETGUIDE_TOKEN=valuation_token))
+    if ThumbnailsSubmitted:
+        launch_runner("thumbnails")
+
+    @st.fragment(run_every=2)
+    def scrape_progress():
+        runs = get_runs(10)
+        if runs.empty:
+            st.caption("No scrape runs yet. Use the buttons above or run `python runner.py schedule`.")
+            return
+        for _, run in runs[runs["status"] == "running"].iterrows():
+            elapsed = time.time() - run["started_ts"]
+            st.info(f"⏳ {run['source']} scrape running ({elapsed:.0f}s): {run['pages']} pages, "
+                    f"{run['found']} listings found, {run['inserted']} new")
+            st.button(f"Cancel {run['source']} scrape", on_click=request_cancel, args=(int(run["id"]),),
+                      key=f"cancel_{run['id']}", disabled=bool(run["cancel_requested"]))
+        for source in runs["source"].unique():
+            latest = runs[runs["source"] == source].iloc[0]
+            if latest["status"] == "done":
+                st.success(f"✅ {source}: last scrape finished, {latest['found']} listings found, {latest['inserted']} new")
+            elif latest["status"] == "cancelled":
+                st.warning(f"⚠️ {source}: last scrape was cancelled")
+            elif latest["status"] == "failed":
+                st.error(f"❌ {source}: last scrape failed: {latest['error']}")
+            if isinstance(latest["log"], str) and latest["log"]:
+                st.code("\n".join(latest["log"].splitlines()[-20:]), language=None)
+        st.dataframe(runs.drop(columns=["log", "pid", "cancel_requested"]), use_container_width=True)
+
+    scrape_progress()
+# ---------------- PAGE 3: DIAGNOSTICS ----------------
+elif page == "🩺 Diagnostics":
+    st.title("🩺 Diagnostics")
+
+    def show_metrics(snap, key):
+        rows = metrics.summary_rows(snap)
+        if rows:
+            st.dataframe(pd.DataFrame(rows), hide_index=True, use_container_width=True, column_config={
+                column: st.column_config.NumberColumn(format="%.1f")
+                for column in ("mean_ms", "p50_ms", "p95_ms", "max_ms")
+            })
+            stage = st.selectbox("Latency histogram", [row["stage"] for row in rows], key=f"hist_{key}")
+            buckets = snap["histograms"][stage]["buckets"]
+            labels = [f"≤ {bound:g} ms" if bound != float("inf") else "slower" for bound in metrics.BUCKETS_MS]
+            st.bar_chart(pd.DataFrame({"requests": buckets}, index=pd.Index(labels, name="latency")), horizontal=True)
+        if snap["counters"]:
+            st.dataframe(pd.DataFrame(sorted(snap["counters"].items()), columns=["counter", "value"]),
+                         hide_index=True, use_container_width=True)
+        if not rows and not snap["counters"]:
+            st.info("Nothing recorded yet.")
+
+    st.subheader("Scrape runner")
+    rounds = st.selectbox("Rounds", [1, 5, 20, 100], index=1, format_func=lambda n: f"last {n}")
+    saved = get_metrics(rounds)
+    if saved:
+        st.caption(f"{len(saved)} rounds since {datetime.fromtimestamp(saved[-1][0]):%Y-%m-%d %H:%M:%S}: "
+                   + ", ".join(sorted({process for _, process, _ in saved})))
+    show_metrics(metrics.merge(snap for _, _, snap in saved), "runner")
+    st.caption("Profile a run with `python runner.py once --profile run.prof`.")
+
+    st.subheader("This dashboard")
+    st.caption("Page renders and market-guide lookups since the dashboard started.")
+    show_metrics(metrics.snapshot(), "dashboard")
+
+metrics.observe("page_render", time.perf_counter() - render_started, page=page)
@@ -0,0 +1,331 @@
+import threading, time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from db import DB_FILE, insert_autotrader_cars, known_urls, record_observations
+from scraping import make_session, RateLimiter, RetryPolicy, extract_next_data
+import metrics
+
+# ---------------- CONFIG ----------------
+SEARCH_URL = "https://www.autotrader.ca/lst"
+
+cookies = {
+    'as24Visitor': 'c3c760d9-0878-408d-a19b-2180d1931375',
+    'ab_test_lp': '%7B%22abTest740ComparisonFeature%22%3A%22abtest-740_variation_a%22%7D',
+    'visid_incap_820541': 'PKiQE+rTTnqperHoTPBa4tLDEWkAAAAAQUIPAAAAAADlg8tQIlw7MRuZnv64x+pW',
+    'nlbi_820541_3122371': '5Qbyek4Vd00I5av4pRL4bAAAAAA9PPLlUlcN+ZpBnL9/m2b9',
+    'incap_ses_1776_820541': 'uW+LcvEvkjXjMEPdFJ+lGNPDEWkAAAAAlBI2pxFRiGU/kcvWgd8hPg==',
+    'nlbi_820541_3120041': 'pmRoSFKMVAJRVvvOpRL4bAAAAADfZdw2B4NIGxW0/vooNruv',
+    'nlbi_820541_3127200': '1mNKGNNWJya6qtEdpRL4bAAAAABvgkYRJ8QHpATlKN0ZRp6c',
+    'culture': 'en-CA',
+    'fallback-zip': '%7B%22label%22%3A%22N5X0E2%20London%2C%20ON%22%2C%22lat%22%3A43.029117584228516%2C%22lon%22%3A-81.26272583007812%7D',
+    'nlbi_820541_3163786': 'jHOsYtqQaQfhsKOFpRL4bAAAAADh1E3Y04D6Lc6xys2DCcl6',
+    'as24-gtmSearchCrit': '0010001-0020000:cc|cy|rn|cu',
+    'at_as24_site_exp': 'onemp',
+    '_cq_duid': '1.1762771930.cdR0NwW6AZPpu8aK',
+    '_cq_suid': '1.1762771930.MoGQGNTaKdpzGwnI',
+    '_gcl_au': '1.1.1886041771.1762771930',
+    '_ga': 'GA1.1.83325848.1762771931',
+    'FPID': 'FPID2.2.2IqdjODDjA3wGmtH4ZCNeesz9Gjk23y%2FPi3uMiuMmoI%3D.1762771931',
+    'FPLC': 'AW%2FNnyvZubMKO1%2FcghoA01cRyrAQ8iyffLogr3pk6IX%2B%2BV7rkhW5%2B7MA3AcRI7CI9lOyOaI1Xd3icyFAuEH%2B2PqS%2FbE4A9vJH%2B%2FR6OesPvOLJKnb21uz8YHqc%2F4pcA%3D%3D',
+    'FPAU': '1.1.1886041771.1762771930',
+    '_gtmeec': 'e30%3D',
+    '_fbp': 'fb.1.1762771930982.1774960817',
+    'nlbi_820541_3156894': 'cK7GZnlkmFBu4USEpRL4bAAAAABXW0bE1BNblaqCh8sJN0Ca',
+    '__T2CID__': 'eb28b989-4140-452d-ac76-75c851c5f553',
+    '_clck': 'v16eb9%5E2%5Eg0w%5E0%5E2140',
+    '_cc_id': '853619dbd287e54c74355720e04e8ef7',
+    'panoramaId': '1506e8abdd2ecdef53769d165cfea9fb927aad097ec22e82e8edcadb259f59ca',
+    'panoramaIdType': 'panoDevice',
+    'cc_audpid': '853619dbd287e54c74355720e04e8ef7',
+    'nlbi_820541_3181253': 'Rsj2QfBuZB3xaiPxpRL4bAAAAABiz5XD8ZEuqjsmv5JIS5pp',
+    '___iat_ses': '5474ECF60E041E03',
+    'cbnr': '1',
+    '__gads': 'ID=56760f4de69aba99:T=1762771964:RT=1762771964:S=ALNI_MY4KTjzzmGwdjMdJAwTuJNiFkIs-A',
+    '__gpi': 'UID=000012c7020b9b88:T=1762771964:RT=1762771964:S=ALNI_MZrhXe8JdXVj_z1BschzbBh3W2k6g',
+    '__eoi': 'ID=ef85606016a43971:T=1762771964:RT=1762771964:S=AA-AfjZ1d4CgH4oLZI_zGwocyQTS',
+    '_asse': 'cm:eyJzbSI6WyIxfDE3NjI3NzE5Mjk2NjJ8MHwwfDM5MTA0fG4iLDE4MjU4NDM5Njg3NjZdfQ==',
+    '_uetsid': '50f7c550be2311f0940e9bfe639c74a4',
+    '_uetvid': '50f7e640be2311f080c395e793823310',
+    '_cq_pxg': '3|p7540524170993107026644946499',
+    'FCCDCF': '%5Bnull%2Cnull%2Cnull%2Cnull%2Cnull%2Cnull%2C%5B%5B32%2C%22%5B%5C%226d740418-bc8a-4f2a-bd34-bf1c2ecf5a85%5C%22%2C%5B1762771964%2C96000000%5D%5D%22%5D%5D%5D',
+    'FCNEC': '%5B%5B%22AKsRol-5W8HZTX4B77SYl3I8RPx6vsdRq-o5IStvZsI-6goTReUCK5zkW1N-2I2eJv-UppQNQxOlM9z6oAEQr6WeCCPwNhMiJq06SplepUnGNCzzAfpPVqUGRaDGODvxhnMO2aHzLvt_4OYVUkhJOIxx7FsJO_HsSA%3D%3D%22%5D%5D',
+    'last-search-feed': 'atype%3DC%26custtype%3DP%26cy%3DCA%26damaged_listing%3Dexclude%26desc%3D1%26lat%3D43.029117584228516%26lon%3D-81.26272583007812%26offer%3DU%26size%3D40%26sort%3Dage%26ustate%3DN%252CU%26zip%3DN5X0E2%2520London%252C%2520ON%26zipr%3D1000',
+    '_ga_YKMVVRSW3Y': 'GS2.1.s1762771931$o1$g1$t1762772105$j10$l0$h0',
+    '_ga_TX2QRVWP93': 'GS2.1.s1762771931$o1$g1$t1762772105$j60$l0$h987418783',
+    '___iat_vis': '5474ECF60E041E03.d365e08ebc04d931d71f0f6e5c8b9051.1762772106907.6f92ff3b6ad04d7a6960250481c51d7a.ROAIMMMOOZ.11111111.1-0.d365e08ebc04d931d71f0f6e5c8b9051',
+    '_clsk': '1husmi%5E1762772107776%5E3%5E0%5Eo.clarity.ms%2Fcollect',
+    'panoramaId_expiry': '1762858506944',
+}
+
+headers = {
+    'Host': 'www.autotrader.ca',
+    'Cache-Control': 'max-age=0',
+    'Sec-Ch-Ua': '"Not_A Brand";v="99", "Chromium";v="142"',
+    'Sec-Ch-Ua-Mobile': '?0',
+    'Sec-Ch-Ua-Platform': '"Windows"',
+    'Accept-Language': 'en-US,en;q=0.9',
+    'Upgrade-Insecure-Requests': '1',
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/142.0.0.0 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7',
+    'Sec-Fetch-Site': 'same-origin',
+    'Sec-Fetch-Mode': 'navigate',
+    'Sec-Fetch-User': '?1',
+    'Sec-Fetch-Dest': 'document',
+    # 'Accept-Encoding': 'gzip, deflate, br',
+    'Priority': 'u=0, i',
+    # 'Cookie': 'as24Visitor=c3c760d9-0878-408d-a19b-2180d1931375; ab_test_lp=%7B%22abTest740ComparisonFeature%22%3A%22abtest-740_variation_a%22%7D; visid_incap_820541=PKiQE+rTTnqperHoTPBa4tLDEWkAAAAAQUIPAAAAAADlg8tQIlw7MRuZnv64x+pW; nlbi_820541_3122371=5Qbyek4Vd00I5av4pRL4bAAAAAA9PPLlUlcN+ZpBnL9/m2b9; incap_ses_1776_820541=uW+LcvEvkjXjMEPdFJ+lGNPDEWkAAAAAlBI2pxFRiGU/kcvWgd8hPg==; nlbi_820541_3120041=pmRoSFKMVAJRVvvOpRL4bAAAAADfZdw2B4NIGxW0/vooNruv; nlbi_820541_3127200=1mNKGNNWJya6qtEdpRL4bAAAAABvgkYRJ8QHpATlKN0ZRp6c; culture=en-CA; fallback-zip=%7B%22label%22%3A%22N5X0E2%20London%2C%20ON%22%2C%22lat%22%3A43.029117584228516%2C%22lon%22%3A-81.26272583007812%7D; nlbi_820541_3163786=jHOsYtqQaQfhsKOFpRL4bAAAAADh1E3Y04D6Lc6xys2DCcl6; as24-gtmSearchCrit=0010001-0020000:cc|cy|rn|cu; at_as24_site_exp=onemp; _cq_duid=1.1762771930.cdR0NwW6AZPpu8aK; _cq_suid=1.1762771930.MoGQGNTaKdpzGwnI; _gcl_au=1.1.1886041771.1762771930; _ga=GA1.1.83325848.1762771931; FPID=FPID2.2.2IqdjODDjA3wGmtH4ZCNeesz9Gjk23y%2FPi3uMiuMmoI%3D.1762771931; FPLC=AW%2FNnyvZubMKO1%2FcghoA01cRyrAQ8iyffLogr3pk6IX%2B%2BV7rkhW5%2B7MA3AcRI7CI9lOyOaI1Xd3icyFAuEH%2B2PqS%2FbE4A9vJH%2B%2FR6OesPvOLJKnb21uz8YHqc%2F4pcA%3D%3D; FPAU=1.1.1886041771.1762771930; _gtmeec=e30%3D; _fbp=fb.1.1762771930982.1774960817; nlbi_820541_3156894=cK7GZnlkmFBu4USEpRL4bAAAAABXW0bE1BNblaqCh8sJN0Ca; __T2CID__=eb28b989-4140-452d-ac76-75c851c5f553; _clck=v16eb9%5E2%5Eg0w%5E0%5E2140; _cc_id=853619dbd287e54c74355720e04e8ef7; panoramaId=1506e8abdd2ecdef53769d165cfea9fb927aad097ec22e82e8edcadb259f59ca; panoramaIdType=panoDevice; cc_audpid=853619dbd287e54c74355720e04e8ef7; nlbi_820541_3181253=Rsj2QfBuZB3xaiPxpRL4bAAAAABiz5XD8ZEuqjsmv5JIS5pp; ___iat_ses=5474ECF60E041E03; cbnr=1; __gads=ID=56760f4de69aba99:T=1762771964:RT=1762771964:S=ALNI_MY4KTjzzmGwdjMdJAwTuJNiFkIs-A; __gpi=UID=000012c7020b9b88:T=1762771964:RT=1762771964:S=ALNI_MZrhXe8JdXVj_z1BschzbBh3W2k6g; __eoi=ID=ef85606016a43971:T=1762771964:RT=1762771964:S=AA-AfjZ1d4CgH4oLZI_zGwocyQTS; _asse=cm:eyJzbSI6WyIxfDE3NjI3NzE5Mjk2NjJ8MHwwfDM5MTA0fG4iLDE4MjU4NDM5Njg3NjZdfQ==; _uetsid=50f7c550be2311f0940e9bfe639c74a4; _uetvid=50f7e640be2311f080c395e793823310; _cq_pxg=3|p7540524170993107026644946499; FCCDCF=%5Bnull%2Cnull%2Cnull%2Cnull%2Cnull%2Cnull%2C%5B%5B32%2C%22%5B%5C%226d740418-bc8a-4f2a-bd34-bf1c2ecf5a85%5C%22%2C%5B1762771964%2C96000000%5D%5D%22%5D%5D%5D; FCNEC=%5B%5B%22AKsRol-5W8HZTX4B77SYl3I8RPx6vsdRq-o5IStvZsI-6goTReUCK5zkW1N-2I2eJv-UppQNQxOlM9z6oAEQr6WeCCPwNhMiJq06SplepUnGNCzzAfpPVqUGRaDGODvxhnMO2aHzLvt_4OYVUkhJOIxx7FsJO_HsSA%3D%3D%22%5D%5D; last-search-feed=atype%3DC%26custtype%3DP%26cy%3DCA%26damaged_listing%3Dexclude%26desc%3D1%26lat%3D43.029117584228516%26lon%3D-81.26272583007812%26offer%3DU%26size%3D40%26sort%3Dage%26ustate%3DN%252CU%26zip%3DN5X0E2%2520London%252C%2520ON%26zipr%3D1000; _ga_YKMVVRSW3Y=GS2.1.s1762771931$o1$g1$t1762772105$j10$l0$h0; _ga_TX2QRVWP93=GS2.1.s1762771931$o1$g1$t1762772105$j60$l0$h987418783; ___iat_vis=5474ECF60E041E03.d365e08ebc04d931d71f0f6e5c8b9051.1762772106907.6f92ff3b6ad04d7a6960250481c51d7a.ROAIMMMOOZ.11111111.1-0.d365e08ebc04d931d71f0f6e5c8b9051; _clsk=1husmi%5E1762772107776%5E3%5E0%5Eo.clarity.ms%2Fcollect; panoramaId_expiry=1762858506944',
+}
+
+params = {
+    'atype': 'C',
+    'custtype': 'P',
+    'cy': 'CA',
+    'damaged_listing': 'exclude',
+    'desc': '1',
+    'lat': '43.029117584228516',
+    'lon': '-81.26272583007812',
+    'offer': 'U',
+    'search_id': '1na5hpglm9v',
+    'size': '40',
+    'sort': 'age',
+    'source': 'homepage_search-mask',
+    'ustate': 'N,U',
+    'zip': 'N5X0E2 London, ON',
+    'zipr': '1000',
+}
+
+PAGE_SIZE = int(params['size'])
+
+
+def page_size(search_params):
+    # Results per page a search asks for (its "size" param)
+    return int(search_params.get("size", PAGE_SIZE))
+
+# ---------------- SHARDS ----------------
+# One search only ever returns its first pages, so a sweep splits the
+# search space into shards (price band x year band x postal-code center),
+# each a search of its own that is paged separately. Bands are [from, to]
+# with None for open-ended.
+PRICE_BANDS = [(None, 5000), (5001, 10000), (10001, 15000), (15001, 20000), (20001, 25000),
+               (25001, 30000), (30001, 40000), (40001, 60000), (60001, None)]
+YEAR_BANDS = [(None, 2010), (2011, 2014), (2015, 2017), (2018, 2020), (2021, None)]
+
+# label -> (zip, lat, lon)
+CENTERS = {
+    "london": ("N5X0E2 London, ON", 43.029117584228516, -81.26272583007812),
+    "toronto": ("M5V3L9 Toronto, ON", 43.6426, -79.3871),
+    "ottawa": ("K1P1J1 Ottawa, ON", 45.4215, -75.6972),
+    "montreal": ("H3B1A7 Montréal, QC", 45.5017, -73.5673),
+    "calgary": ("T2P1J9 Calgary, AB", 51.0447, -114.0719),
+    "vancouver": ("V6B1A1 Vancouver, BC", 49.2827, -123.1207),
+}
+CENTER_RADIUS_KM = 250
+
+
+def _band(low, high):
+    return f"{low or ''}-{high or ''}"
+
+
+def make_shards(price_bands=PRICE_BANDS, year_bands=YEAR_BANDS, centers=("london",), radius_km=None):
+    """Return [(key, params), ...]: the search params of every shard.
+
+    With a single center the search keeps its own radius; with several,
+    each center covers radius_km (CENTER_RADIUS_KM by default).
+    """
+    radius = radius_km or (CENTER_RADIUS_KM if len(centers) > 1 else None)
+    shards = []
+    for center in centers:
+        zip_code, lat, lon = CENTERS[center]
+        for price_from, price_to in price_bands:
+            for year_from, year_to in year_bands:
+                shard = {"zip": zip_code, "lat": str(lat), "lon": str(lon)}
+                if radius:
+                    shard["zipr"] = str(radius)
+                for key, value in (("pricefrom", price_from), ("priceto", price_to),
+                                   ("fregfrom", year_from), ("fregto", year_to)):
+                    if value is not None:
+                        shard[key] = str(value)
+                key = f"{center} ${_band(price_from, price_to)} {_band(year_from, year_to)}"
+                shards.append((key, dict(params, **shard)))
+    return shards
+
+
+# ---------------- PARSE ----------------
+def extract_search(html):
+    # (listings, total number of results of the search), or None
+    data = extract_next_data(html)
+    if data is None:
+        return None
+    page_props = data['props']['pageProps']
+    return page_props['listings'], page_props.get('numberOfResults')
+
+
+def extract_listings(html):
+    search = extract_search(html)
+    return None if search is None else search[0]
+
+
+def normalize_listing(car):
+    make = car["vehicle"].get("make", "")
+    model = car["vehicle"].get("model", "")
+    year = car["vehicle"].get("modelYear", "")
+    price = car["price"].get("priceFormatted", "")
+    mileage = car["vehicle"].get("mileageInKm", "")
+    city = car["location"].get("city", "")
+    url = car.get("url", "")
+    image = car["images"][0] if car.get("images") else "N/A"
+
+    return {
+        "title": f"{year} {make} {model}",
+        "brand": make,
+        "model": model,
+        "model_year": year,
+        "price": price,
+        "location": city,
+        "odometer": mileage,
+        "image_src": image,
+        "ad_link": url,
+    }
+
+
+def parse_listings(html):
+    cars = extract_listings(html)
+    if cars is None:
+        return None
+    return [normalize_listing(car) for car in cars]
+
+
+# ---------------- SCRAPE ----------------
+def scrape_search(session, search_params, pages=1, incremental=False, claim=None, limiter=None, policy=None,
+                  on_retry=None, stop_event=None, db_file=DB_FILE):
+    """Page through one search (newest first) and store its listings.
+
+    Stops after `pages` pages, at the last page of the results, or in
+    incremental mode at the first page with nothing new. claim(urls), when
+    given, returns the URLs no other search of the same sweep has taken;
+    only those are stored. Returns the result counts plus "total", the
+    number of results the site reports for the search.
+    """
+    policy = policy or RetryPolicy()
+    result = {"url": SEARCH_URL, "status": None, "pages": 0, "found": 0, "unique": 0, "new": 0, "inserted": 0,
+              "ignored": 0, "price_changes": 0, "total": None}
+    for page in range(1, pages + 1):
+        if stop_event is not None and stop_event.is_set():
+            break
+        page_params = dict(search_params, page=str(page)) if page > 1 else search_params
+        response = policy.request(session, SEARCH_URL, limiter=limiter, params=page_params,
+                                  on_retry=on_retry, stop_event=stop_event)
+        result["status"] = response.status_code
+        if response.status_code != 200:
+            result["error"] = f"HTTP {response.status_code}"
+            break
+
+        with metrics.timed("parse", source="Autotrader"):
+            search = extract_search(response.text)
+        if search is None:
+            result["error"] = "No embedded JSON found."
+            break
+        found, total = search
+        if result["total"] is None:
+            result["total"] = total
+        urls = [car.get("url") for car in found]
+        known = known_urls("Autotrader", urls, db_file=db_file) if incremental else set()
+        unseen = [url for url in urls if url not in known]
+        cars = found
+        if claim is not None:
+            claimed = claim(urls)
+            cars = [car for car in found if car.get("url") in claimed]
+        with metrics.timed("normalize", source="Autotrader"):
+            seen = [normalize_listing(car) for car in cars]
+        rows = [row for row in seen if row["ad_link"] not in known]
+        with metrics.timed("sql_write", source="Autotrader"):
+            counts = insert_autotrader_cars(rows, db_file=db_file)
+            price_changes = record_observations("Autotrader", seen, db_file=db_file)
+        metrics.count("listings_found", len(found), source="Autotrader")
+        metrics.count("listings_inserted", counts["inserted"], source="Autotrader")
+        metrics.count("listings_ignored", counts["ignored"], source="Autotrader")
+        metrics.count("listings_price_changes", price_changes, source="Autotrader")
+        result["price_changes"] += price_changes
+
+        result["pages"] += 1
+        result["found"] += len(found)
+        result["unique"] += len(cars)
+        result["new"] += len(rows)
+        result["inserted"] += counts["inserted"]
+        result["ignored"] += counts["ignored"]
+        last_page = not found or (total is not None and page * page_size(search_params) >= total)
+        if last_page or (incremental and not unseen):
+            break
+    return result
+
+
+def scrape(pages=1, incremental=False, policy=None, on_retry=None, stop_event=None,
+           fixtures=None, record=False, db_file=DB_FILE):
+    """Fetch up to `pages` search result pages (newest first) and store them.
+
+    Incremental mode skips listings whose URL is already stored and stops at
+    the first page that brings nothing new. Returns the last HTTP status,
+    pages fetched, listings found/new and the inserted/ignored counts;
+    "error" is set when a page could not be used.
+    """
+    with make_session(headers=headers, cookies=cookies, pool_size=1, fixtures=fixtures, record=record) as session:
+        return scrape_search(session, params, pages, incremental, policy=policy, on_retry=on_retry,
+                             stop_event=stop_event, db_file=db_file)
+
+
+def sweep(shards=None, pages=1, concurrency=4, rate_per_host=1.0, incremental=False, on_shard=None, policy=None,
+          on_retry=None, stop_event=None, fixtures=None, record=False, db_file=DB_FILE):
+    """Run every shard's search concurrently and merge them by listing URL.
+
+    shards is make_shards()'s [(key, params), ...] (default: every price and
+    year band around London). Shards share one pooled session and the
+    per-host rate limit; a listing returned by several shards is stored
+    once. on_shard(result) is called per finished shard, with its key,
+    counts and seconds taken, from that shard's worker thread (so possibly
+    several at a time). The totals add coverage: "listings" unique
+    listings seen, "reported" the sum of the shards' result counts, and
+    "truncated" the shards with more results than `pages` pages hold
+    (split those further, or fetch more pages).
+    """
+    shards = make_shards() if shards is None else shards
+    policy = policy or RetryPolicy()
+    session = make_session(headers=headers, cookies=cookies, pool_size=concurrency, fixtures=fixtures, record=record)
+    limiter = RateLimiter(rate_per_host)
+    lock = threading.Lock()
+    claimed_urls = set()
+    totals = {"shards": 0, "failed": 0, "pages": 0, "found": 0, "listings": 0, "new": 0, "inserted": 0,
+              "ignored": 0, "price_changes": 0, "reported": 0, "truncated": 0}
+
+    def claim(urls):
+        with lock:
+            fresh = {url for url in urls if url and url not in claimed_urls}
+            claimed_urls.update(fresh)
+        return fresh
+
+    def scrape_shard(key, shard_params):
+        started = time.monotonic()
+        try:
+            result = scrape_search(session, shard_params, pages, incremental, claim, limiter, policy,
+                                   on_retry, stop_event, db_file=db_file)
+        except Exception as e:
+            result = {"status": None, "pages": 0, "found": 0, "unique": 0, "new": 0, "inserted": 0, "ignored": 0,
+                      "price_changes": 0, "total": None, "error": str(e)}
+        result.update(key=key, seconds=time.monotonic() - started)
+        result["truncated"] = bool(result["total"] and result["total"] > pages * page_size(shard_params))
+        with lock:
+            totals["shards"] += 1
+            totals["failed"] += "error" in result
+            for field in ("pages", "found", "new", "inserted", "ignored", "price_changes"):
+                totals[field] += result[field]
+            totals["listings"] += result["unique"]
+            totals["reported"] += result["total"] or 0
+            totals["truncated"] += result["truncated"]
+        # Outside the lock: a slow callback must not hold up the other shards
+        if on_shard:
+            on_shard(result)
+        return result
+
+    with session, ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = [pool.submit(scrape_shard, key, shard_params) for key, shard_params in shards]
+        for future in as_completed(futures):
+            future.result()
+    return totals
@@ -0,0 +1,182 @@
+import threading, time, traceback
+import autotrader, kijiji, marketguide, thumbnails
+
+# ---------------- JOBS ----------------
+# Scrapes run on their own threads so the Streamlit script returns right away;
+# pages poll the registry for progress. The registry is module level, so a
+# job keeps running (and stays visible) across reruns and browser sessions.
+JOBS = {}
+_lock = threading.Lock()
+
+MAX_LOG_LINES = 200
+
+
+class Job:
+    def __init__(self, name, target, kwargs):
+        self.name = name
+        self.status = "running"
+        self.result = None
+        self.error = None
+        self.log_lines = []
+        self.log_count = 0
+        self.progress = {}
+        self.started_at = time.time()
+        self.finished_at = None
+        self.stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(target, kwargs), name=f"job-{name}", daemon=True)
+
+    def _run(self, target, kwargs):
+        try:
+            self.result = target(self, **kwargs)
+            self.status = "cancelled" if self.stop_event.is_set() else "done"
+        except Exception as e:
+            self.error = f"{e.__class__.__name__}: {e}"
+            self.log(traceback.format_exc())
+            self.status = "failed"
+        finally:
+            self.finished_at = time.time()
+
+    def log(self, message):
+        self.log_lines.append(f"{time.strftime('%H:%M:%S')} {message}")
+        self.log_count += 1
+        del self.log_lines[:-MAX_LOG_LINES]
+
+    def new_log_lines(self, seen):
+        # Lines logged since the caller had seen `seen` of them
+        return self.log_lines[len(self.log_lines) - min(self.log_count - seen, len(self.log_lines)):]
+
+    def on_retry(self, url, attempt, delay, reason):
+        self.log(f"⚠️ {url}: {reason}, retry {attempt} in {delay:.0f}s")
+
+    @property
+    def running(self):
+        return self.status == "running"
+
+    @property
+    def elapsed(self):
+        return (self.finished_at or time.time()) - self.started_at
+
+    def cancel(self):
+        self.stop_event.set()
+
+    def join(self, timeout=None):
+        self._thread.join(timeout)
+
+
+def start_job(name, target, **kwargs):
+    """Start target(job, **kwargs) in the background unless a job with this
+    name is already running; returns the running job either way."""
+    with _lock:
+        job = JOBS.get(name)
+        if job is not None and job.running:
+            return job
+        job = JOBS[name] = Job(name, target, kwargs)
+    job._thread.start()
+    return job
+
+
+# ---------------- SCRAPE JOBS ----------------
+def run_kijiji(job, **settings):
+    progress = job.progress
+    progress.update(pages=0, found=0, inserted=0, ignored=0)
+
+    def on_page(result):
+        progress["pages"] += 1
+        progress["found"] += result["found"]
+        progress["inserted"] += result["inserted"]
+        progress["ignored"] += result["ignored"]
+        if result["status"] == 200:
+            job.log(f"✅ {result['url']}: {result['found']} listings, {result['new']} not seen before, "
+                    f"{result['inserted']} inserted")
+        else:
+            job.log(f"⚠️ {result['url']}: failed ({result.get('error') or result['status']})")
+
+    totals = kijiji.crawl(on_page=on_page, on_retry=job.on_retry, stop_event=job.stop_event, **settings)
+    job.log(f"✅ Done! {totals['pages'] - totals['failed']}/{totals['pages']} pages, {totals['found']} listings found, "
+            f"{totals['new']} not seen before, {totals['inserted']} inserted, {totals['price_changes']} price changes")
+    return totals
+
+
+def run_autotrader(job, centers=None, **settings):
+    # centers: sweep the price/year shards around these centers instead of
+    # the single search
+    if centers:
+        return run_autotrader_sweep(job, centers, **settings)
+    result = autotrader.scrape(on_retry=job.on_retry, stop_event=job.stop_event, **settings)
+    job.progress.update(pages=result["pages"], found=result["found"], inserted=result["inserted"], ignored=result["ignored"])
+    if result.get("error"):
+        job.log(f"⚠️ {result['url']}: {result['error']}")
+    else:
+        job.log(f"✅ Done! {result['pages']} pages, {result['found']} listings found, {result['new']} not seen before, "
+                f"{result['inserted']} inserted, {result['price_changes']} price changes")
+    return result
+
+
+def run_autotrader_sweep(job, centers, **settings):
+    progress = job.progress
+    progress.update(pages=0, found=0, inserted=0, ignored=0)
+    progress_lock = threading.Lock()
+
+    def on_shard(result):
+        # Called from the shard workers, several at a time
+        with progress_lock:
+            progress["pages"] += result["pages"]
+            progress["found"] += result["unique"]
+            progress["inserted"] += result["inserted"]
+            progress["ignored"] += result["ignored"]
+        if result.get("error"):
+            job.log(f"⚠️ {result['key']}: failed ({result['error']})")
+        else:
+            job.log(f"✅ {result['key']}: {result['pages']} pages, {result['found']} of {result['total'] or '?'} "
+                    f"listings, {result['unique']} not in other shards, {result['inserted']} inserted "
+                    f"in {result['seconds']:.1f}s" + (" (truncated)" if result["truncated"] else ""))
+
+    shards = autotrader.make_shards(centers=centers)
+    totals = autotrader.sweep(shards, on_shard=on_shard, on_retry=job.on_retry, stop_event=job.stop_event, **settings)
+    job.log(f"✅ Done! {totals['shards'] - totals['failed']}/{totals['shards']} shards, {totals['pages']} pages, "
+            f"{totals['listings']} listings ({totals['found'] - totals['listings']} seen in several shards) "
+            f"of {totals['reported']} reported, {totals['inserted']} inserted, {totals['price_changes']} price changes, "
+            f"{totals['truncated']} shards truncated")
+    return totals
+
+
+def run_valuation(job, **settings):
+    # Same progress fields as the scrapes: pages = buckets looked up,
+    # found = listings in them, inserted = listings valued
+    progress = job.progress
+    progress.update(pages=0, found=0, inserted=0, ignored=0)
+
+    def on_bucket(result):
+        progress["pages"] += 1
+        progress["found"] += result["listings"]
+        progress["inserted"] += result["valued"]
+        make, model, year, odometer_max = result["bucket"]
+        label = f"{year} {make} {model} (≤ {odometer_max or '?'} km)"
+        if result.get("error"):
+            job.log(f"⚠️ {label}: {result['error']}")
+        else:
+            job.log(f"✅ {label}: {result['valued']} listings valued")
+
+    totals = marketguide.value_listings(on_bucket=on_bucket, stop_event=job.stop_event, **settings)
+    progress["ignored"] = totals["skipped"]
+    job.log(f"✅ Done! {totals['buckets']} market-guide lookups for {totals['listings']} listings, "
+            f"{totals['valued']} valued, {totals['skipped']} without a make/model/year match")
+    return totals
+
+
+def run_thumbnails(job, **settings):
+    # pages = photos fetched, inserted = thumbnails stored
+    progress = job.progress
+    progress.update(pages=0, found=0, inserted=0, ignored=0)
+
+    def on_image(result):
+        progress["pages"] += 1
+        progress["inserted"] += result["digest"] is not None
+        if result.get("error"):
+            job.log(f"⚠️ {result['url']}: {result['error']}")
+
+    totals = thumbnails.fetch_thumbnails(on_image=on_image, stop_event=job.stop_event, **settings)
+    progress["found"] = totals["images"]
+    job.log(f"✅ Done! {totals['images'] - totals['failed']}/{totals['images']} thumbnails, "
+            f"{totals['bytes'] / 1e6:.1f} MB downloaded, {totals['thumb_bytes'] / 1e6:.1f} MB stored")
+    return totals
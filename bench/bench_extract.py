@@ -0,0 +1,67 @@
+"""Micro-benchmark: embedded-JSON extraction from saved result pages.
+
+    python bench/bench_extract.py                 # the pages under fixtures/
+    python bench/bench_extract.py --fixtures DIR  # another recording
+    python bench/bench_extract.py --repeat 200
+
+Compares the old regex + str.replace + json.loads path with
+scraping.extract_next_data, on every recorded page plus a synthetic page
+padded to a realistic size (the live pages are several hundred KB of
+markup around the payload). That both return the same payload is checked
+in tests/test_scraping.py.
+"""
+import argparse, glob, json, os, re, sys, timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import scraping
+from scraping import extract_next_data
+
+FIXTURES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "fixtures")
+
+
+def extract_regex(html):
+    # What both scrapers did before scraping.extract_next_data
+    match = re.search(r'<script[^>]+type="application/json"[^>]*>(.*?)</script>', html, re.DOTALL)
+    if not match:
+        return None
+    json_text = match.group(1).strip()
+    json_text = json_text.replace('&quot;', '"').replace('&amp;', '&')
+    return json.loads(json_text)
+
+
+def synthetic_page(page, padding=400_000):
+    # Markup and inline scripts before the payload, as on the live sites
+    filler = '<div class="card"><script>window.x=1</script><span>listing</span></div>\n'
+    return filler * (padding // len(filler)) + page
+
+
+def load_pages(root):
+    pages = {}
+    for path in sorted(glob.glob(os.path.join(root, "**", "*.html"), recursive=True)):
+        with open(path, encoding="utf-8") as f:
+            pages[os.path.relpath(path, root)] = f.read()
+    for name, page in list(pages.items()):
+        pages[f"{name} (+400 KB markup)"] = synthetic_page(page)
+    return pages
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--fixtures", default=FIXTURES)
+    parser.add_argument("--repeat", type=int, default=100)
+    args = parser.parse_args(argv)
+
+    pages = load_pages(args.fixtures)
+    if not pages:
+        parser.error(f"no .html pages under {args.fixtures}")
+    print(f"JSON backend: {'orjson' if scraping.orjson else 'json'}, {args.repeat} runs per page\n")
+    print(f"{'page':<76} {'KB':>6} {'regex ms':>9} {'new ms':>8} {'speedup':>8}")
+    for name, page in pages.items():
+        old = min(timeit.repeat(lambda: extract_regex(page), number=args.repeat, repeat=3)) / args.repeat
+        new = min(timeit.repeat(lambda: extract_next_data(page), number=args.repeat, repeat=3)) / args.repeat
+        print(f"{name:<76} {len(page) / 1024:>6.0f} {old * 1000:>9.3f} {new * 1000:>8.3f} {old / new:>7.1f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
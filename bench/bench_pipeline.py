@@ -0,0 +1,246 @@
+"""Offline benchmark of the scrape -> ingest hot path, stage by stage.
+
+    python bench/bench_pipeline.py                        # recorded + synthetic pages
+    python bench/bench_pipeline.py --listings 400 --repeat 5
+    python bench/bench_pipeline.py --save bench/baseline.json
+    python bench/bench_pipeline.py --compare bench/baseline.json --tolerance 0.2
+
+Serves the pages under fixtures/ and synthetic large pages (the recorded
+listings cloned up to --listings per page, padded with markup) from a
+local HTTP server, and times each stage per page: fetch over a pooled
+session, JSON extraction, listing discovery, normalization, the database
+insert and the observations pass (into a scratch database). The best of
+--repeat runs is reported, per page and per listing. --save writes the
+timings as JSON; --compare prints them next to a saved run and exits with
+status 1 when a stage got slower than --tolerance allows (stages faster
+than --min-ms per page are too noisy to judge and are not flagged).
+"""
+import argparse, copy, glob, json, os, platform, shutil, sys, tempfile, threading, time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import autotrader, db, kijiji, scraping
+from scraping import extract_next_data, make_session
+
+FIXTURES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "fixtures")
+STAGES = ["fetch", "extract", "discover", "normalize", "insert", "observe"]
+
+
+# ---------------- PAGES ----------------
+def page_html(data, encode=False, padding=0):
+    # A Next.js page: filler markup, then the payload script (entity-encoded
+    # like Autotrader's when encode is set)
+    payload = json.dumps(data)
+    if encode:
+        payload = payload.replace("&", "&amp;").replace('"', "&quot;")
+    filler = '<div class="card"><script>window.x=1</script><span>listing</span></div>\n'
+    return (f'<!DOCTYPE html><html><body>{filler * (padding // len(filler))}'
+            f'<script id="__NEXT_DATA__" type="application/json">{payload}</script></body></html>')
+
+
+def clone_kijiji(data, count):
+    # The recorded Apollo cache with its listings cloned (new ids and URLs) up to count
+    data = copy.deepcopy(data)
+    cache = kijiji.apollo_cache(data)
+    listings = [v for k, v in cache.items() if k.startswith(kijiji.LISTING_PREFIX)]
+    for i in range(max(0, count - len(listings))):
+        listing = dict(listings[i % len(listings)], id=f"9{i:08d}")
+        listing["url"] = f"{listing['url']}-clone{i}"
+        cache[f"{kijiji.LISTING_PREFIX}{listing['id']}"] = listing
+    return data
+
+
+def clone_autotrader(data, count):
+    data = copy.deepcopy(data)
+    listings = data["props"]["pageProps"]["listings"]
+    originals = list(listings)
+    for i in range(max(0, count - len(originals))):
+        listing = dict(originals[i % len(originals)])
+        listing["url"] = f"{listing['url']}-clone{i}"
+        listings.append(listing)
+    data["props"]["pageProps"]["numberOfResults"] = len(listings)
+    return data
+
+
+def load_pages(root, listings, padding):
+    """Return {name: (source, html)}: every recorded page, plus one synthetic
+    large page per source built from the first recording of that source."""
+    pages = {}
+    for path in sorted(glob.glob(os.path.join(root, "**", "*.html"), recursive=True)):
+        source = "Kijiji" if "kijiji" in path else "Autotrader"
+        with open(path, encoding="utf-8") as f:
+            pages[os.path.relpath(path, root).replace(os.sep, "/")] = (source, f.read())
+    for source, clone, encode in (("Kijiji", clone_kijiji, False), ("Autotrader", clone_autotrader, True)):
+        recorded = next((html for name, (s, html) in pages.items() if s == source), None)
+        if recorded is not None:
+            data = clone(extract_next_data(recorded), listings)
+            pages[f"synthetic {source} ({listings} listings)"] = (source, page_html(data, encode, padding))
+    return pages
+
+
+# ---------------- SERVER ----------------
+def serve(pages):
+    # Local stand-in for the sites: /<page number> -> that page's HTML
+    bodies = [html.encode("utf-8") for _, html in pages.values()]
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"   # keep-alive, as with the real sites
+        disable_nagle_algorithm = True  # headers and body go out in separate writes
+
+        def do_GET(self):
+            try:
+                body = bodies[int(self.path.strip("/"))]
+            except (ValueError, IndexError):
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+# ---------------- STAGES ----------------
+def discover(source, data):
+    if source == "Kijiji":
+        return kijiji.find_autos_listings(data)
+    return data["props"]["pageProps"]["listings"]
+
+
+def normalize(source, listings):
+    if source == "Kijiji":
+        now = datetime.now(timezone.utc)
+        return [kijiji.normalize_listing(listing, now) for listing in listings]
+    return [autotrader.normalize_listing(car) for car in listings]
+
+
+def insert(source, rows, db_file):
+    if source == "Kijiji":
+        return db.insert_kijiji_cars(rows, db_file=db_file)
+    return db.insert_autotrader_cars(rows, db_file=db_file)
+
+
+def time_page(session, url, source, repeat, scratch):
+    """Best time per stage over `repeat` runs; each run inserts into a fresh database."""
+    best = dict.fromkeys(STAGES, float("inf"))
+    count = 0
+    for run in range(repeat):
+        db_file = os.path.join(scratch, f"run{run}.db")
+        db.init_db(db_file)
+        timings = {}
+
+        start = time.perf_counter()
+        html = session.get(url).text
+        timings["fetch"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        data = extract_next_data(html)
+        timings["extract"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        listings = discover(source, data)
+        timings["discover"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        rows = normalize(source, listings)
+        timings["normalize"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        insert(source, rows, db_file)
+        timings["insert"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        db.record_observations(source, rows, db_file=db_file)
+        timings["observe"] = time.perf_counter() - start
+
+        db.close_conn(db_file)
+        count = len(rows)
+        best = {stage: min(best[stage], timings[stage]) for stage in STAGES}
+    return best, count
+
+
+# ---------------- REPORT ----------------
+def print_report(results, baseline=None, tolerance=0.15, min_ms=0.5):
+    # Returns the (page, stage) pairs slower than the baseline by more than tolerance
+    regressions = []
+    for name, result in results.items():
+        print(f"\n{name}: {result['listings']} listings, {result['kb']:.0f} KB")
+        header = f"  {'stage':<10} {'ms/page':>9} {'us/listing':>11}"
+        print(header + (f" {'baseline':>9} {'change':>8}" if baseline else ""))
+        for stage in STAGES + ["total"]:
+            seconds = result["seconds"][stage]
+            line = f"  {stage:<10} {seconds * 1000:>9.3f} {seconds / max(result['listings'], 1) * 1e6:>11.1f}"
+            before = ((baseline or {}).get(name) or {}).get("seconds", {}).get(stage)
+            if before:
+                change = seconds / before - 1
+                flag = ""
+                if change > tolerance and stage != "total" and seconds * 1000 >= min_ms:
+                    regressions.append((name, stage))
+                    flag = "  slower"
+                line += f" {before * 1000:>9.3f} {change * 100:>+7.0f}%{flag}"
+            print(line)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--fixtures", default=FIXTURES)
+    parser.add_argument("--listings", type=int, default=200, help="listings per synthetic page")
+    parser.add_argument("--padding", type=int, default=400_000, help="bytes of markup before the payload")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--save", help="write the timings to this JSON file")
+    parser.add_argument("--compare", help="JSON file saved by an earlier run")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="allowed slowdown per stage (0.15 = 15%%)")
+    parser.add_argument("--min-ms", type=float, default=0.5, help="only flag stages taking at least this long")
+    args = parser.parse_args(argv)
+
+    pages = load_pages(args.fixtures, args.listings, args.padding)
+    if not pages:
+        parser.error(f"no .html pages under {args.fixtures}")
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+
+    server = serve(pages)
+    base_url = f"http://127.0.0.1:{server.server_port}"
+    scratch = tempfile.mkdtemp(prefix="bench-pipeline-")
+    results = {}
+    try:
+        with make_session(pool_size=1) as session:
+            for number, (name, (source, html)) in enumerate(pages.items()):
+                seconds, count = time_page(session, f"{base_url}/{number}", source, args.repeat, scratch)
+                seconds["total"] = sum(seconds.values())
+                results[name] = {"source": source, "listings": count, "kb": len(html) / 1024, "seconds": seconds}
+    finally:
+        server.shutdown()
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    print(f"Python {platform.python_version()}, JSON backend: {'orjson' if scraping.orjson else 'json'}, "
+          f"SQLite {db.sqlite3.sqlite_version}, best of {args.repeat} runs")
+    regressions = print_report(results, baseline, args.tolerance, args.min_ms)
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump({"python": platform.python_version(), "json": "orjson" if scraping.orjson else "json",
+                       "created": time.strftime("%Y-%m-%d %H:%M:%S"), "repeat": args.repeat,
+                       "results": results}, f, indent=2)
+        print(f"\nSaved to {args.save}")
+    if regressions:
+        print(f"\n{len(regressions)} stages slower than the baseline by more than {args.tolerance:.0%}:")
+        for name, stage in regressions:
+            print(f"  {name}: {stage}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,1627 @@
+import sqlite3, os, re, ast, json, time, threading, hashlib
+import pandas as pd
+from datetime import datetime, timezone
+from titles import MAKES, MAKE_MATCHER, parse_titles
+
+# ---------------- CONFIG ----------------
+DB_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cars.db")
+
+# One connection per (thread, db file). This module is imported once per
+# process, so unlike globals in app.py the connections survive Streamlit reruns.
+_local = threading.local()
+
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-20000",
+    "PRAGMA busy_timeout=30000",
+)
+
+
+# ---------------- NORMALIZE ----------------
+# Raw columns keep whatever the site gave us ("$12,995", "133,000 km", "None");
+# these turn them into the typed columns used for filtering and sorting.
+_NUMBER = re.compile(r"\d[\d,]*(?:\.\d+)?")
+_YEAR = re.compile(r"\b(?:19|20)\d{2}\b")
+
+
+def _is_missing(value):
+    return value is None or str(value).strip() in ("", "None", "N/A", "nan")
+
+
+def parse_price_cents(value):
+    # Formatted dollars, e.g. Autotrader "$12,995"
+    if _is_missing(value):
+        return None
+    match = _NUMBER.search(str(value))
+    if not match:
+        return None
+    return int(round(float(match.group(0).replace(",", "")) * 100))
+
+
+def parse_kijiji_price_cents(value):
+    # Kijiji already reports price.amount in cents
+    if _is_missing(value):
+        return None
+    try:
+        return int(float(value))
+    except ValueError:
+        return None
+
+
+def parse_mileage_km(value):
+    if _is_missing(value):
+        return None
+    match = _NUMBER.search(str(value))
+    if not match:
+        return None
+    return int(float(match.group(0).replace(",", "")))
+
+
+def parse_model_year(value):
+    if _is_missing(value):
+        return None
+    match = _YEAR.search(str(value))
+    return int(match.group(0)) if match else None
+
+
+def parse_iso_ts(value):
+    # ISO 8601 with offset or trailing Z -> UTC epoch seconds
+    if _is_missing(value):
+        return None
+    try:
+        dt = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return int(dt.timestamp())
+
+
+# Vehicle fingerprint: the same car listed twice (on both sites, or reposted)
+# has the same make/model/year and nearly the same mileage and price.
+# Makes and models are compared as lowercase alphanumerics, so Kijiji's
+# "mercedes"/"cclass" slugs meet Autotrader's "Mercedes-Benz"/"C-Class".
+MAKE_ALIASES = {"mercedes": "mercedesbenz", "alpharomeo": "alfaromeo", "volkwagen": "volkswagen",
+                "vw": "volkswagen", "chevy": "chevrolet"}
+PLACEHOLDER_KEYS = {"", "none", "nan", "othrmake", "othrmdl", "other"}
+MILEAGE_BAND_KM = 5000
+PRICE_BAND_CENTS = 50000
+_NON_ALNUM = re.compile(r"[^0-9a-z]+")
+_IMAGE_URL = re.compile(r"https?://[^\s'\",\]]+")
+_IMAGE_SIZE_SUFFIX = re.compile(r"/\d+x\d+\.\w+$")
+
+
+def _alnum_key(value):
+    key = _NON_ALNUM.sub("", str(value or "").lower())
+    return None if key in PLACEHOLDER_KEYS else key
+
+
+_CANONICAL_MAKES = {}
+for _make in MAKES:
+    _CANONICAL_MAKES.setdefault(_alnum_key(_make), _make)
+
+
+def canonical_make(brand, title=None):
+    # The market guide's spelling of a make, so Kijiji's "mercedes" slug and
+    # Autotrader's "Mercedes-Benz" are stored, filtered and listed as one.
+    # Placeholders ("othrmake") fall back to the make named in the title;
+    # makes the guide doesn't know are kept as given.
+    key = _alnum_key(brand)
+    if key:
+        return _CANONICAL_MAKES.get(MAKE_ALIASES.get(key, key), brand)
+    return MAKE_MATCHER.find(title) if title else None
+
+
+def vehicle_fingerprint(brand, model, model_year, mileage_km, price_cents):
+    make, model = _alnum_key(brand), _alnum_key(model)
+    if not make or not model or not model_year or model_year < 1901:
+        return None
+    make = MAKE_ALIASES.get(make, make)
+    mileage_band = "" if mileage_km is None else int(mileage_km) // MILEAGE_BAND_KM
+    price_band = "" if not price_cents else int(price_cents) // PRICE_BAND_CENTS
+    return f"{make}|{model}|{int(model_year)}|{mileage_band}|{price_band}"
+
+
+def image_urls(value):
+    # Kijiji images are stored as a JSON list (str(list) in older rows),
+    # Autotrader's as a single URL or "N/A"
+    if not isinstance(value, str):
+        return []
+    value = value.strip()
+    if value.startswith("["):
+        try:
+            urls = json.loads(value)
+        except ValueError:
+            try:
+                urls = ast.literal_eval(value)
+            except (ValueError, SyntaxError):
+                return []
+        return [url for url in urls if isinstance(url, str) and url.startswith("http")] if isinstance(urls, list) else []
+    return [value] if value.startswith("http") else []
+
+
+def image_hash(value):
+    # First photo URL without query string or thumbnail size, hashed; a
+    # reposted ad usually reuses its photos.
+    match = _IMAGE_URL.search(str(value or ""))
+    if not match:
+        return None
+    url = _IMAGE_SIZE_SUFFIX.sub("", match.group(0).split("?", 1)[0])
+    return hashlib.sha1(url.encode()).hexdigest()[:16]
+
+
+# Deal score: how far under the market-guide average a listing is priced
+# (0.2 = 20% under, negative = over), nudged by mileage against what is
+# typical for the car's age.
+KM_PER_YEAR = 20000
+MILEAGE_WEIGHT = 0.01    # per 10,000 km under (+) or over (-) the typical mileage
+MILEAGE_CAP = 0.15
+MIN_PRICE_RATIO = 0.2    # cheaper than this is a placeholder price ($1, "0"), not a deal
+
+
+def deal_score(price_cents, guide_avg_cents, mileage_km=None, model_year=None):
+    if not price_cents or not guide_avg_cents or price_cents < guide_avg_cents * MIN_PRICE_RATIO:
+        return None
+    score = (guide_avg_cents - price_cents) / guide_avg_cents
+    if mileage_km is not None and model_year:
+        typical_km = max(1, datetime.now().year - int(model_year)) * KM_PER_YEAR
+        adjust = (typical_km - mileage_km) / 10000 * MILEAGE_WEIGHT
+        score += max(-MILEAGE_CAP, min(MILEAGE_CAP, adjust))
+    return round(score, 4)
+
+
+def parse_local_ts(value):
+    # created_at was written with datetime.now(), i.e. server local time
+    if _is_missing(value):
+        return None
+    try:
+        return int(time.mktime(time.strptime(str(value), "%Y-%m-%d %H:%M:%S")))
+    except ValueError:
+        return None
+
+
+# ---------------- CONNECTION ----------------
+def get_conn(db_file=DB_FILE):
+    conns = getattr(_local, "conns", None)
+    if conns is None:
+        conns = _local.conns = {}
+    conn = conns.get(db_file)
+    if conn is None:
+        conn = sqlite3.connect(db_file, timeout=30)
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        # Parsers are exposed to SQL so migrations backfill with the same
+        # rules the ingest path uses.
+        conn.create_function("price_cents", 1, parse_price_cents, deterministic=True)
+        conn.create_function("kijiji_price_cents", 1, parse_kijiji_price_cents, deterministic=True)
+        conn.create_function("mileage_km", 1, parse_mileage_km, deterministic=True)
+        conn.create_function("model_year", 1, parse_model_year, deterministic=True)
+        conn.create_function("iso_ts", 1, parse_iso_ts, deterministic=True)
+        conn.create_function("local_ts", 1, parse_local_ts, deterministic=True)
+        conn.create_function("deal_score", 4, deal_score)
+        conns[db_file] = conn
+    return conn
+
+
+def close_conn(db_file=DB_FILE):
+    conns = getattr(_local, "conns", {})
+    conn = conns.pop(db_file, None)
+    if conn is not None:
+        conn.close()
+
+
+# ---------------- SCHEMA ----------------
+def init_db(db_file=DB_FILE):
+    conn = get_conn(db_file)
+    with conn:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS autotrader (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                title TEXT NOT NULL,
+                price TEXT,
+                location TEXT,
+                odometer TEXT,
+                image_src TEXT,
+                ad_link TEXT,
+                created_at TEXT DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS kjiji (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                type TEXT,
+                name TEXT,
+                description TEXT,
+                image TEXT,
+                price TEXT,
+                priceCurrency TEXT,
+                url TEXT UNIQUE,
+                brand_name TEXT,
+                mileage_value TEXT,
+                mileage_unitCode TEXT,
+                model TEXT,
+                vehicleModelDate TEXT,
+                bodyType TEXT,
+                color TEXT,
+                numberOfDoors TEXT,
+                fuelType TEXT,
+                vehicleTransmission TEXT,
+                activationDate TEXT,
+                sortingDate TEXT,
+                time_since_activation,
+                created_at TEXT DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+    migrate(conn)
+
+
+# Schema version lives in PRAGMA user_version. MIGRATIONS[n] upgrades a
+# database from version n to n + 1; append new steps, never edit old ones.
+def _migration_typed_columns(conn):
+    for table, columns in (
+        ("kjiji", ["price_cents INTEGER", "mileage_km INTEGER", "model_year INTEGER",
+                   "activation_ts INTEGER", "sorting_ts INTEGER", "created_ts INTEGER"]),
+        ("autotrader", ["brand TEXT", "model TEXT", "model_year INTEGER", "price_cents INTEGER",
+                        "mileage_km INTEGER", "created_ts INTEGER"]),
+    ):
+        for column in columns:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {column}")
+
+    conn.execute("""
+        UPDATE kjiji SET
+            price_cents = kijiji_price_cents(price),
+            mileage_km = mileage_km(mileage_value),
+            model_year = model_year(vehicleModelDate),
+            activation_ts = iso_ts(activationDate),
+            sorting_ts = iso_ts(sortingDate),
+            created_ts = local_ts(created_at)
+    """)
+    conn.execute("""
+        UPDATE autotrader SET
+            price_cents = price_cents(price),
+            mileage_km = mileage_km(odometer),
+            model_year = model_year(title),
+            created_ts = local_ts(created_at)
+    """)
+
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_kjiji_brand_model_year ON kjiji (brand_name, model, model_year)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_kjiji_price ON kjiji (price_cents)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_kjiji_created ON kjiji (created_ts)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_autotrader_brand_model_year ON autotrader (brand, model, model_year)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_autotrader_price ON autotrader (price_cents)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_autotrader_created ON autotrader (created_ts)")
+
+
+def _migration_listings_view(conn):
+    # Both sources under one column set, for the combined view and the
+    # source filter of the query layer.
+    conn.execute("""
+        CREATE VIEW IF NOT EXISTS listings AS
+        SELECT
+            'Kijiji' AS source, id, name AS title, price, priceCurrency AS currency,
+            brand_name AS brand, model, vehicleModelDate, bodyType, color, fuelType,
+            vehicleTransmission, mileage_value AS odometer, image AS image_src, url AS ad_link,
+            created_at, price_cents, mileage_km, model_year, created_ts,
+            COALESCE(activation_ts, created_ts) AS listed_ts
+        FROM kjiji
+        UNION ALL
+        SELECT
+            'Autotrader' AS source, id, title, price, NULL AS currency,
+            brand, model, NULL AS vehicleModelDate, NULL AS bodyType, NULL AS color, NULL AS fuelType,
+            NULL AS vehicleTransmission, odometer, image_src, ad_link,
+            created_at, price_cents, mileage_km, model_year, created_ts,
+            created_ts AS listed_ts
+        FROM autotrader
+    """)
+
+
+def _migration_meta(conn):
+    conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER)")
+    conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('data_version', 0)")
+
+
+def _migration_scrape_runs(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS scrape_runs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            source TEXT NOT NULL,
+            trigger TEXT,
+            status TEXT NOT NULL,
+            pid INTEGER,
+            started_ts INTEGER NOT NULL,
+            finished_ts INTEGER,
+            pages INTEGER DEFAULT 0,
+            found INTEGER DEFAULT 0,
+            inserted INTEGER DEFAULT 0,
+            ignored INTEGER DEFAULT 0,
+            error TEXT,
+            log TEXT,
+            cancel_requested INTEGER DEFAULT 0
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_scrape_runs_source ON scrape_runs (source, started_ts)")
+
+
+def _migration_incremental(conn):
+    # Newest sort key seen per source/search, for incremental scrapes
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS scrape_state (
+            source TEXT NOT NULL,
+            search_key TEXT NOT NULL,
+            newest_ts INTEGER,
+            updated_ts INTEGER,
+            PRIMARY KEY (source, search_key)
+        )
+    """)
+    # Autotrader had no unique key, so every scrape appended the same cars
+    # again. Keep the first copy of each ad and make ad_link unique.
+    conn.execute("""
+        DELETE FROM autotrader
+        WHERE ad_link IS NOT NULL
+          AND id NOT IN (SELECT MIN(id) FROM autotrader WHERE ad_link IS NOT NULL GROUP BY ad_link)
+    """)
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_autotrader_ad_link ON autotrader (ad_link)")
+    bump_data_version(conn)
+
+
+def _migration_title_makes(conn):
+    # Autotrader rows scraped before brand/model were stored only have the
+    # "2019 Ford F 150" title; parse the whole column in one pass.
+    rows = pd.read_sql_query("SELECT id, title FROM autotrader WHERE brand IS NULL OR brand = ''", conn)
+    if rows.empty:
+        return
+    parsed = parse_titles(rows["title"])
+    updates = [
+        (make, None if pd.isna(model) else model, int(row_id))
+        for row_id, make, model in zip(rows["id"], parsed["make"], parsed["model"])
+        if not pd.isna(make)
+    ]
+    conn.executemany("UPDATE autotrader SET brand = ?, model = COALESCE(model, ?) WHERE id = ?", updates)
+    bump_data_version(conn)
+
+
+def _migration_api_cache(conn):
+    # Responses of third-party APIs (the market guide), keyed by request
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS api_cache (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL,
+            fetched_ts INTEGER NOT NULL,
+            expires_ts INTEGER NOT NULL,
+            accessed_ts INTEGER NOT NULL
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_api_cache_accessed ON api_cache (accessed_ts)")
+
+
+def _migration_valuations(conn):
+    # Market-guide sale prices (min/average/max, in cents) for each listing,
+    # filled in by the batch valuation job
+    for table in ("kjiji", "autotrader"):
+        for column in ("guide_min_cents INTEGER", "guide_avg_cents INTEGER", "guide_max_cents INTEGER",
+                       "valued_ts INTEGER"):
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {column}")
+    conn.execute("DROP VIEW IF EXISTS listings")
+    conn.execute("""
+        CREATE VIEW listings AS
+        SELECT
+            'Kijiji' AS source, id, name AS title, price, priceCurrency AS currency,
+            brand_name AS brand, model, vehicleModelDate, bodyType, color, fuelType,
+            vehicleTransmission, mileage_value AS odometer, image AS image_src, url AS ad_link,
+            created_at, price_cents, mileage_km, model_year, created_ts,
+            COALESCE(activation_ts, created_ts) AS listed_ts,
+            guide_min_cents, guide_avg_cents, guide_max_cents, valued_ts
+        FROM kjiji
+        UNION ALL
+        SELECT
+            'Autotrader' AS source, id, title, price, NULL AS currency,
+            brand, model, NULL AS vehicleModelDate, NULL AS bodyType, NULL AS color, NULL AS fuelType,
+            NULL AS vehicleTransmission, odometer, image_src, ad_link,
+            created_at, price_cents, mileage_km, model_year, created_ts,
+            created_ts AS listed_ts,
+            guide_min_cents, guide_avg_cents, guide_max_cents, valued_ts
+        FROM autotrader
+    """)
+
+
+
+def _migration_deal_scores(conn):
+    # Materialized deal score, kept current by set_valuations; the partial
+    # indexes serve the "best deals" query without scanning unvalued rows.
+    for table in ("kjiji", "autotrader"):
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN deal_score REAL")
+        conn.execute(f"""
+            UPDATE {table} SET deal_score = deal_score(price_cents, guide_avg_cents, mileage_km, model_year)
+            WHERE guide_avg_cents IS NOT NULL
+        """)
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_deal ON {table} (deal_score) WHERE deal_score IS NOT NULL")
+    conn.execute("DROP VIEW IF EXISTS listings")
+    conn.execute("""
+        CREATE VIEW listings AS
+        SELECT
+            'Kijiji' AS source, id, name AS title, price, priceCurrency AS currency,
+            brand_name AS brand, model, vehicleModelDate, bodyType, color, fuelType,
+            vehicleTransmission, mileage_value AS odometer, image AS image_src, url AS ad_link,
+            created_at, price_cents, mileage_km, model_year, created_ts,
+            COALESCE(activation_ts, created_ts) AS listed_ts,
+            guide_min_cents, guide_avg_cents, guide_max_cents, valued_ts, deal_score
+        FROM kjiji
+        UNION ALL
+        SELECT
+            'Autotrader' AS source, id, title, price, NULL AS currency,
+            brand, model, NULL AS vehicleModelDate, NULL AS bodyType, NULL AS color, NULL AS fuelType,
+            NULL AS vehicleTransmission, odometer, image_src, ad_link,
+            created_at, price_cents, mileage_km, model_year, created_ts,
+            created_ts AS listed_ts,
+            guide_min_cents, guide_avg_cents, guide_max_cents, valued_ts, deal_score
+        FROM autotrader
+    """)
+    bump_data_version(conn)
+
+
+
+# How each source table maps onto the canonical listings table
+LISTING_COLUMNS = [
+    ("source", "TEXT NOT NULL"), ("id", "INTEGER NOT NULL"), ("title", "TEXT"), ("price", "TEXT"),
+    ("currency", "TEXT"), ("brand", "TEXT"), ("model", "TEXT"), ("vehicleModelDate", "TEXT"),
+    ("bodyType", "TEXT"), ("color", "TEXT"), ("fuelType", "TEXT"), ("vehicleTransmission", "TEXT"),
+    ("odometer", "TEXT"), ("image_src", "TEXT"), ("ad_link", "TEXT"), ("created_at", "TEXT"),
+    ("price_cents", "INTEGER"), ("mileage_km", "INTEGER"), ("model_year", "INTEGER"), ("created_ts", "INTEGER"),
+    ("listed_ts", "INTEGER"), ("guide_min_cents", "INTEGER"), ("guide_avg_cents", "INTEGER"),
+    ("guide_max_cents", "INTEGER"), ("valued_ts", "INTEGER"), ("deal_score", "REAL"),
+]
+
+LISTING_SELECTS = {
+    "kjiji": """
+        'Kijiji', id, name, price, priceCurrency,
+        brand_name, model, vehicleModelDate, bodyType, color, fuelType,
+        vehicleTransmission, mileage_value, image, url,
+        created_at, price_cents, mileage_km, model_year, created_ts,
+        COALESCE(activation_ts, created_ts),
+        guide_min_cents, guide_avg_cents, guide_max_cents, valued_ts, deal_score
+    """,
+    "autotrader": """
+        'Autotrader', id, title, price, NULL,
+        brand, model, NULL, NULL, NULL, NULL,
+        NULL, odometer, image_src, ad_link,
+        created_at, price_cents, mileage_km, model_year, created_ts,
+        created_ts,
+        guide_min_cents, guide_avg_cents, guide_max_cents, valued_ts, deal_score
+    """,
+}
+
+
+def _migration_listings_table(conn):
+    # The combined view becomes a real table kept in step with kjiji and
+    # autotrader by triggers, i.e. written at ingest time, so combined
+    # queries are plain indexed lookups instead of a UNION ALL per read.
+    conn.execute("DROP VIEW IF EXISTS listings")
+    conn.execute(f"""
+        CREATE TABLE listings (
+            {", ".join(f"{name} {decl}" for name, decl in LISTING_COLUMNS)},
+            PRIMARY KEY (source, id)
+        )
+    """)
+    for table, source in (("kjiji", "Kijiji"), ("autotrader", "Autotrader")):
+        select = LISTING_SELECTS[table]
+        conn.execute(f"INSERT INTO listings SELECT {select} FROM {table}")
+        conn.execute(f"""
+            CREATE TRIGGER {table}_listings_insert AFTER INSERT ON {table} BEGIN
+                INSERT OR REPLACE INTO listings SELECT {select} FROM {table} WHERE id = NEW.id;
+            END
+        """)
+        conn.execute(f"""
+            CREATE TRIGGER {table}_listings_update AFTER UPDATE ON {table} BEGIN
+                DELETE FROM listings WHERE source = '{source}' AND id = OLD.id;
+                INSERT OR REPLACE INTO listings SELECT {select} FROM {table} WHERE id = NEW.id;
+            END
+        """)
+        conn.execute(f"""
+            CREATE TRIGGER {table}_listings_delete AFTER DELETE ON {table} BEGIN
+                DELETE FROM listings WHERE source = '{source}' AND id = OLD.id;
+            END
+        """)
+    conn.execute("CREATE INDEX idx_listings_created ON listings (created_ts)")
+    conn.execute("CREATE INDEX idx_listings_listed ON listings (listed_ts)")
+    conn.execute("CREATE INDEX idx_listings_price ON listings (price_cents)")
+    conn.execute("CREATE INDEX idx_listings_brand_model_year ON listings (brand COLLATE NOCASE, model, model_year)")
+    conn.execute("CREATE INDEX idx_listings_deal ON listings (deal_score) WHERE deal_score IS NOT NULL")
+
+
+def _migration_vehicles(conn):
+    # One row per physical car; listings point at it through vehicle_id and
+    # the vehicle's first listing is its canonical one.
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS vehicles (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            fingerprint TEXT NOT NULL UNIQUE,
+            source TEXT NOT NULL,
+            listing_id INTEGER NOT NULL,
+            first_seen_ts INTEGER
+        )
+    """)
+    for column in ("fingerprint TEXT", "image_hash TEXT", "vehicle_id INTEGER", "is_canonical INTEGER DEFAULT 0"):
+        conn.execute(f"ALTER TABLE listings ADD COLUMN {column}")
+    conn.execute("CREATE INDEX idx_listings_fingerprint ON listings (fingerprint)")
+    conn.execute("CREATE INDEX idx_listings_image_hash ON listings (image_hash)")
+    conn.execute("CREATE INDEX idx_listings_vehicle ON listings (vehicle_id)")
+    conn.execute("CREATE INDEX idx_listings_canonical_created ON listings (is_canonical, created_ts)")
+
+    # The triggers copied whole rows positionally, which no longer lines up
+    # with the extra columns; name the copied columns, and update in place
+    # so an edit of the source row keeps the listing's vehicle link.
+    names = ", ".join(name for name, _ in LISTING_COLUMNS)
+    for table, source in (("kjiji", "Kijiji"), ("autotrader", "Autotrader")):
+        conn.execute(f"DROP TRIGGER IF EXISTS {table}_listings_insert")
+        conn.execute(f"DROP TRIGGER IF EXISTS {table}_listings_update")
+        conn.execute(f"""
+            CREATE TRIGGER {table}_listings_insert AFTER INSERT ON {table} BEGIN
+                INSERT OR REPLACE INTO listings ({names}) SELECT {LISTING_SELECTS[table]} FROM {table} WHERE id = NEW.id;
+            END
+        """)
+        conn.execute(f"""
+            CREATE TRIGGER {table}_listings_update AFTER UPDATE ON {table} BEGIN
+                UPDATE listings SET ({names}) = (SELECT {LISTING_SELECTS[table]} FROM {table} WHERE id = NEW.id)
+                WHERE source = '{source}' AND id = OLD.id;
+            END
+        """)
+    link_vehicles(conn)
+
+
+def _migration_listing_images(conn):
+    # Photo URLs as rows (first photo at position 0) instead of a list
+    # re-parsed on every render, and the thumbnail fetched for each URL.
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS listing_images (
+            source TEXT NOT NULL,
+            listing_id INTEGER NOT NULL,
+            position INTEGER NOT NULL,
+            url TEXT NOT NULL,
+            PRIMARY KEY (source, listing_id, position)
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_listing_images_url ON listing_images (url)")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS thumbnails (
+            url TEXT PRIMARY KEY,
+            digest TEXT,
+            fetched_ts INTEGER NOT NULL,
+            error TEXT
+        )
+    """)
+    conn.execute("""
+        CREATE TRIGGER listings_images_delete AFTER DELETE ON listings BEGIN
+            DELETE FROM listing_images WHERE source = OLD.source AND listing_id = OLD.id;
+        END
+    """)
+    # Kijiji image lists were stored as str(list); rewrite them as JSON
+    rows = conn.execute("SELECT id, image FROM kjiji WHERE image LIKE '[%'").fetchall()
+    conn.executemany("UPDATE kjiji SET image = ? WHERE id = ?",
+                     [(json.dumps(image_urls(image)), listing_id) for listing_id, image in rows])
+    store_listing_images(conn, conn.execute("SELECT source, id, image_src FROM listings").fetchall())
+
+
+def _migration_observations(conn):
+    # Price/mileage history, one row per change (not per scrape): written
+    # by triggers when a listing is added or its price or mileage changes.
+    # WITHOUT ROWID stores the rows clustered by listing, in time order.
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS observations (
+            source TEXT NOT NULL,
+            listing_id INTEGER NOT NULL,
+            observed_ts INTEGER NOT NULL,
+            price_cents INTEGER,
+            mileage_km INTEGER,
+            PRIMARY KEY (source, listing_id, observed_ts)
+        ) WITHOUT ROWID
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_observations_observed ON observations (observed_ts)")
+    conn.execute("ALTER TABLE listings ADD COLUMN last_seen_ts INTEGER")
+    conn.execute("""
+        INSERT OR IGNORE INTO observations (source, listing_id, observed_ts, price_cents, mileage_km)
+        SELECT source, id, COALESCE(created_ts, 0), price_cents, mileage_km FROM listings
+    """)
+    conn.execute("""
+        CREATE TRIGGER listings_observe_insert AFTER INSERT ON listings BEGIN
+            INSERT OR REPLACE INTO observations (source, listing_id, observed_ts, price_cents, mileage_km)
+            VALUES (NEW.source, NEW.id, COALESCE(NEW.created_ts, CAST(strftime('%s', 'now') AS INTEGER)),
+                    NEW.price_cents, NEW.mileage_km);
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER listings_observe_update AFTER UPDATE OF price_cents, mileage_km ON listings
+        WHEN NEW.price_cents IS NOT OLD.price_cents OR NEW.mileage_km IS NOT OLD.mileage_km BEGIN
+            INSERT OR REPLACE INTO observations (source, listing_id, observed_ts, price_cents, mileage_km)
+            VALUES (NEW.source, NEW.id, CAST(strftime('%s', 'now') AS INTEGER), NEW.price_cents, NEW.mileage_km);
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER listings_observe_delete AFTER DELETE ON listings BEGIN
+            DELETE FROM observations WHERE source = OLD.source AND listing_id = OLD.id;
+        END
+    """)
+
+
+
+def _migration_metrics(conn):
+    # Instrumentation snapshots (see metrics.py) saved by the runner
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS metrics_snapshots (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            ts INTEGER NOT NULL,
+            process TEXT NOT NULL,
+            data TEXT NOT NULL
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_metrics_snapshots_ts ON metrics_snapshots (ts)")
+
+
+# Kijiji descriptions live in kjiji only; Autotrader pages carry none
+_FTS_DESCRIPTION = ("(SELECT NULLIF(description, 'None') FROM kjiji "
+                    "WHERE {row}.source = 'Kijiji' AND kjiji.id = {row}.id)")
+
+
+def _migration_search(conn):
+    # Full-text index of titles and descriptions, keyed by the listings
+    # rowid and kept in step by triggers. Diacritics are folded ("Citroën"
+    # matches "citroen") and 2-3 character prefixes are indexed for the
+    # prefix queries fts_query() builds.
+    conn.execute("""
+        CREATE VIRTUAL TABLE listings_fts USING fts5(
+            title, description, prefix = '2 3', tokenize = 'unicode61 remove_diacritics 2'
+        )
+    """)
+    conn.execute(f"""
+        INSERT INTO listings_fts (rowid, title, description)
+        SELECT rowid, title, {_FTS_DESCRIPTION.format(row="listings")} FROM listings
+    """)
+    # Updates from the source tables set every column, title included;
+    # updates of the scores, links and last-seen times do not touch the
+    # index. (Replaced rows: see _migration_search_replace.)
+    conn.execute(f"""
+        CREATE TRIGGER listings_fts_insert AFTER INSERT ON listings BEGIN
+            DELETE FROM listings_fts WHERE rowid = NEW.rowid;
+            INSERT INTO listings_fts (rowid, title, description)
+            VALUES (NEW.rowid, NEW.title, {_FTS_DESCRIPTION.format(row="NEW")});
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER listings_fts_update AFTER UPDATE OF title ON listings BEGIN
+            DELETE FROM listings_fts WHERE rowid = OLD.rowid;
+            INSERT INTO listings_fts (rowid, title, description)
+            VALUES (NEW.rowid, NEW.title, {_FTS_DESCRIPTION.format(row="NEW")});
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER listings_fts_delete AFTER DELETE ON listings BEGIN
+            DELETE FROM listings_fts WHERE rowid = OLD.rowid;
+        END
+    """)
+
+
+def _migration_relink_vehicles(conn):
+    # Vehicles linked before same-site listings and listings with different
+    # photos stopped merging on the fingerprint alone: link them again
+    conn.execute("UPDATE listings SET vehicle_id = NULL, is_canonical = 0")
+    conn.execute("DELETE FROM vehicles")
+    conn.execute("DELETE FROM sqlite_sequence WHERE name = 'vehicles'")
+    link_vehicles(conn)
+
+
+def _migration_search_replace(conn):
+    # The source triggers write listings with INSERT OR REPLACE, and the row
+    # a REPLACE deletes fires no delete trigger, so its index entry stayed
+    # behind (the insert trigger only cleared NEW.rowid). Drop such entries
+    # before the insert instead, and the ones already left behind.
+    conn.execute("DROP TRIGGER IF EXISTS listings_fts_insert")
+    conn.execute("""
+        CREATE TRIGGER listings_fts_replace BEFORE INSERT ON listings BEGIN
+            DELETE FROM listings_fts
+            WHERE rowid = (SELECT rowid FROM listings WHERE source = NEW.source AND id = NEW.id);
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER listings_fts_insert AFTER INSERT ON listings BEGIN
+            INSERT INTO listings_fts (rowid, title, description)
+            VALUES (NEW.rowid, NEW.title, {_FTS_DESCRIPTION.format(row="NEW")});
+        END
+    """)
+    conn.execute("DELETE FROM listings_fts WHERE rowid NOT IN (SELECT rowid FROM listings)")
+
+
+def _migration_sort_indexes(conn):
+    # One index per table and sort order on the exact key query_listings
+    # orders by, so a page is an index walk from the cursor instead of a
+    # scan and sort of the table. Orders sharing an expression (e.g. price
+    # ascending/descending use different NULL sentinels) each get their own.
+    for spec in QUERY_SOURCES.values():
+        table = spec["table"]
+        for column, direction in sorted(set(SORTS.values())):
+            conn.execute(f"""
+                CREATE INDEX IF NOT EXISTS idx_{table}_sort_{column}_{direction.lower()}
+                ON {table} ({_sort_key(column, direction)}, {", ".join(spec["tiebreak"])})
+            """)
+
+
+def _migration_canonical_makes(conn):
+    # Kijiji stored its URL slugs ("mercedes", "volkwagen", "othrmake") as
+    # the make; rewrite both sources to canonical_make so the brand filter
+    # is an exact match on the make indexes. The update triggers carry the
+    # change into listings.
+    for table, brand, title in (("kjiji", "brand_name", "name"), ("autotrader", "brand", "title")):
+        rows = conn.execute(f"SELECT id, {brand}, {title} FROM {table}").fetchall()
+        updates = []
+        for row_id, make, row_title in rows:
+            canonical = canonical_make(make, row_title)
+            # Kijiji rows hold the string 'None' for a missing make
+            if table == "kjiji":
+                canonical = str(canonical)
+            if canonical != make:
+                updates.append((canonical, row_id))
+        conn.executemany(f"UPDATE {table} SET {brand} = ? WHERE id = ?", updates)
+    conn.execute("DROP INDEX IF EXISTS idx_listings_brand_model_year")
+    conn.execute("CREATE INDEX idx_listings_brand_model_year ON listings (brand, model, model_year)")
+    bump_data_version(conn)
+
+
+def _migration_relink_stock_photos(conn):
+    # Listings merged on a shared dealer stock photo alone were different
+    # cars; photos now only link listings of the same make and year
+    _migration_relink_vehicles(conn)
+
+
+MIGRATIONS = [
+    _migration_typed_columns,
+    _migration_listings_view,
+    _migration_meta,
+    _migration_scrape_runs,
+    _migration_incremental,
+    _migration_title_makes,
+    _migration_api_cache,
+    _migration_valuations,
+    _migration_deal_scores,
+    _migration_listings_table,
+    _migration_vehicles,
+    _migration_listing_images,
+    _migration_observations,
+    _migration_metrics,
+    _migration_search,
+    _migration_relink_vehicles,
+    _migration_search_replace,
+    _migration_sort_indexes,
+    _migration_canonical_makes,
+    _migration_relink_stock_photos,
+]
+
+
+def migrate(conn):
+    # Each step and its version bump commit together or not at all. The
+    # sqlite3 module only opens transactions implicitly before DML, so DDL
+    # (ALTER TABLE, CREATE ...) would commit on its own; the step runs in
+    # an explicit transaction with implicit handling switched off instead.
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    isolation_level = conn.isolation_level
+    conn.commit()
+    conn.isolation_level = None
+    try:
+        for target, step in enumerate(MIGRATIONS[version:], start=version + 1):
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                step(conn)
+                conn.execute(f"PRAGMA user_version = {target}")
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+    finally:
+        conn.isolation_level = isolation_level
+    return len(MIGRATIONS)
+
+
+def clear_all_data(db_file=DB_FILE):
+    # One transaction: on error nothing is deleted and the error propagates
+    conn = get_conn(db_file)
+    with conn:
+        # Delete all rows
+        conn.execute("DELETE FROM autotrader")
+        conn.execute("DELETE FROM kjiji")
+        conn.execute("DELETE FROM vehicles")
+        # Rows keyed on the deleted listings (the listings triggers
+        # already clear most of them) and the incremental watermarks,
+        # which would otherwise stop the next crawl after one page
+        conn.execute("DELETE FROM observations")
+        conn.execute("DELETE FROM listing_images")
+        conn.execute("DELETE FROM thumbnails")
+        conn.execute("DELETE FROM scrape_state")
+
+        # Reset autoincrement counters
+        conn.execute("DELETE FROM sqlite_sequence WHERE name IN ('autotrader', 'kjiji', 'vehicles')")
+        bump_data_version(conn)
+    print("✅ All data cleared from 'autotrader' and 'kjiji' tables.")
+
+
+# ---------------- DATA VERSION ----------------
+# Every write that changes listings bumps meta.data_version in the same
+# transaction, so readers can key caches on it. data_version() only goes to
+# SQL when the database or WAL file changed on disk since the last call,
+# which also picks up writes made by other processes. Stored thumbnails
+# bump their own meta.thumbnail_version instead, so a thumbnail job does not
+# invalidate every cached listing query.
+_versions = {}
+
+
+def bump_data_version(conn, key="data_version"):
+    conn.execute("INSERT INTO meta (key, value) VALUES (?, 1) ON CONFLICT (key) DO UPDATE SET value = value + 1",
+                 (key,))
+
+
+def _file_signature(db_file):
+    signature = []
+    for path in (db_file, db_file + "-wal"):
+        try:
+            st = os.stat(path)
+            signature.append((st.st_mtime_ns, st.st_size))
+        except OSError:
+            signature.append(None)
+    return tuple(signature)
+
+
+def data_version(db_file=DB_FILE, key="data_version"):
+    signature = _file_signature(db_file)
+    cached = _versions.get((db_file, key))
+    if cached and cached[0] == signature:
+        return cached[1]
+    row = get_conn(db_file).execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+    version = row[0] if row else 0
+    _versions[(db_file, key)] = (signature, version)
+    return version
+
+
+def thumbnail_version(db_file=DB_FILE):
+    return data_version(db_file, key="thumbnail_version")
+
+
+# ---------------- INGEST ----------------
+KIJIJI_FIELDS = [
+    "type", "name", "description", "image", "price", "priceCurrency", "url",
+    "brand_name", "mileage_value", "mileage_unitCode", "model",
+    "vehicleModelDate", "bodyType", "color", "numberOfDoors",
+    "fuelType", "vehicleTransmission", "activationDate", "sortingDate", "time_since_activation",
+]
+
+AUTOTRADER_FIELDS = ["title", "price", "location", "odometer", "image_src", "ad_link"]
+
+
+def _bulk_insert(sql, rows, db_file):
+    # executemany inside a single transaction: one commit (and one fsync) per
+    # batch instead of one per listing. rowcount is summed over all rows and
+    # does not count rows skipped by OR IGNORE.
+    if not rows:
+        return {"inserted": 0, "ignored": 0}
+    conn = get_conn(db_file)
+    with conn:
+        cur = conn.executemany(sql, rows)
+        inserted = cur.rowcount
+        if inserted:
+            # Rows added by this batch are the ones not linked to a vehicle yet
+            store_listing_images(conn, conn.execute(
+                "SELECT source, id, image_src FROM listings WHERE vehicle_id IS NULL").fetchall())
+            link_vehicles(conn)
+            bump_data_version(conn)
+    return {"inserted": inserted, "ignored": len(rows) - inserted}
+
+
+def insert_kijiji_cars(cars, db_file=DB_FILE):
+    now = datetime.now()
+    created_at = now.strftime("%Y-%m-%d %H:%M:%S")
+    created_ts = int(now.timestamp())
+    rows = []
+    for car in cars:
+        row = []
+        for field in KIJIJI_FIELDS:
+            # The scraper emits "Description" with a capital D
+            value = car.get("Description") if field == "description" else car.get(field)
+            if field == "brand_name":
+                value = canonical_make(value, car.get("name"))
+            row.append(json.dumps(value) if isinstance(value, list) else str(value))
+        row += [
+            created_at,
+            parse_kijiji_price_cents(car.get("price")),
+            parse_mileage_km(car.get("mileage_value")),
+            parse_model_year(car.get("vehicleModelDate")),
+            parse_iso_ts(car.get("activationDate")),
+            parse_iso_ts(car.get("sortingDate")),
+            created_ts,
+        ]
+        rows.append(row)
+
+    columns = KIJIJI_FIELDS + ["created_at", "price_cents", "mileage_km", "model_year",
+                               "activation_ts", "sorting_ts", "created_ts"]
+    return _bulk_insert(f"""
+        INSERT OR IGNORE INTO kjiji ({", ".join(columns)})
+        VALUES ({", ".join("?" * len(columns))})
+    """, rows, db_file)
+
+
+def insert_autotrader_cars(cars, db_file=DB_FILE):
+    now = datetime.now()
+    created_at = now.strftime("%Y-%m-%d %H:%M:%S")
+    created_ts = int(now.timestamp())
+    rows = []
+    for car in cars:
+        row = [car.get(field) for field in AUTOTRADER_FIELDS]
+        row += [
+            created_at,
+            canonical_make(car.get("brand"), car.get("title")),
+            car.get("model") or None,
+            parse_model_year(car.get("model_year") or car.get("title")),
+            parse_price_cents(car.get("price")),
+            parse_mileage_km(car.get("odometer")),
+            created_ts,
+        ]
+        rows.append(row)
+
+    columns = AUTOTRADER_FIELDS + ["created_at", "brand", "model", "model_year", "price_cents",
+                                   "mileage_km", "created_ts"]
+    return _bulk_insert(f"""
+        INSERT OR IGNORE INTO autotrader ({", ".join(columns)})
+        VALUES ({", ".join("?" * len(columns))})
+    """, rows, db_file)
+
+
+# ---------------- READ ----------------
+# Frames handed to the app use low-cardinality categoricals and nullable
+# integers instead of object columns and float64-with-NaN.
+CATEGORY_COLUMNS = ["source", "brand", "brand_name", "bodyType", "color", "fuelType", "vehicleTransmission",
+                    "currency", "priceCurrency"]
+INT_COLUMNS = ["price_cents", "mileage_km", "model_year", "created_ts", "listed_ts", "activation_ts",
+               "sorting_ts", "guide_min_cents", "guide_avg_cents", "guide_max_cents", "valued_ts"]
+
+
+def with_dtypes(df):
+    dtypes = {column: "category" for column in CATEGORY_COLUMNS if column in df.columns}
+    # Kijiji rows store missing attributes as the string "None"
+    df = df.replace({column: {"None": None} for column in dtypes})
+    dtypes.update({column: "Int64" for column in INT_COLUMNS if column in df.columns})
+    if "deal_score" in df.columns:
+        dtypes["deal_score"] = "Float64"
+    return df.astype(dtypes)
+
+
+# ---------------- VEHICLES ----------------
+def link_vehicles(conn):
+    """Fingerprint listings not linked yet and attach each to its vehicle.
+
+    Runs inside the ingest transaction. A new listing joins the vehicle of
+    a listing with the same photo, make and year (dealers reuse stock
+    photos across different cars), else the vehicle with the same
+    fingerprint unless that is provably another car (see
+    _fingerprint_vehicle), else starts a new vehicle of which it is the
+    canonical listing. Listings without a usable fingerprint (no make,
+    model or year) are a vehicle of their own.
+    """
+    rows = conn.execute("""
+        SELECT source, id, brand, model, model_year, mileage_km, price_cents, image_src
+        FROM listings WHERE vehicle_id IS NULL
+    """).fetchall()
+    if not rows:
+        return 0
+    conn.executemany("UPDATE listings SET fingerprint = ?, image_hash = ? WHERE source = ? AND id = ?", [
+        (vehicle_fingerprint(brand, model, year, km, price), image_hash(image), source, listing_id)
+        for source, listing_id, brand, model, year, km, price, image in rows
+    ])
+    last_vehicle = conn.execute("SELECT COALESCE(MAX(id), 0) FROM vehicles").fetchone()[0]
+
+    conn.execute("""
+        UPDATE listings SET vehicle_id = (
+            SELECT other.vehicle_id FROM listings other
+            WHERE other.image_hash = listings.image_hash AND other.vehicle_id IS NOT NULL
+              AND other.brand = listings.brand AND other.model_year = listings.model_year
+            LIMIT 1
+        )
+        WHERE vehicle_id IS NULL AND image_hash IS NOT NULL
+          AND brand IS NOT NULL AND brand != 'None' AND model_year IS NOT NULL
+    """)
+    # One at a time, oldest first, so listings of the same batch see each
+    # other; the first listing of each vehicle becomes the canonical one
+    by_image = {}
+    for source, listing_id, fingerprint, photo, brand, year, created_ts in conn.execute("""
+        SELECT source, id, fingerprint, image_hash, brand, model_year, created_ts FROM listings
+        WHERE vehicle_id IS NULL ORDER BY created_ts, source, id
+    """).fetchall():
+        photo_key = (photo, brand, year) if photo and _alnum_key(brand) and year else None
+        vehicle_id = by_image.get(photo_key) if photo_key else None
+        if vehicle_id is None and fingerprint:
+            vehicle_id = _fingerprint_vehicle(conn, fingerprint, source, photo)
+        if vehicle_id is None:
+            # The fingerprint names the vehicle unless another car already has it
+            key = fingerprint if fingerprint and not conn.execute(
+                "SELECT 1 FROM vehicles WHERE fingerprint = ?", (fingerprint,)).fetchone() else None
+            vehicle_id = conn.execute("""
+                INSERT INTO vehicles (fingerprint, source, listing_id, first_seen_ts) VALUES (?, ?, ?, ?)
+            """, (key or f"listing:{source}:{listing_id}", source, listing_id, created_ts)).lastrowid
+        conn.execute("UPDATE listings SET vehicle_id = ? WHERE source = ? AND id = ?",
+                     (vehicle_id, source, listing_id))
+        if photo_key:
+            by_image.setdefault(photo_key, vehicle_id)
+    conn.execute("""
+        UPDATE listings SET is_canonical = 1
+        WHERE (source, id) IN (SELECT source, listing_id FROM vehicles WHERE id > ?)
+    """, (last_vehicle,))
+    return len(rows)
+
+
+def _fingerprint_vehicle(conn, fingerprint, source, photo):
+    # The vehicle with this fingerprint, unless it is provably another car:
+    # it already has a listing from the same site (the photo match above
+    # links reposts), or a photo different from this listing's
+    row = conn.execute("SELECT id FROM vehicles WHERE fingerprint = ?", (fingerprint,)).fetchone()
+    if row is None:
+        return None
+    conflict = conn.execute("""
+        SELECT 1 FROM listings
+        WHERE vehicle_id = ? AND (source = ? OR (image_hash IS NOT NULL AND image_hash != COALESCE(?, image_hash)))
+        LIMIT 1
+    """, (row[0], source, photo)).fetchone()
+    return None if conflict else row[0]
+
+
+# ---------------- IMAGES ----------------
+def store_listing_images(conn, rows):
+    # rows: (source, id, image_src); runs inside the caller's transaction
+    conn.executemany("INSERT OR REPLACE INTO listing_images (source, listing_id, position, url) VALUES (?, ?, ?, ?)", [
+        (source, listing_id, position, url)
+        for source, listing_id, image in rows
+        for position, url in enumerate(image_urls(image))
+    ])
+
+
+def pending_thumbnail_urls(limit=None, db_file=DB_FILE):
+    # First photos with neither a thumbnail nor a permanent failure stored
+    # (transient failures are not stored), newest listings first
+    sql = """
+        SELECT li.url FROM listing_images li
+        JOIN listings l ON l.source = li.source AND l.id = li.listing_id
+        LEFT JOIN thumbnails t ON t.url = li.url
+        WHERE li.position = 0 AND t.url IS NULL
+        GROUP BY li.url
+        ORDER BY MAX(l.created_ts) DESC
+    """
+    if limit:
+        sql += f" LIMIT {int(limit)}"
+    return [url for (url,) in get_conn(db_file).execute(sql)]
+
+
+def set_thumbnail(url, digest=None, error=None, db_file=DB_FILE):
+    conn = get_conn(db_file)
+    with conn:
+        conn.execute("INSERT OR REPLACE INTO thumbnails (url, digest, fetched_ts, error) VALUES (?, ?, ?, ?)",
+                     (url, digest, int(time.time()), error))
+        if digest:
+            bump_data_version(conn, key="thumbnail_version")
+
+
+def get_thumbnails(urls, db_file=DB_FILE):
+    # {url: digest} for the given photo URLs that have a stored thumbnail
+    urls = [url for url in set(urls) if url]
+    if not urls:
+        return {}
+    rows = get_conn(db_file).execute(
+        f"SELECT url, digest FROM thumbnails WHERE digest IS NOT NULL AND url IN ({', '.join('?' * len(urls))})",
+        urls).fetchall()
+    return dict(rows)
+
+
+# ---------------- INCREMENTAL STATE ----------------
+LISTING_URL_COLUMNS = {"Kijiji": ("kjiji", "url"), "Autotrader": ("autotrader", "ad_link")}
+
+
+def known_urls(source, urls, db_file=DB_FILE):
+    # Which of these listing URLs are already stored (both columns are unique)
+    table, column = LISTING_URL_COLUMNS[source]
+    urls = [url for url in urls if url]
+    known = set()
+    conn = get_conn(db_file)
+    for i in range(0, len(urls), 500):
+        chunk = urls[i:i + 500]
+        known.update(row[0] for row in conn.execute(
+            f"SELECT {column} FROM {table} WHERE {column} IN ({', '.join('?' * len(chunk))})", chunk))
+    return known
+
+
+def get_watermark(source, search_key, db_file=DB_FILE):
+    row = get_conn(db_file).execute(
+        "SELECT newest_ts FROM scrape_state WHERE source = ? AND search_key = ?", (source, search_key)).fetchone()
+    return row[0] if row else None
+
+
+def set_watermark(source, search_key, newest_ts, db_file=DB_FILE):
+    conn = get_conn(db_file)
+    with conn:
+        conn.execute("""
+            INSERT INTO scrape_state (source, search_key, newest_ts, updated_ts) VALUES (?, ?, ?, ?)
+            ON CONFLICT (source, search_key) DO UPDATE SET
+                newest_ts = MAX(COALESCE(newest_ts, 0), excluded.newest_ts), updated_ts = excluded.updated_ts
+        """, (source, search_key, newest_ts, int(time.time())))
+
+
+# ---------------- VALUATIONS ----------------
+def set_valuations(valuations, db_file=DB_FILE):
+    # valuations: (source, listing id, min, average, max) with prices in cents
+    now = int(time.time())
+    by_table = {}
+    for source, listing_id, low, avg, high in valuations:
+        table = LISTING_URL_COLUMNS[source][0]
+        by_table.setdefault(table, []).append((low, avg, high, now, avg, int(listing_id)))
+    conn = get_conn(db_file)
+    with conn:
+        for table, rows in by_table.items():
+            conn.executemany(f"""
+                UPDATE {table} SET guide_min_cents = ?, guide_avg_cents = ?, guide_max_cents = ?, valued_ts = ?,
+                    deal_score = deal_score(price_cents, ?, mileage_km, model_year)
+                WHERE id = ?
+            """, rows)
+        if by_table:
+            bump_data_version(conn)
+    return sum(len(rows) for rows in by_table.values())
+
+
+# ---------------- OBSERVATIONS ----------------
+# Source table columns the scrapers' normalized listings also use: URL,
+# raw price, raw mileage, and the parser for the raw price
+OBSERVED_FIELDS = {
+    "Kijiji": ("url", "price", "mileage_value", parse_kijiji_price_cents),
+    "Autotrader": ("ad_link", "price", "odometer", parse_price_cents),
+}
+
+
+def record_observations(source, cars, db_file=DB_FILE):
+    """Note the price and mileage of every listing seen on a result page.
+
+    Listings already stored whose price or mileage changed get the new
+    values (and a refreshed deal score), which appends a row to their
+    observations history; every listing seen gets its last_seen_ts moved.
+    Returns the number of listings whose price changed.
+    """
+    table, url_field, price_field, mileage_field, parse_price = (LISTING_URL_COLUMNS[source][0],
+                                                                 *OBSERVED_FIELDS[source])
+    seen = {car.get(url_field): car for car in cars if car.get(url_field)}
+    if not seen:
+        return 0
+    now = int(time.time())
+    conn = get_conn(db_file)
+    with conn:
+        urls = list(seen)
+        stored = []
+        for i in range(0, len(urls), 500):
+            chunk = urls[i:i + 500]
+            stored += conn.execute(f"""
+                SELECT id, {url_field}, price_cents, mileage_km FROM {table}
+                WHERE {url_field} IN ({', '.join('?' * len(chunk))})
+            """, chunk).fetchall()
+
+        updates, price_changes = [], 0
+        for listing_id, url, price_cents, mileage_km in stored:
+            car = seen[url]
+            new_price = parse_price(car.get(price_field))
+            new_mileage = parse_mileage_km(car.get(mileage_field))
+            # A value missing from the page keeps the stored one
+            new_price = price_cents if new_price is None else new_price
+            new_mileage = mileage_km if new_mileage is None else new_mileage
+            if (new_price, new_mileage) != (price_cents, mileage_km):
+                price_changes += new_price != price_cents
+                updates.append((str(car.get(price_field)) if new_price != price_cents else None, new_price,
+                                str(car.get(mileage_field)) if new_mileage != mileage_km else None, new_mileage,
+                                new_price, new_mileage, listing_id))
+        if updates:
+            conn.executemany(f"""
+                UPDATE {table} SET price = COALESCE(?, price), price_cents = ?,
+                    {mileage_field} = COALESCE(?, {mileage_field}), mileage_km = ?,
+                    deal_score = deal_score(?, guide_avg_cents, ?, model_year)
+                WHERE id = ?
+            """, updates)
+            bump_data_version(conn)
+        conn.executemany("UPDATE listings SET last_seen_ts = ? WHERE source = ? AND id = ?",
+                         [(now, source, listing_id) for listing_id, *_ in stored])
+    return price_changes
+
+
+def price_history(listings, db_file=DB_FILE):
+    # Observed prices of a page of listings, oldest first, in one query:
+    # {(source, id): [price_cents, ...]} for listings given as (source, id)
+    listings = [(source, int(listing_id)) for source, listing_id in listings]
+    history = {listing: [] for listing in listings}
+    if not listings:
+        return history
+    # Joined rather than "(source, listing_id) IN (VALUES ...)", which scans
+    # the whole table instead of seeking each listing's rows
+    rows = get_conn(db_file).execute(f"""
+        WITH page (source, listing_id) AS (VALUES {", ".join(["(?, ?)"] * len(listings))})
+        SELECT o.source, o.listing_id, o.price_cents FROM page
+        JOIN observations o ON o.source = page.source AND o.listing_id = page.listing_id
+        WHERE o.price_cents IS NOT NULL
+        ORDER BY o.observed_ts
+    """, [value for listing in listings for value in listing]).fetchall()
+    for source, listing_id, price_cents in rows:
+        history[(source, listing_id)].append(price_cents)
+    return history
+
+
+def price_drops(since_ts=None, min_drop=0.0, limit=50, db_file=DB_FILE):
+    """Price cuts, newest first: one row per cut, with the price before it.
+
+    since_ts limits the cuts to those observed from then on; min_drop is the
+    smallest cut as a fraction of the previous price (0.05 = 5%).
+    """
+    return pd.read_sql_query("""
+        WITH recent AS (
+            SELECT DISTINCT source, listing_id FROM observations WHERE observed_ts >= ?
+        ), changes AS (
+            SELECT o.source, o.listing_id, o.observed_ts, o.price_cents,
+                   LAG(o.price_cents) OVER (PARTITION BY o.source, o.listing_id ORDER BY o.observed_ts)
+                       AS previous_cents
+            FROM observations o JOIN recent USING (source, listing_id)
+        )
+        SELECT l.source, l.id, l.title, l.ad_link, c.previous_cents, c.price_cents, c.observed_ts AS dropped_ts,
+               1.0 - CAST(c.price_cents AS REAL) / c.previous_cents AS drop_ratio
+        FROM changes c JOIN listings l ON l.source = c.source AND l.id = c.listing_id
+        WHERE c.observed_ts >= ? AND c.previous_cents > 0 AND c.price_cents < c.previous_cents
+          AND 1.0 - CAST(c.price_cents AS REAL) / c.previous_cents >= ?
+        ORDER BY c.observed_ts DESC
+        LIMIT ?
+    """, get_conn(db_file), params=(since_ts or 0, since_ts or 0, min_drop, limit))
+
+
+def time_on_market(min_listings=3, db_file=DB_FILE):
+    """Days between listing and last sighting, per brand and model.
+
+    A listing's time on market runs from when it was listed (Kijiji's
+    activation date, else when we first stored it) to the last scrape that
+    still saw it.
+    """
+    return pd.read_sql_query("""
+        SELECT brand, model, COUNT(*) AS listings,
+               AVG(days) AS avg_days, MIN(days) AS min_days, MAX(days) AS max_days
+        FROM (
+            SELECT LOWER(brand) AS brand, LOWER(model) AS model,
+                   (COALESCE(last_seen_ts, created_ts) - COALESCE(listed_ts, created_ts)) / 86400.0 AS days
+            FROM listings
+            WHERE brand IS NOT NULL AND brand != 'None' AND model IS NOT NULL AND model != 'None'
+        )
+        GROUP BY brand, model
+        HAVING COUNT(*) >= ?
+        ORDER BY avg_days DESC
+    """, get_conn(db_file), params=(min_listings,))
+
+
+# ---------------- SCRAPE RUNS ----------------
+# One row per scrape of one source, written by runner.py and read by the
+# dashboard. Runs are not listing data, so they do not bump data_version.
+RUN_FIELDS = ("status", "pages", "found", "inserted", "ignored", "error", "log", "finished_ts")
+STALE_RUN_SECONDS = 2 * 3600
+
+
+def start_run(source, trigger="manual", db_file=DB_FILE):
+    """Record a new run of source and return its id, or None if a live run
+    of that source exists already.
+
+    The check and the insert share one IMMEDIATE transaction, so of two
+    runners started at once (e.g. a double-clicked button) only one gets
+    to run; the other waits for the write lock and then sees its row.
+    """
+    conn = get_conn(db_file)
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        if _live_run(conn, source) is not None:
+            return None
+        cur = conn.execute(
+            "INSERT INTO scrape_runs (source, trigger, status, pid, started_ts) VALUES (?, ?, 'running', ?, ?)",
+            (source, trigger, os.getpid(), int(time.time())),
+        )
+    return cur.lastrowid
+
+
+def update_run(run_id, db_file=DB_FILE, **fields):
+    fields = {k: v for k, v in fields.items() if k in RUN_FIELDS}
+    if not fields:
+        return
+    conn = get_conn(db_file)
+    with conn:
+        conn.execute(f"UPDATE scrape_runs SET {', '.join(f'{k} = ?' for k in fields)} WHERE id = ?",
+                     list(fields.values()) + [run_id])
+
+
+def finish_run(run_id, status, db_file=DB_FILE, **fields):
+    update_run(run_id, db_file=db_file, status=status, finished_ts=int(time.time()), **fields)
+
+
+def request_cancel(run_id, db_file=DB_FILE):
+    conn = get_conn(db_file)
+    with conn:
+        conn.execute("UPDATE scrape_runs SET cancel_requested = 1 WHERE id = ? AND status = 'running'", (run_id,))
+
+
+def cancel_requested(run_id, db_file=DB_FILE):
+    row = get_conn(db_file).execute("SELECT cancel_requested FROM scrape_runs WHERE id = ?", (run_id,)).fetchone()
+    return bool(row and row[0])
+
+
+def get_runs(limit=20, db_file=DB_FILE):
+    return pd.read_sql_query("SELECT * FROM scrape_runs ORDER BY id DESC LIMIT ?", get_conn(db_file), params=[limit])
+
+
+def _live_run(conn, source):
+    # A 'running' row whose process is gone (or that is older than
+    # STALE_RUN_SECONDS) was interrupted; close it out, in the caller's
+    # transaction, so the source is not blocked forever.
+    for run_id, pid, started_ts in conn.execute(
+            "SELECT id, pid, started_ts FROM scrape_runs WHERE source = ? AND status = 'running'",
+            (source,)).fetchall():
+        if time.time() - started_ts < STALE_RUN_SECONDS and pid and _pid_alive(pid):
+            return run_id
+        conn.execute("UPDATE scrape_runs SET status = 'failed', finished_ts = ?, error = ? WHERE id = ?",
+                     (int(time.time()), "runner process exited", run_id))
+    return None
+
+
+def _pid_alive(pid):
+    if os.name == "nt":
+        # os.kill(pid, 0) sends CTRL_C_EVENT on Windows; rely on the age check
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True
+    return True
+
+
+# ---------------- METRICS ----------------
+MAX_METRICS_SNAPSHOTS = 500
+
+
+def save_metrics(process, snapshot, db_file=DB_FILE):
+    conn = get_conn(db_file)
+    with conn:
+        conn.execute("INSERT INTO metrics_snapshots (ts, process, data) VALUES (?, ?, ?)",
+                     (int(time.time()), process, json.dumps(snapshot)))
+        conn.execute("""
+            DELETE FROM metrics_snapshots
+            WHERE id <= (SELECT id FROM metrics_snapshots ORDER BY id DESC LIMIT 1 OFFSET ?)
+        """, (MAX_METRICS_SNAPSHOTS,))
+
+
+def get_metrics(limit=10, db_file=DB_FILE):
+    # [(ts, process, snapshot)], newest first
+    rows = get_conn(db_file).execute(
+        "SELECT ts, process, data FROM metrics_snapshots ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+    return [(ts, process, json.loads(data)) for ts, process, data in rows]
+
+
+# ---------------- API CACHE ----------------
+# A persistent response cache shared by every session and process. Entries
+# expire after their own TTL; past max_entries the least recently read are
+# dropped. A hit records its read time only when the stored one is over
+# ACCESS_RESOLUTION old, so most reads (the dashboard's included) take no
+# write lock; eviction order is approximate to that resolution.
+ACCESS_RESOLUTION = 3600
+
+
+def cache_get(key, db_file=DB_FILE):
+    conn = get_conn(db_file)
+    now = int(time.time())
+    row = conn.execute("SELECT value, accessed_ts FROM api_cache WHERE key = ? AND expires_ts > ?",
+                       (key, now)).fetchone()
+    if row is None:
+        return None
+    value, accessed_ts = row
+    if (accessed_ts or 0) < now - ACCESS_RESOLUTION:
+        with conn:
+            conn.execute("UPDATE api_cache SET accessed_ts = ? WHERE key = ?", (now, key))
+    return json.loads(value)
+
+
+def cache_put(key, value, ttl, max_entries=5000, db_file=DB_FILE):
+    conn = get_conn(db_file)
+    now = int(time.time())
+    with conn:
+        conn.execute("""
+            INSERT INTO api_cache (key, value, fetched_ts, expires_ts, accessed_ts) VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(key) DO UPDATE SET
+                value = excluded.value, fetched_ts = excluded.fetched_ts,
+                expires_ts = excluded.expires_ts, accessed_ts = excluded.accessed_ts
+        """, (key, json.dumps(value), now, now + int(ttl), now))
+        conn.execute("DELETE FROM api_cache WHERE expires_ts <= ?", (now,))
+        conn.execute("""
+            DELETE FROM api_cache WHERE key IN (
+                SELECT key FROM api_cache ORDER BY accessed_ts DESC, fetched_ts DESC LIMIT -1 OFFSET ?
+            )
+        """, (max_entries,))
+
+
+# ---------------- QUERY ----------------
+# Filtering, sorting and paging run in SQLite against the typed columns so a
+# page costs the same no matter how many listings are stored.
+QUERY_SOURCES = {
+    "Kijiji": {"table": "kjiji", "brand": "brand_name", "model": "model",
+               "listed_ts": "COALESCE(activation_ts, created_ts)", "tiebreak": ["id"]},
+    "Autotrader": {"table": "autotrader", "brand": "brand", "model": "model",
+                   "listed_ts": "created_ts", "tiebreak": ["id"]},
+    None: {"table": "listings", "brand": "brand", "model": "model",
+           "listed_ts": "listed_ts", "tiebreak": ["source", "id"]},
+}
+
+# sort key -> (column, direction). NULLs always sort last.
+SORTS = {
+    "newest": ("created_ts", "DESC"),
+    "oldest": ("created_ts", "ASC"),
+    "price_asc": ("price_cents", "ASC"),
+    "price_desc": ("price_cents", "DESC"),
+    "mileage_asc": ("mileage_km", "ASC"),
+    "year_desc": ("model_year", "DESC"),
+    "deal": ("deal_score", "DESC"),
+}
+
+_NULLS_LAST = {"ASC": 2 ** 62, "DESC": -(2 ** 62)}
+
+
+def _sort_key(column, direction):
+    # NULLs last in either direction. The sort indexes (see
+    # _migration_sort_indexes) are built on exactly this expression.
+    return f"COALESCE({column}, {_NULLS_LAST[direction]})"
+
+
+def _listing_filters(spec, brand=None, model=None, year_min=None, year_max=None,
+                     price_min=None, price_max=None, source=None, max_age_days=None, one_per_vehicle=False):
+    where, args = [], []
+    if brand:
+        where.append(f"{spec['brand']} = ?")
+        args.append(canonical_make(brand) or brand)
+    if model:
+        # "Model starts with": % and _ typed by the user match themselves
+        where.append(f"{spec['model']} LIKE ? ESCAPE '\\'")
+        args.append(re.sub(r"([\\%_])", r"\\\1", model) + "%")
+    if year_min is not None:
+        where.append("model_year >= ?")
+        args.append(int(year_min))
+    if year_max is not None:
+        where.append("model_year <= ?")
+        args.append(int(year_max))
+    if price_min is not None:
+        where.append("price_cents >= ?")
+        args.append(int(price_min * 100))
+    if price_max is not None:
+        where.append("price_cents <= ?")
+        args.append(int(price_max * 100))
+    if source and spec["table"] == "listings":
+        where.append("source = ?")
+        args.append(source)
+    if one_per_vehicle and spec["table"] == "listings":
+        where.append("is_canonical = 1")
+    if max_age_days is not None:
+        where.append(f"{spec['listed_ts']} >= ?")
+        args.append(int(time.time() - max_age_days * 86400))
+    return where, args
+
+
+def _page_sql(view, sort, after, limit, **filters):
+    spec = QUERY_SOURCES[view]
+    column, direction = SORTS[sort]
+    sort_key = _sort_key(column, direction)
+    keys = [sort_key] + spec["tiebreak"]
+
+    where, args = _listing_filters(spec, **filters)
+    if after is not None:
+        op = "<" if direction == "DESC" else ">"
+        # The first, redundant bound lets SQLite seek into the sort index;
+        # the row-value comparison alone only filters a scan from the start
+        where.append(f"{sort_key} {op}= ?")
+        where.append(f"({', '.join(keys)}) {op} ({', '.join('?' * len(keys))})")
+        args.append(after[0])
+        args.extend(after)
+
+    sql = f"SELECT *, {sort_key} AS _sort_key FROM {spec['table']}"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += f" ORDER BY {', '.join(f'{key} {direction}' for key in keys)} LIMIT ?"
+    # Fetch one extra row to know whether another page exists
+    return sql, args + [limit + 1]
+
+
+def query_listings(view=None, sort="newest", after=None, limit=20, db_file=DB_FILE, **filters):
+    """Return one page of listings and the cursor for the next page.
+
+    ``view`` picks the table ("Kijiji", "Autotrader") or the combined
+    ``listings`` view (None), where the ``source`` filter also applies.
+    ``after`` is the cursor returned by the previous call; the next cursor is
+    None on the last page.
+    """
+    sql, args = _page_sql(view, sort, after, limit, **filters)
+    cur = get_conn(db_file).execute(sql, args)
+    columns = [d[0] for d in cur.description]
+    rows = cur.fetchall()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = dict(zip(columns, rows[-1]))
+        next_cursor = tuple(last[key] for key in ["_sort_key"] + QUERY_SOURCES[view]["tiebreak"])
+    df = pd.DataFrame.from_records(rows, columns=columns).drop(columns="_sort_key")
+    return df, next_cursor
+
+
+def top_deals(limit=10, view=None, db_file=DB_FILE, **filters):
+    # Best-scored listings first. Unlike query_listings' NULLs-last sort key,
+    # the bare deal_score order can walk the partial deal index.
+    spec = QUERY_SOURCES[view]
+    where, args = _listing_filters(spec, **filters)
+    where.insert(0, "deal_score IS NOT NULL")
+    sql = f"SELECT * FROM {spec['table']} WHERE {' AND '.join(where)} ORDER BY deal_score DESC LIMIT ?"
+    return with_dtypes(pd.read_sql_query(sql, get_conn(db_file), params=args + [limit]))
+
+
+def count_listings(view=None, db_file=DB_FILE, **filters):
+    spec = QUERY_SOURCES[view]
+    where, args = _listing_filters(spec, **filters)
+    sql = f"SELECT COUNT(*) FROM {spec['table']}"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    return get_conn(db_file).execute(sql, args).fetchone()[0]
+
+
+# ---------------- SEARCH ----------------
+# Ranking weight of a title match against a description match
+TITLE_WEIGHT = 5.0
+SNIPPET_TOKENS = 16
+
+# Letters and digits, as the unicode61 tokenizer splits them
+_FTS_TOKEN = re.compile(r"[^\W_]+")
+_FTS_WORD = re.compile(r"[^\W_]+(?:[-'.][^\W_]+)*")
+
+
+def fts_query(text):
+    """Turn free text into an FTS5 query: every word must match, as a prefix.
+
+    Quoting each word keeps FTS5 operators and punctuation in the input from
+    raising syntax errors; hyphenated words ("C-Class") become phrases.
+    Returns None when the text has no words.
+    """
+    terms = []
+    for word in _FTS_WORD.findall(text or ""):
+        terms.append('"' + " ".join(_FTS_TOKEN.findall(word)) + '"*')
+    return " ".join(terms) or None
+
+
+def search_listings(text, limit=50, highlight=("<mark>", "</mark>"), db_file=DB_FILE, **filters):
+    """Listings whose title or description match `text`, best match first.
+
+    Takes the filters of query_listings' combined view. Adds a `snippet`
+    column: the best-matching passage with the matched words wrapped in
+    `highlight`. Ranked by bm25, title matches weighted above descriptions.
+    """
+    query = fts_query(text)
+    if query is None:
+        query, limit = '""', 0   # no words: no rows, same columns
+    where, args = _listing_filters(QUERY_SOURCES[None], **filters)
+    where.insert(0, "listings_fts MATCH ?")
+    sql = f"""
+        SELECT listings.*, snippet(listings_fts, -1, ?, ?, '…', {SNIPPET_TOKENS}) AS snippet
+        FROM listings_fts JOIN listings ON listings.rowid = listings_fts.rowid
+        WHERE {" AND ".join(where)}
+        ORDER BY bm25(listings_fts, {TITLE_WEIGHT}, 1.0)
+        LIMIT ?
+    """
+    params = list(highlight) + [query] + args + [limit]
+    return with_dtypes(pd.read_sql_query(sql, get_conn(db_file), params=params))
+
+
+def get_brands(db_file=DB_FILE):
+    # Makes are stored canonical (see canonical_make), so each is listed once
+    rows = get_conn(db_file).execute("""
+        SELECT DISTINCT brand FROM listings WHERE brand IS NOT NULL AND brand != 'None'
+        ORDER BY brand COLLATE NOCASE
+    """).fetchall()
+    return [brand for (brand,) in rows]
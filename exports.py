@@ -0,0 +1,106 @@
+import csv, io
+from openpyxl import Workbook
+from db import DB_FILE, get_conn
+
+# pyarrow is optional; Parquet export is offered only when it is installed
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+# ---------------- CONFIG ----------------
+EXPORT_QUERIES = {
+    "Autotrader": ("autotrader", "SELECT * FROM autotrader ORDER BY id ASC"),
+    "Kijiji": ("kjiji", "SELECT * FROM kjiji ORDER BY id ASC"),
+    "Combined": ("listings", "SELECT * FROM listings ORDER BY created_ts DESC"),
+}
+
+EXPORT_FORMATS = {
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+CHUNK_SIZE = 5000
+
+
+def available_formats():
+    return [fmt for fmt in EXPORT_FORMATS if fmt != "parquet" or pa is not None]
+
+
+# ---------------- STREAMING ----------------
+# Exports read the table straight from a cursor in fixed-size chunks, so no
+# DataFrame of the whole table is ever built.
+def iter_chunks(source, chunk_size=CHUNK_SIZE, db_file=DB_FILE):
+    _, sql = EXPORT_QUERIES[source]
+    cur = get_conn(db_file).execute(sql)
+    while True:
+        rows = cur.fetchmany(chunk_size)
+        if not rows:
+            break
+        yield rows
+
+
+def export_columns(source, db_file=DB_FILE):
+    table, _ = EXPORT_QUERIES[source]
+    return [(row[1], row[2]) for row in get_conn(db_file).execute(f"PRAGMA table_info({table})")]
+
+
+def export_csv(source, db_file=DB_FILE):
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow([name for name, _ in export_columns(source, db_file)])
+    for rows in iter_chunks(source, db_file=db_file):
+        writer.writerows(rows)
+    return output.getvalue().encode("utf-8")
+
+
+def export_excel(source, db_file=DB_FILE):
+    # write_only workbooks stream rows to the sheet instead of keeping a cell
+    # object per value, which is where openpyxl spends most of its time.
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(source)
+    ws.append([name for name, _ in export_columns(source, db_file)])
+    for rows in iter_chunks(source, db_file=db_file):
+        for row in rows:
+            ws.append(row)
+    output = io.BytesIO()
+    wb.save(output)
+    return output.getvalue()
+
+
+def export_parquet(source, db_file=DB_FILE):
+    if pa is None:
+        raise RuntimeError("Parquet export needs pyarrow (pip install pyarrow)")
+
+    # Stored values are loosely typed, so pin the schema from the declared
+    # column types and write one row group per chunk.
+    columns = export_columns(source, db_file)
+    fields, casts = [], []
+    for name, decltype in columns:
+        if "INT" in decltype.upper() or name.endswith("_ts"):
+            fields.append(pa.field(name, pa.int64()))
+            casts.append(lambda v: None if v is None else int(v))
+        elif "REAL" in decltype.upper():
+            fields.append(pa.field(name, pa.float64()))
+            casts.append(lambda v: None if v is None else float(v))
+        else:
+            fields.append(pa.field(name, pa.string()))
+            casts.append(lambda v: None if v is None else str(v))
+    schema = pa.schema(fields)
+
+    output = io.BytesIO()
+    with pq.ParquetWriter(output, schema) as writer:
+        for rows in iter_chunks(source, db_file=db_file):
+            arrays = [pa.array([cast(row[i]) for row in rows], type=field.type)
+                      for i, (field, cast) in enumerate(zip(fields, casts))]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+    return output.getvalue()
+
+
+EXPORTERS = {"xlsx": export_excel, "csv": export_csv, "parquet": export_parquet}
+
+
+def export(source, fmt, db_file=DB_FILE):
+    return EXPORTERS[fmt](source, db_file=db_file)
@@ -0,0 +1,302 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+from db import DB_FILE, insert_kijiji_cars, known_urls, get_watermark, set_watermark, parse_iso_ts, record_observations
+from scraping import make_session, RateLimiter, RetryPolicy, WriteQueue, extract_next_data
+import metrics
+
+# ---------------- CONFIG ----------------
+BASE_URL = "https://www.kijiji.ca"
+
+cookies = {
+    'kjses': 'a3ada55c-3dda-4d3b-a2f1-5a2dc3e6d11e^MSym5/LO9nctRVl8JS0kFA==',
+    'machId': '22fb321cba3b00c1b9e5ec088612772657052a66147091639177d4bb1d9b30c7619ed61ccc0c45ded10273971642021362cab9ba47cc83305e4d338bf26682f3',
+    'up': '%7B%22ln%22%3A%22725948023%22%2C%22ls%22%3A%22sv%3DLIST%26sf%3DdateDesc%22%7D',
+}
+
+headers = {
+    'Host': 'www.kijiji.ca',
+    'Cache-Control': 'max-age=0',
+    'Sec-Ch-Ua': '"Chromium";v="139", "Not;A=Brand";v="99"',
+    'Sec-Ch-Ua-Mobile': '?0',
+    'Sec-Ch-Ua-Platform': '"Windows"',
+    'Accept-Language': 'en-US,en;q=0.9',
+    'Upgrade-Insecure-Requests': '1',
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/139.0.0.0 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7',
+    'Sec-Fetch-Site': 'none',
+    'Sec-Fetch-Mode': 'navigate',
+    'Sec-Fetch-User': '?1',
+    'Sec-Fetch-Dest': 'document',
+    # 'Accept-Encoding': 'gzip, deflate, br',
+    'Priority': 'u=0, i',
+}
+
+params = {
+    'for-sale-by': 'ownr',
+    'price': '0__',
+    'view': 'list',
+}
+
+# Kijiji search paths are /b-<category>/<region>/[page-N/]c<category id>l<location id>
+CATEGORIES = {
+    "cars-trucks": 174,
+}
+
+REGIONS = {
+    "ontario": 9004,
+    "quebec": 9001,
+    "nova-scotia": 9002,
+    "alberta": 9003,
+    "new-brunswick": 9005,
+    "manitoba": 9006,
+    "british-columbia": 9007,
+    "newfoundland": 9008,
+    "saskatchewan": 9009,
+}
+
+# Parsed pages waiting for the database writer; fetching pauses beyond this
+WRITE_QUEUE_PAGES = 8
+
+
+def search_url(region="ontario", category="cars-trucks", page=1):
+    page_part = f"page-{page}/" if page > 1 else ""
+    return f"{BASE_URL}/b-{category}/{region}/{page_part}c{CATEGORIES[category]}l{REGIONS[region]}"
+
+
+# ---------------- PARSE ----------------
+# Parse ISO date
+def parse_kijiji_date(date_str):
+    if not date_str:
+        return None
+    try:
+        return datetime.strptime(date_str, "%Y-%m-%dT%H:%M:%S.%fZ").replace(tzinfo=timezone.utc)
+    except ValueError:
+        return datetime.strptime(date_str, "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=timezone.utc)
+
+
+# Listings are normalized entries of the Apollo client cache, keyed
+# "AutosListing:<id>", which Next.js ships in the page props.
+LISTING_PREFIX = "AutosListing:"
+APOLLO_CACHE_PATHS = [
+    ("props", "pageProps", "__APOLLO_STATE__"),
+    ("props", "pageProps", "apolloState"),
+    ("props", "apolloState"),
+]
+
+
+def apollo_cache(data):
+    for path in APOLLO_CACHE_PATHS:
+        node = data
+        for key in path:
+            node = node.get(key) if isinstance(node, dict) else None
+        if isinstance(node, dict):
+            return node
+    return None
+
+
+def iter_autos_listings(obj):
+    # Fallback for pages whose cache is not where we expect it: an explicit
+    # stack walk of the whole tree, yielding each listing once.
+    seen = set()
+    stack = [obj]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, dict):
+            for k, v in node.items():
+                if isinstance(k, str) and k.startswith(LISTING_PREFIX):
+                    if k not in seen:
+                        seen.add(k)
+                        yield v
+                elif isinstance(v, (dict, list)):
+                    stack.append(v)
+        elif isinstance(node, list):
+            stack.extend(node)
+
+
+def find_autos_listings(data):
+    cache = apollo_cache(data)
+    if cache is not None:
+        listings = [v for k, v in cache.items() if k.startswith(LISTING_PREFIX)]
+        if listings:
+            return listings
+    return list(iter_autos_listings(data))
+
+
+def normalize_listing(listing, now):
+    # canonicalName -> first canonical value, built once per listing
+    attrs = {attr.get("canonicalName"): (attr.get("canonicalValues") or [None])[0]
+             for attr in (listing.get("attributes") or {}).get("all") or []}
+    get_attr = attrs.get
+
+    activation = parse_kijiji_date(listing.get("activationDate"))
+    sorting = parse_kijiji_date(listing.get("sortingDate"))
+
+    # Calculate time since activation and difference between sorting and activation
+    time_since_activation = (now - activation) if activation else None
+    sorting_diff = (sorting - activation) if (sorting and activation) else None
+
+    return {
+        "type": listing.get("__typename"),
+        "name": listing.get("title"),
+        "Description": listing.get("description"),
+        "image": listing.get("imageUrls", [None]),
+        "price": listing.get("price", {}).get("amount"),
+        "priceCurrency": "CAD",
+        "url": listing.get("url"),
+        "brand_name": get_attr("carmake"),
+        "mileage_value": get_attr("carmileageinkms"),
+        "mileage_unitCode": "KMT",
+        "model": get_attr("carmodel"),
+        "vehicleModelDate": get_attr("caryear"),
+        "bodyType": get_attr("carbodytype"),
+        "color": get_attr("carcolor"),
+        "numberOfDoors": get_attr("noofdoors"),
+        "fuelType": get_attr("carfueltype"),
+        "vehicleTransmission": get_attr("cartransmission"),
+        "activationDate": activation.isoformat() if activation else None,
+        "sortingDate": sorting.isoformat() if sorting else None,
+        "time_since_activation": str(time_since_activation) if time_since_activation else None,
+        "activation_to_sorting_diff": str(sorting_diff) if sorting_diff else None
+    }
+
+
+def extract_listings(html):
+    data = extract_next_data(html)
+    if data is None:
+        raise Exception("Could not find embedded JSON")
+
+    return find_autos_listings(data)
+
+
+def parse_listings(html):
+    # Current UTC time
+    now = datetime.now(timezone.utc)
+    listings = [normalize_listing(listing, now) for listing in extract_listings(html)]
+
+    # Sort by activationDate (newest first)
+    listings.sort(key=lambda x: x["activationDate"] or "", reverse=True)
+    return listings
+
+
+# ---------------- CRAWL ----------------
+def crawl(regions=("ontario",), categories=("cars-trucks",), pages=1, concurrency=4,
+          rate_per_host=2.0, incremental=False, on_page=None, policy=None, on_retry=None,
+          stop_event=None, fixtures=None, record=False, db_file=DB_FILE):
+    """Fetch result pages of every region/category path concurrently.
+
+    Full mode fetches pages 1..pages of every path in parallel. Incremental
+    mode walks each path from page 1 (paths in parallel, pages in order),
+    only normalizes and inserts listings whose URL is not stored yet, and
+    stops once a page reaches the newest sortingDate recorded for that path
+    or brings nothing new; `pages` is then the upper bound.
+
+    Pages stream through two stages: `concurrency` workers fetch, parse
+    and normalize, and hand each page to a single writer thread through a
+    bounded queue (WRITE_QUEUE_PAGES), so writing overlaps with fetching
+    and only the pages in flight are held in memory however many are
+    crawled. on_page(result) is called, on the writer thread, for every
+    page once written, with its url, status and found/new/inserted/ignored
+    counts. Failed fetches are retried by policy inside their worker, so one
+    page backing off does not hold up the others; setting stop_event skips
+    the pages not started yet. fixtures and record are passed to
+    scraping.make_session.
+    """
+    policy = policy or RetryPolicy()
+    session = make_session(headers=headers, cookies=cookies, pool_size=concurrency,
+                           fixtures=fixtures, record=record)
+    limiter = RateLimiter(rate_per_host)
+    totals = {"pages": 0, "failed": 0, "found": 0, "new": 0, "inserted": 0, "ignored": 0, "price_changes": 0}
+
+    def scrape_page(url):
+        # Fetch stage: the page's HTML and JSON are dropped once normalized;
+        # only the listing rows go on to the writer
+        result = {"url": url, "status": None, "found": 0, "new": 0, "inserted": 0, "ignored": 0,
+                  "price_changes": 0, "newest_ts": None, "oldest_ts": None}
+        seen, listings = None, None
+        try:
+            if stop_event is not None and stop_event.is_set():
+                result["error"] = "cancelled"
+                return result
+            response = policy.request(session, url, limiter=limiter, on_retry=on_retry,
+                                      stop_event=stop_event, params=params)
+            result["status"] = response.status_code
+            if response.status_code != 200:
+                return result
+
+            with metrics.timed("parse", source="Kijiji"):
+                raw = extract_listings(response.text)
+            del response
+            sort_keys = [ts for ts in (parse_iso_ts(listing.get("sortingDate")) for listing in raw) if ts]
+            if sort_keys:
+                result["newest_ts"], result["oldest_ts"] = max(sort_keys), min(sort_keys)
+            known = known_urls("Kijiji", [listing.get("url") for listing in raw], db_file=db_file) if incremental else set()
+
+            now = datetime.now(timezone.utc)
+            with metrics.timed("normalize", source="Kijiji"):
+                seen = [normalize_listing(listing, now) for listing in raw]
+            listings = [listing for listing in seen if listing["url"] not in known]
+            listings.sort(key=lambda x: x["activationDate"] or "", reverse=True)
+            result.update(found=len(raw), new=len(listings))
+        except Exception as e:
+            result["error"] = str(e)
+        finally:
+            writer.submit(write_page, result, seen, listings)
+        return result
+
+    def write_page(result, seen, listings):
+        # Write stage, on the writer thread only: no lock around totals
+        try:
+            if seen is not None:
+                with metrics.timed("sql_write", source="Kijiji"):
+                    result.update(insert_kijiji_cars(listings, db_file=db_file))
+                    # Known listings too: a price cut does not make a listing new
+                    result["price_changes"] = record_observations("Kijiji", seen, db_file=db_file)
+        except Exception as e:
+            result["error"] = str(e)
+        finally:
+            for key in ("found", "inserted", "ignored", "price_changes"):
+                metrics.count(f"listings_{key}", result[key], source="Kijiji")
+            totals["pages"] += 1
+            totals["failed"] += result["status"] != 200
+            for key in ("found", "new", "inserted", "ignored", "price_changes"):
+                totals[key] += result[key]
+            if on_page:
+                on_page(result)
+
+    def scrape_path(region, category):
+        search_key = f"{category}/{region}"
+        watermark = get_watermark("Kijiji", search_key, db_file=db_file)
+        newest, caught_up, results = None, watermark is None, []
+        for page in range(1, pages + 1):
+            result = scrape_page(search_url(region, category, page))
+            results.append(result)
+            # A page that failed to fetch or parse says nothing about what
+            # lies beyond it, even though it brought nothing new
+            if result["status"] != 200 or result.get("error"):
+                caught_up = False
+                break
+            newest = max(filter(None, (newest, result["newest_ts"])), default=None)
+            if not result["new"] or (watermark and result["oldest_ts"] and result["oldest_ts"] <= watermark):
+                caught_up = True
+                break
+        # Only move the watermark when every newer listing has been seen,
+        # otherwise the next run would stop before reaching the gap. Queued
+        # behind the path's pages, so it moves once they are written, and
+        # not at all if one of them failed to write.
+        if newest and caught_up:
+            writer.submit(advance_watermark, search_key, newest, results)
+
+    def advance_watermark(search_key, newest, results):
+        if not any(result.get("error") for result in results):
+            set_watermark("Kijiji", search_key, newest, db_file=db_file)
+
+    with session, WriteQueue(WRITE_QUEUE_PAGES, name="kijiji-writer") as writer, \
+            ThreadPoolExecutor(max_workers=concurrency) as pool:
+        if incremental:
+            futures = [pool.submit(scrape_path, region, category) for category in categories for region in regions]
+        else:
+            futures = [pool.submit(scrape_page, search_url(region, category, page))
+                       for category in categories for region in regions for page in range(1, pages + 1)]
+        for future in as_completed(futures):
+            future.result()
+    return totals
@@ -0,0 +1,237 @@
+import re
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlencode
+import pandas as pd
+import requests
+from db import DB_FILE, get_conn, cache_get, cache_put, set_valuations, parse_mileage_km, parse_model_year
+from scraping import make_session, RetryPolicy
+from titles import MAKE_MATCHER, model_matcher
+import metrics
+
+# ---------------- CONFIG ----------------
+API_URL = "https://enterprise-api.kdp.kardataservices.com/vehicle-retail-data"
+
+MODELS_TTL = 24 * 3600   # model names per make change rarely
+GUIDE_TTL = 6 * 3600
+CACHE_MAX_ENTRIES = 5000
+
+# Listings within the same 10,000 km share one market-guide query
+ODOMETER_BUCKET = 10000
+ODOMETER_MARGIN = 5000
+
+SALE_DATE_FROM = '2025-08-02'
+SALE_DATE_TO = '2025-10-31'
+
+
+class MarketGuideError(Exception):
+    pass
+
+
+def api_headers(token):
+    return {
+        'Host': 'enterprise-api.kdp.kardataservices.com',
+        'Sec-Ch-Ua-Platform': '"Windows"',
+        'Authorization': f'Bearer {token}',
+        'Accept-Language': 'en-US,en;q=0.9',
+        'Sec-Ch-Ua': '"Chromium";v="141", "Not?A_Brand";v="8"',
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/141.0.0.0 Safari/537.36',
+        'Sec-Ch-Ua-Mobile': '?0',
+        'Accept': '*/*',
+        'Origin': 'https://app.openlane.ca',
+        'Sec-Fetch-Site': 'cross-site',
+        'Sec-Fetch-Mode': 'cors',
+        'Sec-Fetch-Dest': 'empty',
+        'Referer': 'https://app.openlane.ca/',
+        # 'Accept-Encoding': 'gzip, deflate, br',
+        'Priority': 'u=1, i',
+    }
+
+
+def parse_token(text):
+    # The token is pasted as a copied "Authorization: Bearer ..." header
+    match = re.search(r'Authorization:\s*Bearer\s+([A-Za-z0-9\-\._]+)', text or "")
+    return match.group(1) if match else None
+
+
+# ---------------- FETCH ----------------
+def cache_key(endpoint, params):
+    # Same query in any parameter order, case or spacing -> same entry. The
+    # token is deliberately not part of the key.
+    normalized = sorted((k, str(v).strip().lower()) for k, v in params.items() if v is not None)
+    return f"marketguide:{endpoint}?{urlencode(normalized)}"
+
+
+def fetch(endpoint, params, token, ttl, session=None, policy=None, db_file=DB_FILE):
+    # session/policy: the batch job's pooled session and retry policy; a
+    # single lookup from the page makes one plain request.
+    key = cache_key(endpoint, params)
+    data = cache_get(key, db_file=db_file)
+    metrics.count("marketguide_cache", endpoint=endpoint, result="miss" if data is None else "hit")
+    if data is not None:
+        return data
+    policy = policy or RetryPolicy(max_attempts=1)
+    with metrics.timed("marketguide_call", endpoint=endpoint):
+        response = policy.request(session or requests, f"{API_URL}/{endpoint}", params=params,
+                                  headers=api_headers(token), verify=False, timeout=30)
+    if response.status_code != 200:
+        raise MarketGuideError(f"market guide returned HTTP {response.status_code}")
+    data = response.json()
+    cache_put(key, data, ttl, max_entries=CACHE_MAX_ENTRIES, db_file=db_file)
+    return data
+
+
+def get_models(make, token, session=None, policy=None, db_file=DB_FILE):
+    params = {'yearMin': '1940', 'yearMax': '2027', 'makeNames': make}
+    return fetch("marketguide/models", params, token, MODELS_TTL, session, policy, db_file=db_file)['modelNames']
+
+
+def odometer_bucket(odometer_km):
+    # Upper odometer bound, rounded up to the bucket so nearby listings share it
+    if odometer_km is None:
+        return None
+    limit = odometer_km + ODOMETER_MARGIN
+    return -(-limit // ODOMETER_BUCKET) * ODOMETER_BUCKET
+
+
+def get_market_guide(make, model, year, odometer_max, token, session=None, policy=None, db_file=DB_FILE):
+    """Sale-price aggregates (priceAggMin/Ave/Max, ...) for a make/model/year/odometer bucket."""
+    params = {
+        'teamId': 'ompProd',
+        'makeNames': make,
+        'modelNames': model,
+        'yearMin': str(year - 1),
+        'yearMax': '2027',
+        'odometerMin': '0',
+        'odometerMax': odometer_max,
+        'saleDateFrom': SALE_DATE_FROM,
+        'saleDateTo': SALE_DATE_TO,
+        'sortBy': 'sale_date',
+        'sortOrder': 'desc',
+        'page': '0',
+        'size': '10',
+        'countryCode': 'CA',
+        'organizationId': 'a10514a4-a594-4736-bcc8-3978ec88145a',
+    }
+    data = fetch("marketguide", params, token, GUIDE_TTL, session, policy, db_file=db_file)
+    return {k: v for k, v in data.items() if k != 'marketGuideVehicles'}
+
+
+def market_guide_for_title(title, odometer, token, make=None, db_file=DB_FILE):
+    """Look up the market guide for a listing from its title and odometer.
+
+    Raises MarketGuideError when the make, model or year cannot be told from
+    the title. Repeated lookups are answered from the api_cache table.
+    """
+    if not isinstance(make, str) or not make:
+        make = MAKE_MATCHER.find(title)
+    if not make:
+        raise MarketGuideError("no make matched !!!")
+    model = model_matcher(tuple(get_models(make, token, db_file=db_file))).find(title)
+    if not model:
+        raise MarketGuideError("no model matched !!!")
+    year = parse_model_year(title)
+    if not year:
+        raise MarketGuideError("no year matched !!!")
+    return get_market_guide(make, model, year, odometer_bucket(parse_mileage_km(odometer)), token, db_file=db_file)
+
+
+# ---------------- VALUATION ----------------
+def _cents(value):
+    return None if value is None else int(round(float(value) * 100))
+
+
+def valuation_buckets(token, session=None, policy=None, concurrency=4, incremental=False, db_file=DB_FILE):
+    """Group every stored listing by (make, model, year, odometer band).
+
+    Makes come from the titles in one vectorized pass; models are matched
+    against the market guide's model list for each make, fetched once per
+    make (concurrently, and cached). Returns (buckets, skipped): buckets
+    maps the bucket key to the [(source, id), ...] of its listings, skipped
+    counts listings whose make, model or year could not be told. With
+    incremental, only listings not valued yet are considered.
+
+    Duplicate listings of one vehicle are matched once, through the
+    vehicle's canonical listing, and share its bucket.
+    """
+    sql = "SELECT source, id, vehicle_id, is_canonical, title, model_year, mileage_km FROM listings"
+    if incremental:
+        sql += " WHERE valued_ts IS NULL"
+    listings = pd.read_sql_query(sql, get_conn(db_file))
+    listings["vehicle_id"] = listings["vehicle_id"].fillna(-listings.index.to_series() - 1)
+    df = (listings.sort_values("is_canonical", ascending=False)
+          .drop_duplicates("vehicle_id").set_index("vehicle_id"))
+    df["make"] = MAKE_MATCHER.extract(df["title"])
+    df["guide_model"] = pd.Series(pd.NA, index=df.index, dtype="string")
+
+    def models_for(make):
+        try:
+            return get_models(make, token, session, policy, db_file=db_file)
+        except (MarketGuideError, requests.RequestException, KeyError, ValueError):
+            return None
+
+    groups = dict(list(df.dropna(subset=["make"]).groupby("make")))
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        models = dict(zip(groups, pool.map(models_for, groups)))
+    for make, group in groups.items():
+        if models[make]:
+            df.loc[group.index, "guide_model"] = model_matcher(tuple(models[make])).extract(group["title"])
+    df["odometer_max"] = -(-(df["mileage_km"] + ODOMETER_MARGIN) // ODOMETER_BUCKET) * ODOMETER_BUCKET
+
+    keys = ["make", "guide_model", "model_year", "odometer_max"]
+    valid = df.dropna(subset=["make", "guide_model", "model_year"])
+    members = listings[["source", "id", "vehicle_id"]].join(valid[keys], on="vehicle_id", how="inner")
+    buckets = {}
+    for key, group in members.groupby(keys, dropna=False):
+        make, model, year, odometer_max = key
+        bucket = (make, model, int(year), None if pd.isna(odometer_max) else int(odometer_max))
+        buckets[bucket] = list(zip(group["source"], group["id"]))
+    return buckets, len(listings) - len(members)
+
+
+def value_listings(token, concurrency=4, incremental=False, on_bucket=None, policy=None, stop_event=None,
+                   fixtures=None, record=False, db_file=DB_FILE):
+    """Value every stored listing with one market-guide request per bucket.
+
+    Bucket lookups run `concurrency` at a time over one pooled session and
+    go through the api_cache table, so buckets looked up recently cost
+    nothing. priceAggMin/Ave/Max are stored (in cents) on every listing of
+    the bucket as its lookup finishes, which also refreshes their deal
+    score; incremental skips listings valued before. on_bucket(result) is called for each
+    bucket; setting stop_event skips the buckets not started yet.
+    """
+    policy = policy or RetryPolicy()
+    session = make_session(headers=api_headers(token), pool_size=concurrency, fixtures=fixtures, record=record)
+    totals = {"buckets": 0, "failed": 0, "listings": 0, "valued": 0, "skipped": 0}
+
+    with session:
+        buckets, totals["skipped"] = valuation_buckets(token, session, policy, concurrency, incremental,
+                                                       db_file=db_file)
+        totals["listings"] = totals["skipped"] + sum(len(ids) for ids in buckets.values())
+
+        def value_bucket(bucket, ids):
+            result = {"bucket": bucket, "listings": len(ids), "valued": 0}
+            if stop_event is not None and stop_event.is_set():
+                result["error"] = "cancelled"
+                return result
+            try:
+                guide = get_market_guide(*bucket, token, session, policy, db_file=db_file)
+                low, avg, high = (_cents(guide.get(k)) for k in ("priceAggMin", "priceAggAve", "priceAggMax"))
+                if avg is None:
+                    result["error"] = "no sales in the market guide"
+                else:
+                    result["valued"] = set_valuations([(source, listing_id, low, avg, high)
+                                                       for source, listing_id in ids], db_file=db_file)
+            except (MarketGuideError, requests.RequestException, ValueError) as e:
+                result["error"] = str(e)
+            return result
+
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            futures = [pool.submit(value_bucket, bucket, ids) for bucket, ids in buckets.items()]
+            for future in as_completed(futures):
+                result = future.result()
+                totals["buckets"] += 1
+                totals["failed"] += "error" in result
+                totals["valued"] += result["valued"]
+                if on_bucket:
+                    on_bucket(result)
+    return totals
@@ -0,0 +1,151 @@
+import cProfile, pstats, sys, threading, time
+from contextlib import contextmanager
+
+# ---------------- CONFIG ----------------
+# Latency histogram bucket upper bounds, in milliseconds
+BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, float("inf"))
+
+# One registry per process, shared by all threads. The runner saves it to
+# the metrics table after each round; the dashboard's own (page renders,
+# market-guide lookups) is read in place by the Diagnostics page.
+_lock = threading.Lock()
+_histograms = {}
+_counters = {}
+
+
+def _key(name, labels):
+    # "http_fetch{host=www.kijiji.ca}"
+    if not labels:
+        return name
+    return f"{name}{{{','.join(f'{k}={v}' for k, v in sorted(labels.items()))}}}"
+
+
+# ---------------- RECORD ----------------
+def observe(name, seconds, **labels):
+    ms = seconds * 1000
+    key = _key(name, labels)
+    with _lock:
+        hist = _histograms.get(key)
+        if hist is None:
+            hist = _histograms[key] = {"count": 0, "sum_ms": 0.0, "max_ms": 0.0, "buckets": [0] * len(BUCKETS_MS)}
+        hist["count"] += 1
+        hist["sum_ms"] += ms
+        hist["max_ms"] = max(hist["max_ms"], ms)
+        hist["buckets"][next(i for i, bound in enumerate(BUCKETS_MS) if ms <= bound)] += 1
+
+
+def count(name, n=1, **labels):
+    if not n:
+        return
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + n
+
+
+@contextmanager
+def timed(name, **labels):
+    """Time the block into the `name` histogram (also when it raises)."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start, **labels)
+
+
+# ---------------- READ ----------------
+def snapshot():
+    with _lock:
+        return {
+            "histograms": {key: dict(hist, buckets=list(hist["buckets"])) for key, hist in _histograms.items()},
+            "counters": dict(_counters),
+        }
+
+
+def reset():
+    with _lock:
+        _histograms.clear()
+        _counters.clear()
+
+
+def merge(snapshots):
+    # Sum several snapshots (e.g. the runner's last rounds) into one
+    merged = {"histograms": {}, "counters": {}}
+    for snap in snapshots:
+        for key, hist in snap.get("histograms", {}).items():
+            total = merged["histograms"].setdefault(
+                key, {"count": 0, "sum_ms": 0.0, "max_ms": 0.0, "buckets": [0] * len(BUCKETS_MS)})
+            total["count"] += hist["count"]
+            total["sum_ms"] += hist["sum_ms"]
+            total["max_ms"] = max(total["max_ms"], hist["max_ms"])
+            total["buckets"] = [a + b for a, b in zip(total["buckets"], hist["buckets"])]
+        for key, value in snap.get("counters", {}).items():
+            merged["counters"][key] = merged["counters"].get(key, 0) + value
+    return merged
+
+
+def percentile(hist, q):
+    # Upper bound of the bucket holding the q-th quantile (the max for the last bucket)
+    if not hist["count"]:
+        return None
+    rank = q * hist["count"]
+    seen = 0
+    for bound, n in zip(BUCKETS_MS, hist["buckets"]):
+        seen += n
+        if seen >= rank:
+            return min(bound, hist["max_ms"])
+    return hist["max_ms"]
+
+
+def summary_rows(snap):
+    """One dict per histogram: count, mean/p50/p95/max in ms."""
+    return [
+        {"stage": key, "count": hist["count"], "mean_ms": hist["sum_ms"] / hist["count"] if hist["count"] else None,
+         "p50_ms": percentile(hist, 0.5), "p95_ms": percentile(hist, 0.95), "max_ms": hist["max_ms"]}
+        for key, hist in sorted(snap["histograms"].items())
+    ]
+
+
+# ---------------- PROFILING ----------------
+@contextmanager
+def profiled(path=None, top=25):
+    """cProfile the block, including every thread started inside it.
+
+    Before Python 3.12, cProfile only sees the thread it is enabled on, so
+    each new thread (job threads, worker pools) gets its own profiler,
+    merged at the end. From 3.12 one profiler already covers every thread
+    and a second one cannot be enabled. The stats are written to `path`
+    (for snakeviz, pstats, ...) when given, and the `top` entries by
+    cumulative time are printed.
+    """
+    profiles = [cProfile.Profile()]
+    lock = threading.Lock()
+    per_thread = sys.version_info < (3, 12)
+
+    def start_thread_profile(frame, event, arg):
+        sys.setprofile(None)
+        profile = cProfile.Profile()
+        with lock:
+            profiles.append(profile)
+        profile.enable()
+
+    if per_thread:
+        threading.setprofile(start_thread_profile)
+    profiles[0].enable()
+    try:
+        yield
+    finally:
+        if per_thread:
+            threading.setprofile(None)
+        with lock:
+            for profile in profiles:
+                profile.disable()
+            # Threads that never made a call leave an empty profiler, which pstats rejects
+            collected = [profile for profile in profiles if profile.getstats()]
+        if not collected:
+            print("📈 nothing was profiled")
+        else:
+            stats = pstats.Stats(*collected)
+            if path:
+                stats.dump_stats(path)
+                print(f"📈 profile written to {path}")
+            stats.sort_stats("cumulative").print_stats(top)
@@ -0,0 +1,212 @@
+"""Scrape job runner, independent of the Streamlit app.
+
+    python runner.py once                    # scrape every source once
+    python runner.py once --sources kijiji --regions ontario quebec --pages 3
+    python runner.py once --full             # re-read every page, not just new listings
+    python runner.py once --sources autotrader --sweep london toronto  # price/year shards per center
+    python runner.py schedule --interval 900 # scrape every 15 minutes
+    python runner.py once --fixtures fixtures  # replay recorded pages offline
+    python runner.py record --fixtures fixtures  # scrape live and save the pages
+    python runner.py value --token TOKEN     # market-guide valuation of listings not valued yet
+    python runner.py schedule --value        # ...and value the new listings after each round
+    python runner.py thumbnails              # download and downsize listing photos not cached yet
+    python runner.py status                  # recent runs
+    python runner.py once --profile run.prof # cProfile the run (all threads) into run.prof
+
+Every run of a source is recorded in the scrape_runs table, with its
+progress mirrored there while it runs, so the dashboard only reads.
+"""
+import argparse, contextlib, os, sys, time
+import db, autotrader, metrics
+from background import start_job, run_kijiji, run_autotrader, run_valuation, run_thumbnails
+from marketguide import parse_token
+
+# ---------------- CONFIG ----------------
+SOURCES = {
+    "kijiji": ("Kijiji", run_kijiji),
+    "autotrader": ("Autotrader", run_autotrader),
+}
+
+# Everything run_once can run: the scrapes plus jobs over stored listings
+TASKS = dict(SOURCES, valuation=("Market guide", run_valuation), thumbnails=("Thumbnails", run_thumbnails))
+
+POLL_SECONDS = 1.0
+LOG_TAIL = 50
+
+
+# ---------------- RUN ----------------
+def _run_fields(job):
+    return dict(job.progress, log="\n".join(job.log_lines[-LOG_TAIL:]))
+
+
+def run_once(sources=tuple(SOURCES), trigger="manual", fixtures=None, record=False,
+             settings=None, kijiji_settings=None, autotrader_settings=None, db_file=db.DB_FILE):
+    """Scrape the given sources concurrently and wait for all of them.
+
+    Returns {source name: final status}. A source that already has a live
+    run (e.g. from the scheduler) is skipped.
+    """
+    db.init_db(db_file)
+    runs, statuses = {}, {}
+    for key in sources:
+        name, target = TASKS[key]
+        run_id = db.start_run(name, trigger, db_file=db_file)
+        if run_id is None:
+            print(f"⏭️ {name}: a run is already in progress, skipping")
+            statuses[name] = "skipped"
+            continue
+        job_settings = dict(settings or {}, fixtures=fixtures, record=record, db_file=db_file)
+        if key == "kijiji":
+            job_settings.update(kijiji_settings or {})
+        if key == "autotrader":
+            job_settings.update(autotrader_settings or {})
+        runs[run_id] = [start_job(name, target, **job_settings), 0]
+
+    try:
+        while runs:
+            time.sleep(POLL_SECONDS)
+            for run_id, entry in list(runs.items()):
+                job, seen = entry
+                for line in job.new_log_lines(seen):
+                    print(f"[{job.name}] {line}")
+                entry[1] = job.log_count
+
+                if job.running:
+                    if db.cancel_requested(run_id, db_file=db_file):
+                        job.cancel()
+                    db.update_run(run_id, db_file=db_file, **_run_fields(job))
+                    continue
+
+                error = job.error or (job.result or {}).get("error")
+                status = "failed" if error and job.status == "done" else job.status
+                db.finish_run(run_id, status, db_file=db_file, error=error, **_run_fields(job))
+                statuses[job.name] = status
+                print(f"[{job.name}] {status} in {job.elapsed:.1f}s")
+                del runs[run_id]
+    except KeyboardInterrupt:
+        for run_id, (job, _) in runs.items():
+            job.cancel()
+            job.join(10)
+            db.finish_run(run_id, "cancelled", db_file=db_file, **_run_fields(job))
+        raise
+    finally:
+        # This round's stage timings and counters, for the Diagnostics page
+        snapshot = metrics.snapshot()
+        if snapshot["histograms"] or snapshot["counters"]:
+            db.save_metrics(f"runner {trigger}: {', '.join(sources)}", snapshot, db_file=db_file)
+        metrics.reset()
+    return statuses
+
+
+def run_round(trigger, valuation=None, thumbnails=None, **kwargs):
+    # The scrapes, then (with valuation settings) the valuation of whatever
+    # they added, so new listings get their deal score in the same round,
+    # and (with thumbnail settings) their photos
+    statuses = run_once(trigger=trigger, **kwargs)
+    if valuation:
+        statuses.update(run_once(["valuation"], trigger=trigger, settings=valuation, db_file=kwargs["db_file"]))
+    if thumbnails:
+        statuses.update(run_once(["thumbnails"], trigger=trigger, settings=thumbnails, db_file=kwargs["db_file"]))
+    return statuses
+
+
+def schedule(interval, **kwargs):
+    # Fixed-rate schedule: each round starts `interval` seconds after the
+    # previous one started, or immediately if that one overran.
+    while True:
+        started = time.monotonic()
+        run_round(trigger="schedule", **kwargs)
+        delay = interval - (time.monotonic() - started)
+        if delay > 0:
+            print(f"💤 next run in {delay:.0f}s")
+            time.sleep(delay)
+
+
+def print_status(limit, db_file=db.DB_FILE):
+    db.init_db(db_file)
+    runs = db.get_runs(limit, db_file=db_file)
+    if runs.empty:
+        print("No runs recorded yet.")
+        return
+    runs["started"] = runs["started_ts"].map(lambda ts: time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(ts)))
+    print(runs[["id", "source", "trigger", "status", "started", "pages", "found", "inserted", "ignored", "error"]]
+          .to_string(index=False))
+
+
+# ---------------- CLI ----------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Scrape car listings into cars.db")
+    parser.add_argument("command", choices=["once", "schedule", "record", "value", "thumbnails", "status"])
+    parser.add_argument("--sources", nargs="+", choices=list(SOURCES), default=list(SOURCES))
+    parser.add_argument("--db", default=db.DB_FILE, help="SQLite file (default: cars.db next to this script)")
+    parser.add_argument("--fixtures", help="replay recorded pages from this directory (record: save them here)")
+    parser.add_argument("--trigger", default=None, help="label stored with the run (default: the command)")
+    parser.add_argument("--interval", type=float, default=900, help="schedule: seconds between runs")
+    parser.add_argument("--limit", type=int, default=20, help="status: number of runs to show")
+    parser.add_argument("--regions", nargs="+", default=["ontario"], help="Kijiji regions")
+    parser.add_argument("--sweep", nargs="+", metavar="CENTER", choices=list(autotrader.CENTERS),
+                        help="Autotrader: sweep price/year shards around these postal-code centers")
+    parser.add_argument("--full", action="store_true",
+                        help="fetch every page and re-insert known listings instead of stopping at them; "
+                             "value: re-value listings already valued")
+    parser.add_argument("--pages", type=int, default=None,
+                        help="result pages per search (default: 1, or at most 10 when incremental)")
+    parser.add_argument("--concurrency", type=int, default=4,
+                        help="Kijiji / Autotrader sweep / market guide / thumbnail concurrent requests")
+    parser.add_argument("--rate", type=float, default=2.0,
+                        help="Kijiji / Autotrader sweep / thumbnail max requests per second per host")
+    parser.add_argument("--token", default=os.environ.get("MARKETGUIDE_TOKEN"),
+                        help="value: market guide bearer token (default: $MARKETGUIDE_TOKEN)")
+    parser.add_argument("--value", action="store_true", help="once/schedule: value new listings after scraping")
+    parser.add_argument("--profile", nargs="?", const="", metavar="FILE",
+                        help="cProfile the command (every thread); print the top entries and write FILE if given")
+    parser.add_argument("--thumbnails", action="store_true",
+                        help="once/schedule: fetch thumbnails of new listings after scraping")
+    args = parser.parse_args(argv)
+
+    if args.command == "status":
+        print_status(args.limit, db_file=args.db)
+        return 0
+    if args.command == "record" and not args.fixtures:
+        parser.error("record needs --fixtures DIR")
+
+    incremental = not args.full
+    # Accept the bare token or a pasted "Authorization: Bearer ..." header
+    token = parse_token(args.token) or args.token
+    if (args.command == "value" or args.value) and not token:
+        parser.error("valuation needs --token or MARKETGUIDE_TOKEN")
+    valuation = dict(token=token, concurrency=args.concurrency, incremental=incremental)
+    thumbnails = dict(concurrency=args.concurrency, rate_per_host=args.rate)
+    profiler = metrics.profiled(args.profile or None) if args.profile is not None else contextlib.nullcontext()
+    if args.command in ("value", "thumbnails"):
+        task, settings = ("valuation", valuation) if args.command == "value" else ("thumbnails", thumbnails)
+        with profiler:
+            statuses = run_once([task], trigger=args.trigger or args.command, fixtures=args.fixtures,
+                                settings=settings, db_file=args.db)
+        return 0 if all(status in ("done", "skipped") for status in statuses.values()) else 1
+
+    pages = args.pages or (10 if incremental else 1)
+    kwargs = dict(
+        sources=args.sources,
+        fixtures=args.fixtures,
+        record=args.command == "record",
+        settings=dict(pages=pages, incremental=incremental),
+        kijiji_settings=dict(regions=args.regions, concurrency=args.concurrency, rate_per_host=args.rate),
+        autotrader_settings=dict(centers=args.sweep, concurrency=args.concurrency, rate_per_host=args.rate)
+        if args.sweep else None,
+        valuation=valuation if args.value else None,
+        thumbnails=thumbnails if args.thumbnails else None,
+        db_file=args.db,
+    )
+    try:
+        with profiler:
+            if args.command == "schedule":
+                schedule(args.interval, **kwargs)
+            statuses = run_round(trigger=args.trigger or args.command, **kwargs)
+    except KeyboardInterrupt:
+        return 130
+    return 0 if all(status in ("done", "skipped") for status in statuses.values()) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,319 @@
+import html, json, os, queue, random, threading, time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+import urllib3
+import metrics
+
+# orjson is optional; it parses the page payloads several times faster
+try:
+    import orjson
+    json_loads = orjson.loads
+except ImportError:
+    orjson = None
+    json_loads = json.loads
+
+# The scrapers have always run with verify=False; keep the log quiet about it
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+
+# ---------------- EMBEDDED JSON ----------------
+# Both sites are Next.js apps that ship their data as a JSON
+# <script id="__NEXT_DATA__" type="application/json"> block.
+def _json_script_bounds(page):
+    # Fast path: jump straight to the __NEXT_DATA__ marker
+    marker = page.find('id="__NEXT_DATA__"')
+    if marker != -1:
+        start = page.rfind("<script", 0, marker)
+        open_end = page.find(">", marker)
+        if start != -1 and open_end != -1 and 'type="application/json"' in page[start:open_end]:
+            end = page.find("</script>", open_end)
+            if end != -1:
+                return open_end + 1, end
+
+    # Otherwise the first <script ... type="application/json"> tag
+    pos = 0
+    while True:
+        start = page.find("<script", pos)
+        if start == -1:
+            return None
+        open_end = page.find(">", start)
+        if open_end == -1:
+            return None
+        if 'type="application/json"' in page[start:open_end]:
+            end = page.find("</script>", open_end)
+            return (open_end + 1, end) if end != -1 else None
+        pos = open_end
+
+
+# The entities React escapes JSON with. &amp; goes last, so "&amp;quot;"
+# decodes to the literal "&quot;" rather than to a quote.
+_JSON_ENTITIES = (("&quot;", '"'), ("&#39;", "'"), ("&lt;", "<"), ("&gt;", ">"), ("&amp;", "&"))
+
+
+def decode_entities(text):
+    # str.replace runs at C speed, several times faster than html.unescape's
+    # per-match callback; any other entity falls back to html.unescape.
+    if sum(text.count(entity) for entity, _ in _JSON_ENTITIES) != text.count("&"):
+        return html.unescape(text)
+    for entity, char in _JSON_ENTITIES:
+        text = text.replace(entity, char)
+    return text
+
+
+def extract_next_data(page):
+    """Return the parsed JSON payload of the page, or None if it has none.
+
+    A single forward scan finds the script tag, without a regex over the
+    whole document. Script content is normally raw JSON and is parsed as
+    is; only an entity-encoded payload ({&quot;...) is decoded, so "&amp;"
+    inside a raw JSON string is left alone.
+    """
+    bounds = _json_script_bounds(page)
+    if bounds is None:
+        return None
+    text = page[bounds[0]:bounds[1]].strip()
+    if text[:7] in ("{&quot;", "[&quot;"):
+        text = decode_entities(text)
+    return json_loads(text)
+
+
+# ---------------- FIXTURES ----------------
+# Recorded pages live under <fixtures>/<host>/<path with "/" -> "_">.html, e.g.
+# fixtures/www.kijiji.ca/b-cars-trucks_ontario_c174l9004.html. Query strings
+# are ignored, so one recording answers every parameter combination.
+def fixture_path(root, url):
+    parts = urlsplit(url)
+    name = parts.path.strip("/").replace("/", "_") or "index"
+    return os.path.join(root, parts.netloc, name + ".html")
+
+
+class FixtureAdapter(BaseAdapter):
+    """Answers requests from recorded pages on disk instead of the network."""
+
+    def __init__(self, root):
+        super().__init__()
+        self.root = root
+
+    def send(self, request, **kwargs):
+        response = requests.Response()
+        response.url = request.url
+        response.request = request
+        response.encoding = "utf-8"
+        response.headers = CaseInsensitiveDict({"Content-Type": "text/html; charset=utf-8"})
+        path = fixture_path(self.root, request.url)
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                response._content = f.read()
+            response.status_code = 200
+        else:
+            response._content = b""
+            response.status_code = 404
+        return response
+
+    def close(self):
+        pass
+
+
+class RecordingAdapter(HTTPAdapter):
+    """A normal pooled adapter that also saves every 200 page as a fixture."""
+
+    def __init__(self, root, **kwargs):
+        super().__init__(**kwargs)
+        self.root = root
+
+    def send(self, request, **kwargs):
+        response = super().send(request, **kwargs)
+        if response.status_code == 200:
+            path = fixture_path(self.root, request.url)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as f:
+                f.write(response.content)
+        return response
+
+
+# ---------------- SESSION ----------------
+def make_session(headers=None, cookies=None, pool_size=10, fixtures=None, record=False):
+    # One pooled keep-alive session per crawl instead of a fresh TCP/TLS
+    # handshake for every requests.get. pool_maxsize should be at least the
+    # number of worker threads sharing the session. With fixtures set, pages
+    # are replayed from that directory, or recorded into it when record=True.
+    session = requests.Session()
+    if fixtures and not record:
+        adapter = FixtureAdapter(fixtures)
+    elif fixtures:
+        adapter = RecordingAdapter(fixtures, pool_connections=pool_size, pool_maxsize=pool_size)
+    else:
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.verify = False
+    if headers:
+        session.headers.update(headers)
+    if cookies:
+        session.cookies.update(cookies)
+    return session
+
+
+# ---------------- RATE LIMIT ----------------
+class RateLimiter:
+    """Spaces requests to the same host at least 1 / rate seconds apart.
+
+    Shared by all worker threads of a crawl; each caller reserves the next
+    free slot for its host and sleeps until then, outside the lock.
+    """
+
+    def __init__(self, rate_per_host=1.0):
+        self.interval = 1.0 / rate_per_host if rate_per_host else 0.0
+        self._next_slot = {}
+        self._lock = threading.Lock()
+
+    def wait(self, url):
+        if not self.interval:
+            return
+        host = urlsplit(url).netloc
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = slot + self.interval
+        delay = slot - now
+        if delay > 0:
+            time.sleep(delay)
+
+
+# ---------------- RETRY ----------------
+class RetryPolicy:
+    """Exponential backoff with full jitter for HTTP fetches.
+
+    Retries responses whose status is in retry_on and connection errors,
+    waiting min(max_delay, base_delay * multiplier ** attempt) scaled by a
+    random factor, or the server's Retry-After when it sends one. Gives up
+    after max_attempts or once max_elapsed seconds have passed. Waits go
+    through stop_event.wait so a cancelled job stops backing off at once.
+    """
+
+    def __init__(self, max_attempts=5, base_delay=2.0, max_delay=60.0, multiplier=2.0,
+                 max_elapsed=240.0, retry_on=(403, 408, 425, 429, 500, 502, 503, 504), jitter=True):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.multiplier = multiplier
+        self.max_elapsed = max_elapsed
+        self.retry_on = frozenset(retry_on)
+        self.jitter = jitter
+
+    def backoff(self, attempt):
+        delay = min(self.max_delay, self.base_delay * self.multiplier ** attempt)
+        return random.uniform(0, delay) if self.jitter else delay
+
+    @staticmethod
+    def retry_after(response):
+        value = response.headers.get("Retry-After") if response is not None else None
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+        except (TypeError, ValueError):
+            return None
+
+    def request(self, session, url, limiter=None, on_retry=None, stop_event=None, **kwargs):
+        """session.get(url) with retries; returns the last response.
+
+        Raises the last connection error if no attempt got a response.
+        on_retry(url, attempt, delay, reason) is called before each wait.
+        """
+        stop_event = stop_event or threading.Event()
+        start = time.monotonic()
+        attempt = 0
+        host = urlsplit(url).netloc
+        while True:
+            if limiter:
+                limiter.wait(url)
+            response, error = None, None
+            try:
+                with metrics.timed("http_fetch", host=host):
+                    response = session.get(url, **kwargs)
+                metrics.count("http_status", host=host, status=response.status_code)
+            except requests.RequestException as e:
+                error = e
+                metrics.count("http_errors", host=host, error=e.__class__.__name__)
+            if response is not None and response.status_code not in self.retry_on:
+                return response
+
+            attempt += 1
+            delay = self.retry_after(response)
+            if delay is None:
+                delay = self.backoff(attempt - 1)
+            elapsed = time.monotonic() - start
+            if (attempt >= self.max_attempts or elapsed + delay > self.max_elapsed
+                    or stop_event.is_set()):
+                if response is None:
+                    raise error
+                return response
+
+            metrics.count("http_retries", host=host)
+            if on_retry:
+                reason = error if response is None else f"HTTP {response.status_code}"
+                on_retry(url, attempt, delay, reason)
+            if stop_event.wait(delay):
+                if response is None:
+                    raise error
+                return response
+
+
+# ---------------- WRITE QUEUE ----------------
+class WriteQueue:
+    """Runs database writes on one thread, fed through a bounded queue.
+
+    Fetch workers submit(fn, *args) each parsed page and go back to
+    fetching while earlier pages are written, in submission order. Once
+    `maxsize` writes are waiting, submit() blocks, so a slow database holds
+    the fetchers back instead of parsed pages piling up in memory (an
+    executor's queue is unbounded). A write that raises does not stop the
+    thread; close() re-raises the first such error after draining.
+    """
+
+    _DONE = object()
+
+    def __init__(self, maxsize=8, name="writer"):
+        self.name = name
+        self._queue = queue.Queue(maxsize)
+        self._error = None
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is self._DONE:
+                return
+            fn, args, kwargs = item
+            try:
+                fn(*args, **kwargs)
+            except Exception as e:
+                if self._error is None:
+                    self._error = e
+
+    def submit(self, fn, *args, **kwargs):
+        # Time spent blocked here is time the writer was the bottleneck
+        with metrics.timed("write_queue_wait", queue=self.name):
+            self._queue.put((fn, args, kwargs))
+
+    def close(self):
+        self._queue.put(self._DONE)
+        self._thread.join()
+        if self._error is not None:
+            raise self._error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
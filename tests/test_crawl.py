@@ -0,0 +1,97 @@
+import os, shutil, sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import autotrader
+import db
+import kijiji
+
+FIXTURES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "fixtures")
+PAGE_2 = "b-cars-trucks_ontario_page-2_c174l9004.html"
+
+
+def copy_fixtures(tmp_path, broken=()):
+    root = tmp_path / "fixtures"
+    shutil.copytree(FIXTURES, root)
+    for name in broken:
+        # Answers 200 but has no embedded listings JSON
+        (root / "www.kijiji.ca" / name).write_text("<html><body>Something went wrong</body></html>")
+    return str(root)
+
+
+def rows(db_file, sql):
+    return db.get_conn(db_file).execute(sql).fetchall()
+
+
+def test_kijiji_crawl_stores_each_listing_once(tmp_path):
+    db_file = str(tmp_path / "cars.db")
+    db.init_db(db_file)
+    fixtures = copy_fixtures(tmp_path)
+    totals = kijiji.crawl(pages=2, fixtures=fixtures, db_file=db_file)
+    assert totals == {"pages": 2, "failed": 0, "found": 20, "new": 20, "inserted": 20, "ignored": 0,
+                      "price_changes": 0}
+    stored = rows(db_file, "SELECT url, brand_name, price_cents FROM kjiji")
+    assert len({url for url, _, _ in stored}) == 20
+    assert ("https://www.kijiji.ca/v-cars-trucks/ottawa/2018-alfa-romeo-giulia-ti-sport-rare-spec/1728529556",
+            "Alfa Romeo") in [(url, brand) for url, brand, _ in stored]
+    assert rows(db_file, "SELECT COUNT(*) FROM listings WHERE source = 'Kijiji'") == [(20,)]
+
+    totals = kijiji.crawl(pages=2, fixtures=fixtures, db_file=db_file)
+    assert (totals["found"], totals["inserted"], totals["ignored"]) == (20, 0, 20)
+    assert rows(db_file, "SELECT COUNT(*) FROM kjiji") == [(20,)]
+    db.close_conn(db_file)
+
+
+def test_autotrader_scrape_stores_the_page(tmp_path):
+    db_file = str(tmp_path / "cars.db")
+    db.init_db(db_file)
+    fixtures = copy_fixtures(tmp_path)
+    result = autotrader.scrape(fixtures=fixtures, db_file=db_file)
+    assert (result["status"], result["found"], result["inserted"], result["ignored"], result["total"]) == \
+        (200, 10, 10, 0, 10)
+    assert ("2019 Ford F 150", 2200000, "Ford", "F 150", 2019) in rows(
+        db_file, "SELECT title, price_cents, brand, model, model_year FROM autotrader")
+
+    # Incremental: every listing is known, nothing is written again
+    result = autotrader.scrape(incremental=True, fixtures=fixtures, db_file=db_file)
+    assert (result["found"], result["new"], result["inserted"]) == (10, 0, 0)
+    assert rows(db_file, "SELECT COUNT(*) FROM autotrader") == [(10,)]
+    db.close_conn(db_file)
+
+
+def test_autotrader_sweep_merges_shards(tmp_path):
+    db_file = str(tmp_path / "cars.db")
+    db.init_db(db_file)
+    # Every shard is answered by the same recorded page
+    shards = autotrader.make_shards(price_bands=autotrader.PRICE_BANDS[:3], year_bands=[(None, None)])
+    finished = []
+    totals = autotrader.sweep(shards, rate_per_host=100, on_shard=finished.append,
+                              fixtures=copy_fixtures(tmp_path), db_file=db_file)
+    assert sorted(result["key"] for result in finished) == sorted(key for key, _ in shards)
+    assert (totals["shards"], totals["failed"], totals["found"], totals["listings"]) == (3, 0, 30, 10)
+    assert (totals["inserted"], totals["ignored"], totals["truncated"]) == (10, 0, 0)
+    assert rows(db_file, "SELECT COUNT(*), COUNT(DISTINCT ad_link) FROM autotrader") == [(10, 10)]
+    assert rows(db_file, "SELECT COUNT(*) FROM listings WHERE source = 'Autotrader'") == [(10,)]
+    db.close_conn(db_file)
+
+
+def test_incremental_crawl_sets_watermark(tmp_path):
+    db_file = str(tmp_path / "cars.db")
+    db.init_db(db_file)
+    totals = kijiji.crawl(pages=2, incremental=True, fixtures=copy_fixtures(tmp_path), db_file=db_file)
+    assert (totals["pages"], totals["found"], totals["inserted"]) == (2, 20, 20)
+    assert db.get_watermark("Kijiji", "cars-trucks/ontario", db_file=db_file) is not None
+    db.close_conn(db_file)
+
+
+def test_unparsable_page_keeps_watermark(tmp_path):
+    db_file = str(tmp_path / "cars.db")
+    db.init_db(db_file)
+    pages = []
+    totals = kijiji.crawl(pages=2, incremental=True, fixtures=copy_fixtures(tmp_path, broken=[PAGE_2]),
+                          on_page=pages.append, db_file=db_file)
+    assert (totals["pages"], totals["found"], totals["inserted"]) == (2, 10, 10)
+    assert [page["status"] for page in pages] == [200, 200]
+    assert "error" in pages[1]
+    # Page 2 was never read, so the next run must not stop at page 1's listings
+    assert db.get_watermark("Kijiji", "cars-trucks/ontario", db_file=db_file) is None
+    db.close_conn(db_file)
@@ -0,0 +1,35 @@
+import os, sqlite3, sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import db
+
+
+def columns(conn, table):
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+
+def test_failed_migration_rolls_back_and_restart_recovers(tmp_path, monkeypatch):
+    db_file = str(tmp_path / "cars.db")
+
+    def broken_step(conn):
+        # Fails after its DDL, like a backfill hitting bad data
+        conn.execute("ALTER TABLE kjiji ADD COLUMN price_cents INTEGER")
+        conn.execute("CREATE INDEX idx_kjiji_price ON kjiji (price_cents)")
+        raise sqlite3.OperationalError("backfill failed")
+
+    monkeypatch.setattr(db, "MIGRATIONS", [broken_step] + db.MIGRATIONS[1:])
+    with pytest.raises(sqlite3.OperationalError, match="backfill failed"):
+        db.init_db(db_file)
+    conn = db.get_conn(db_file)
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == 0
+    assert "price_cents" not in columns(conn, "kjiji")
+    db.close_conn(db_file)
+
+    monkeypatch.undo()
+    db.init_db(db_file)
+    conn = db.get_conn(db_file)
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == len(db.MIGRATIONS)
+    assert "price_cents" in columns(conn, "kjiji")
+    db.close_conn(db_file)
@@ -0,0 +1,74 @@
+import os, sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import db
+
+
+def plan(conn, sql, args):
+    return " | ".join(row[-1] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, args))
+
+
+def test_pages_walk_the_sort_index(tmp_path):
+    db_file = str(tmp_path / "cars.db")
+    db.init_db(db_file)
+    conn = db.get_conn(db_file)
+    for view, spec in db.QUERY_SOURCES.items():
+        for sort, (column, direction) in db.SORTS.items():
+            index = f"idx_{spec['table']}_sort_{column}_{direction.lower()}"
+            first = plan(conn, *db._page_sql(view, sort, None, 20))
+            assert f"USING INDEX {index}" in first and "TEMP B-TREE" not in first, (view, sort, first)
+            cursor = (0,) + (("kijiji",) if view is None else ()) + (1,)
+            later = plan(conn, *db._page_sql(view, sort, cursor, 20))
+            assert f"SEARCH {spec['table']} USING INDEX {index}" in later, (view, sort, later)
+            assert "TEMP B-TREE" not in later, (view, sort, later)
+    db.close_conn(db_file)
+
+
+def test_pages_cover_every_listing_once(tmp_path):
+    db_file = str(tmp_path / "cars.db")
+    db.init_db(db_file)
+    db.insert_autotrader_cars([{"title": f"20{10 + i % 4} Honda Civic", "price": None if i % 5 == 0 else f"${9000 + i % 3}",
+                                "ad_link": f"https://example.com/{i}"} for i in range(23)], db_file=db_file)
+    for sort in db.SORTS:
+        seen, cursor = [], None
+        while True:
+            page, cursor = db.query_listings("Autotrader", sort=sort, after=cursor, limit=5, db_file=db_file)
+            seen += page["id"].tolist()
+            if cursor is None:
+                break
+        assert sorted(seen) == list(range(1, 24)), sort
+    db.close_conn(db_file)
+
+
+def test_makes_are_stored_canonical(tmp_path):
+    db_file = str(tmp_path / "cars.db")
+    db.init_db(db_file)
+    db.insert_kijiji_cars([{"name": "2014 Mercedes C300", "brand_name": "mercedes", "url": "https://example.com/k1"},
+                           {"name": "2012 Volkswagen Jetta", "brand_name": "othrmake", "url": "https://example.com/k2"}],
+                          db_file=db_file)
+    db.insert_autotrader_cars([{"title": "2016 Mercedes-Benz C-Class", "brand": "Mercedes-Benz",
+                                "ad_link": "https://example.com/a1"}], db_file=db_file)
+    assert db.get_brands(db_file) == ["Mercedes-Benz", "Volkswagen"]
+    assert db.count_listings(None, brand="Mercedes-Benz", db_file=db_file) == 2
+    assert db.count_listings("Kijiji", brand="mercedes", db_file=db_file) == 1
+
+    conn = db.get_conn(db_file)
+    for view, spec in db.QUERY_SOURCES.items():
+        sql, args = db._page_sql(view, "newest", None, 20, brand="Mercedes-Benz")
+        assert f"SEARCH {spec['table']} USING INDEX" in plan(conn, sql, args)
+    db.close_conn(db_file)
+
+
+def test_price_history_of_a_page(tmp_path):
+    db_file = str(tmp_path / "cars.db")
+    db.init_db(db_file)
+    cars = [{"title": "2015 Honda Civic LX", "price": "$12,300", "ad_link": "https://example.com/a"},
+            {"title": "2012 Mazda 3 GS", "price": "$6,900", "ad_link": "https://example.com/b"}]
+    db.insert_autotrader_cars(cars, db_file=db_file)
+    # Observations are per second: the first price was seen a day earlier
+    with db.get_conn(db_file) as conn:
+        conn.execute("UPDATE observations SET observed_ts = observed_ts - 86400")
+    db.record_observations("Autotrader", [dict(cars[0], price="$11,800")], db_file=db_file)
+    history = db.price_history([("Autotrader", 1), ("Autotrader", 2), ("Kijiji", 1)], db_file=db_file)
+    assert history == {("Autotrader", 1): [1230000, 1180000], ("Autotrader", 2): [690000], ("Kijiji", 1): []}
+    db.close_conn(db_file)
@@ -0,0 +1,38 @@
+import os, sys, threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import db
+
+
+def test_only_one_of_concurrent_runs_starts(tmp_path):
+    db_file = str(tmp_path / "cars.db")
+    db.init_db(db_file)
+    barrier, started = threading.Barrier(8), []
+
+    def start():
+        # One connection per thread, like separate runner processes
+        barrier.wait()
+        started.append(db.start_run("Kijiji", db_file=db_file))
+        db.close_conn(db_file)
+
+    threads = [threading.Thread(target=start) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len([run_id for run_id in started if run_id is not None]) == 1
+    assert db.start_run("Autotrader", db_file=db_file) is not None
+    db.close_conn(db_file)
+
+
+def test_run_of_an_exited_process_does_not_block(tmp_path):
+    db_file = str(tmp_path / "cars.db")
+    db.init_db(db_file)
+    stale = db.start_run("Kijiji", db_file=db_file)
+    with db.get_conn(db_file) as conn:
+        conn.execute("UPDATE scrape_runs SET started_ts = started_ts - ? WHERE id = ?",
+                     (db.STALE_RUN_SECONDS + 1, stale))
+    assert db.start_run("Kijiji", db_file=db_file) is not None
+    runs = db.get_runs(db_file=db_file).set_index("id")
+    assert runs.loc[stale, "status"] == "failed"
+    db.close_conn(db_file)
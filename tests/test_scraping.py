@@ -0,0 +1,48 @@
+import glob, html, json, os, re, sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scraping import decode_entities, extract_next_data
+
+FIXTURES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "fixtures")
+
+
+def page(payload):
+    return ('<html><head><script>window.dataLayer=[]</script></head><body><div>listing</div>'
+            f'<script id="__NEXT_DATA__" type="application/json">{payload}</script></body></html>')
+
+
+def extract_reference(html_text):
+    # The regex + full unescape extraction extract_next_data replaced
+    match = re.search(r'<script[^>]+type="application/json"[^>]*>(.*?)</script>', html_text, re.DOTALL)
+    if not match:
+        return None
+    text = match.group(1).strip()
+    return json.loads(html.unescape(text) if text.startswith("{&quot;") else text)
+
+
+def test_recorded_pages_match_the_reference():
+    paths = glob.glob(os.path.join(FIXTURES, "**", "*.html"), recursive=True)
+    assert paths
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            text = f.read()
+        assert extract_next_data(text) == extract_reference(text), path
+
+
+def test_entity_encoded_payload():
+    payload = {"title": 'Civic "Si" <AWD> & more', "raw": "&amp;", "n": 1}
+    encoded = html.escape(json.dumps(payload), quote=True)
+    assert encoded.startswith("{&quot;")
+    assert extract_next_data(page(encoded)) == payload
+    # Entities outside the JSON set fall back to html.unescape
+    assert decode_entities("{&quot;make&quot;: &quot;Citro&euml;n&quot;}") == '{"make": "Citroën"}'
+
+
+def test_plain_payload_is_not_unescaped():
+    payload = {"title": "Tom &amp; Jerry", "price": [1, 2]}
+    assert extract_next_data(page(json.dumps(payload))) == payload
+
+
+def test_missing_payload():
+    assert extract_next_data("<html><script>var x = 1;</script><p>No results</p></html>") is None
+    assert extract_next_data("") is None
@@ -0,0 +1,39 @@
+import os, sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import db
+
+
+def fts_rows(conn):
+    return conn.execute("SELECT COUNT(*) FROM listings_fts").fetchone()[0]
+
+
+def test_reinserted_listing_keeps_one_index_row(tmp_path):
+    db_file = str(tmp_path / "cars.db")
+    db.init_db(db_file)
+    db.insert_autotrader_cars([{"title": "2015 Honda Civic LX", "price": "$12,300", "ad_link": "https://example.com/a"},
+                               {"title": "2012 Mazda 3 GS", "price": "$6,900", "ad_link": "https://example.com/b"}],
+                              db_file=db_file)
+    conn = db.get_conn(db_file)
+    assert fts_rows(conn) == 2
+
+    # What the source triggers do when a listing with the same (source, id) exists
+    with conn:
+        conn.execute("""
+            INSERT OR REPLACE INTO listings (source, id, title)
+            SELECT source, id, title || ' Sedan' FROM listings WHERE title LIKE '%Civic%'
+        """)
+    assert fts_rows(conn) == 2
+    results = db.search_listings("civic", db_file=db_file)
+    assert results["title"].tolist() == ["2015 Honda Civic LX Sedan"]
+    db.close_conn(db_file)
+
+
+def test_search_ignores_query_syntax(tmp_path):
+    db_file = str(tmp_path / "cars.db")
+    db.init_db(db_file)
+    db.insert_autotrader_cars([{"title": "2016 Mercedes-Benz C-Class", "price": "$19,000",
+                                "ad_link": "https://example.com/c"}], db_file=db_file)
+    assert len(db.search_listings('C-Class ("*:', db_file=db_file)) == 1
+    assert db.search_listings("", db_file=db_file).empty
+    db.close_conn(db_file)
@@ -0,0 +1,41 @@
+import os, sys
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from titles import MAKE_MATCHER, TitleMatcher, parse_titles
+
+
+def test_aliases_resolve_to_the_guide_spelling():
+    assert MAKE_MATCHER.find("2014 Mercedes C300 4MATIC") == "Mercedes-Benz"
+    assert MAKE_MATCHER.find("2016 Mercedes-Benz C-Class") == "Mercedes-Benz"
+    assert MAKE_MATCHER.find("2011 VW Golf TDI") == "Volkswagen"
+    parsed = parse_titles(["2014 Mercedes C300", "2018 Chevy Silverado 1500"])
+    assert parsed["make"].tolist() == ["Mercedes-Benz", "Chevrolet"]
+    assert parsed["model"].tolist() == ["C300", "Silverado 1500"]
+
+
+def test_longest_name_wins():
+    matcher = TitleMatcher(["Rover", "Land Rover"])
+    assert matcher.find("2019 Land Rover Discovery") == "Land Rover"
+    assert matcher.find("1998 Rover Mini") == "Rover"
+    assert MAKE_MATCHER.find("2019 Land Rover Range Rover Sport") == "Land Rover"
+    # Bounded: no make inside a longer word
+    assert MAKE_MATCHER.find("Ramsey pickup") is None
+
+
+def test_matching_ignores_case_and_separators():
+    assert MAKE_MATCHER.find("2020 TOYOTA COROLLA") == "Toyota"
+    assert MAKE_MATCHER.find("2015 land-rover lr4") == "Land Rover"
+    assert MAKE_MATCHER.find("2013 fiat 500") == "FIAT"
+    assert MAKE_MATCHER.extract(["2019 ford f-150", "2020 BMW X3"]).tolist() == ["Ford", "BMW"]
+
+
+def test_missing_titles_give_na():
+    assert MAKE_MATCHER.find(None) is None
+    assert MAKE_MATCHER.find("") is None
+    parsed = parse_titles(pd.Series([None, "", "2010 Unknownmake Thing"]))
+    assert parsed["make"].isna().all()
+    assert parsed["model"].isna().all()
+    assert parsed["year"].iloc[:2].isna().all()
+    assert parsed["year"].iloc[2] == 2010
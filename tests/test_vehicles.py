@@ -0,0 +1,66 @@
+import os, sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import db
+
+
+def car(url, image, **fields):
+    # Two of these only differ in the fields given: same make, model, year,
+    # mileage band and price band
+    return dict({"title": "2015 Honda Civic LX", "brand": "Honda", "model": "Civic", "price": "$12,300",
+                 "odometer": "101,000 km", "image_src": image, "ad_link": url}, **fields)
+
+
+def vehicles(db_file):
+    return db.get_conn(db_file).execute(
+        "SELECT source, vehicle_id, is_canonical FROM listings ORDER BY source, id").fetchall()
+
+
+def test_different_photos_are_different_vehicles(tmp_path):
+    db_file = str(tmp_path / "cars.db")
+    db.init_db(db_file)
+    db.insert_autotrader_cars([car("https://example.com/a", "https://img.example.com/a.jpg"),
+                               car("https://example.com/b", "https://img.example.com/b.jpg",
+                                   odometer="102,500 km")], db_file=db_file)
+    rows = vehicles(db_file)
+    assert len({vehicle_id for _, vehicle_id, _ in rows}) == 2
+    assert all(canonical for _, _, canonical in rows)
+    db.close_conn(db_file)
+
+
+def test_same_site_never_merges_on_fingerprint(tmp_path):
+    db_file = str(tmp_path / "cars.db")
+    db.init_db(db_file)
+    db.insert_autotrader_cars([car("https://example.com/a", "N/A")], db_file=db_file)
+    db.insert_autotrader_cars([car("https://example.com/b", "N/A")], db_file=db_file)
+    assert len({vehicle_id for _, vehicle_id, _ in vehicles(db_file)}) == 2
+    db.close_conn(db_file)
+
+
+def test_same_photo_is_one_vehicle(tmp_path):
+    db_file = str(tmp_path / "cars.db")
+    db.init_db(db_file)
+    db.insert_autotrader_cars([car("https://example.com/a", "https://img.example.com/a.jpg")], db_file=db_file)
+    db.insert_autotrader_cars([car("https://example.com/b", "https://img.example.com/a.jpg?w=300",
+                                   price="$11,900")], db_file=db_file)
+    rows = vehicles(db_file)
+    assert len({vehicle_id for _, vehicle_id, _ in rows}) == 1
+    assert sum(canonical for _, _, canonical in rows) == 1
+    db.close_conn(db_file)
+
+
+def test_shared_stock_photo_needs_same_make_and_year(tmp_path):
+    db_file = str(tmp_path / "cars.db")
+    db.init_db(db_file)
+    stock = "https://img.example.com/dealer-lot.jpg"
+    # Same batch (matched in the loop) and a later batch (matched in SQL)
+    db.insert_autotrader_cars([car("https://example.com/a", stock),
+                               car("https://example.com/b", stock, title="2019 Toyota Corolla LE", brand="Toyota",
+                                   model="Corolla", price="$18,900")], db_file=db_file)
+    db.insert_autotrader_cars([car("https://example.com/c", stock, title="2017 Honda Civic EX", price="$14,500"),
+                               car("https://example.com/d", stock, price="$11,900")], db_file=db_file)
+    rows = vehicles(db_file)
+    assert len({vehicle_id for _, vehicle_id, _ in rows}) == 3
+    # The 2015 Civic's repost still joins it
+    assert rows[0][1] == rows[3][1]
+    db.close_conn(db_file)
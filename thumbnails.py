@@ -0,0 +1,130 @@
+import hashlib, io, os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import requests
+from db import DB_FILE, pending_thumbnail_urls, set_thumbnail
+from scraping import make_session, RateLimiter, RetryPolicy
+
+# Pillow is optional; without it no thumbnails are made and cards keep
+# loading the remote photos
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+# ---------------- CONFIG ----------------
+# Thumbnails are content-addressed (named by the hash of their bytes) under
+# static/thumbs, which Streamlit serves at app/static/thumbs when
+# server.enableStaticServing is on (see .streamlit/config.toml).
+THUMB_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static", "thumbs")
+THUMB_URL = "app/static/thumbs"
+
+THUMB_SIZE = (360, 270)   # twice the 180px card width, for high-DPI screens
+THUMB_QUALITY = 75
+MAX_IMAGE_BYTES = 10 * 1024 * 1024
+
+# Failures worth another try on the next run; these are not stored
+TRANSIENT_STATUSES = frozenset({408, 425, 429})
+
+headers = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/139.0.0.0 Safari/537.36',
+    'Accept': 'image/avif,image/webp,image/apng,image/*,*/*;q=0.8',
+    'Accept-Language': 'en-US,en;q=0.9',
+}
+
+
+def available():
+    return Image is not None
+
+
+def thumbnail_path(digest):
+    return os.path.join(THUMB_DIR, f"{digest}.webp")
+
+
+def thumbnail_url(digest):
+    return f"{THUMB_URL}/{digest}.webp"
+
+
+# ---------------- THUMBNAILS ----------------
+def make_thumbnail(data):
+    """Downsize image bytes to fit THUMB_SIZE; returns WebP bytes."""
+    with Image.open(io.BytesIO(data)) as image:
+        image.draft("RGB", THUMB_SIZE)   # JPEG: decode at a reduced scale
+        image = image.convert("RGB")
+        image.thumbnail(THUMB_SIZE)
+        output = io.BytesIO()
+        image.save(output, "WEBP", quality=THUMB_QUALITY)
+    return output.getvalue()
+
+
+def store_thumbnail(data):
+    # Identical photos (the same car reposted, stock images) share one file.
+    # Written to a temporary name first so a reader never sees half a file.
+    digest = hashlib.sha256(data).hexdigest()[:32]
+    path = thumbnail_path(digest)
+    if not os.path.exists(path):
+        os.makedirs(THUMB_DIR, exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    return digest
+
+
+def fetch_thumbnails(limit=None, concurrency=4, rate_per_host=4.0, on_image=None, policy=None, stop_event=None,
+                     fixtures=None, record=False, db_file=DB_FILE):
+    """Download and downsize the first photo of every listing not done yet.
+
+    Photos are fetched `concurrency` at a time over one pooled session,
+    newest listings first, at most `limit` of them. Each outcome is stored
+    in the thumbnails table, permanent failures included (4xx, images that
+    do not decode), so a broken URL is not retried on every run. Timeouts,
+    429s and 5xx are not stored, so the next run tries the photo again.
+    on_image(result) is called per photo; setting stop_event skips the
+    photos not started yet.
+    """
+    if not available():
+        raise RuntimeError("thumbnails need Pillow (pip install pillow)")
+    policy = policy or RetryPolicy(max_attempts=3)
+    session = make_session(headers=headers, pool_size=concurrency, fixtures=fixtures, record=record)
+    limiter = RateLimiter(rate_per_host)
+    totals = {"images": 0, "failed": 0, "bytes": 0, "thumb_bytes": 0}
+
+    def fetch_one(url):
+        result = {"url": url, "digest": None, "bytes": 0, "thumb_bytes": 0}
+        if stop_event is not None and stop_event.is_set():
+            result["error"] = "cancelled"
+            return result
+        permanent = False
+        try:
+            response = policy.request(session, url, limiter=limiter, stop_event=stop_event, timeout=30)
+            if response.status_code != 200:
+                permanent = response.status_code < 500 and response.status_code not in TRANSIENT_STATUSES
+                raise ValueError(f"HTTP {response.status_code}")
+            if len(response.content) > MAX_IMAGE_BYTES:
+                permanent = True
+                raise ValueError("image too large")
+            try:
+                thumb = make_thumbnail(response.content)
+            except (ValueError, OSError, Image.DecompressionBombError) as e:
+                permanent = True
+                raise ValueError(f"cannot decode image: {e}")
+            result.update(digest=store_thumbnail(thumb), bytes=len(response.content), thumb_bytes=len(thumb))
+        except (requests.RequestException, ValueError, OSError) as e:
+            result["error"] = str(e)
+        if result["digest"] or permanent:
+            set_thumbnail(url, result["digest"], result.get("error"), db_file=db_file)
+        return result
+
+    with session, ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = [pool.submit(fetch_one, url) for url in pending_thumbnail_urls(limit, db_file=db_file)]
+        for future in as_completed(futures):
+            result = future.result()
+            if result.get("error") == "cancelled":
+                continue
+            totals["images"] += 1
+            totals["failed"] += result["digest"] is None
+            totals["bytes"] += result["bytes"]
+            totals["thumb_bytes"] += result["thumb_bytes"]
+            if on_image:
+                on_image(result)
+    return totals
@@ -0,0 +1,80 @@
+import re
+from functools import lru_cache
+import pandas as pd
+
+# ---------------- CONFIG ----------------
+# Makes as the market guide spells them
+MAKES = ['AM General','Acura','Alfa Romeo','American Motors (AMC)','Aston Martin','Audi','BMW','Bentley','BrightDrop','Buick','Cadillac','Chevrolet','Chrysler','Daewoo','Datsun','Dodge','Ducati','Eagle','FIAT','Ferrari','Fiat','Fisker','Ford','Freightliner','GMC','Genesis','Geo','HUMMER','Harley-Davidson','Hino','Honda','Hyundai','INEOS','INFINITI','Indian','International','Isuzu','Jaguar','Jeep','KTM','Karma','Kawasaki','Kenworth','Kia','Lamborghini','Land Rover','Lexus','Lincoln','Lordstown','Lotus','Lucid','MINI','MV-1','Mack','Maserati','Maybach','Mazda','McLaren','Mercedes-Benz','Mercury','Merkur','Mitsubishi','Moto Guzzi','Nissan','Oldsmobile','Panoz','Peterbilt','Peugeot','Plymouth','Polestar','Pontiac','Porsche','Ram','Renault','Rivian','Rolls-Royce','Saab','Saturn','Scion','Smart','Sterling','Subaru','Suzuki','Tesla','Toyota','Triumph','VPG','Victory','VinFast','Volkswagen','Volvo','Western Star','Yamaha','Yugo','Zero','smart']
+
+# Short names titles use for a make -> the market guide's spelling
+MAKE_ALIASES = {'Mercedes': 'Mercedes-Benz', 'Chevy': 'Chevrolet', 'VW': 'Volkswagen'}
+
+YEAR_PATTERN = r"\b((?:19|20)\d{2})\b"
+_SEPARATORS = re.compile(r"[\s-]+")
+
+
+# ---------------- MATCHER ----------------
+class TitleMatcher:
+    """Finds which of a fixed set of names occurs in a title.
+
+    All names are compiled into one case-insensitive alternation, longest
+    first so "Land Rover" wins over a shorter name it contains, and bounded
+    so "Ram" does not match inside "Ramsey". A space or hyphen in a name
+    matches either, so "Mercedes Benz" and "F-150" match "Mercedes-Benz"
+    and "F 150". aliases maps other spellings to one of the names, which
+    is what they are reported as. Build it once and reuse it; find() takes
+    one title and extract() a whole column.
+    """
+
+    def __init__(self, names, aliases=None):
+        # Names that differ only in case ("FIAT"/"Fiat") keep the first spelling
+        self.canonical = {}
+        for name in names:
+            if name and name.strip():
+                self.canonical.setdefault(self._key(name), name)
+        for alias, name in (aliases or {}).items():
+            self.canonical.setdefault(self._key(alias), name)
+        alternation = "|".join(
+            r"[\s-]+".join(re.escape(part) for part in key.split(" "))
+            for key in sorted(self.canonical, key=len, reverse=True)
+        )
+        # One group, so pandas' str.extract returns a Series
+        self.pattern = rf"(?<![\w-])({alternation or '(?!)'})(?![\w-])"
+        self.regex = re.compile(self.pattern, re.IGNORECASE)
+
+    @staticmethod
+    def _key(name):
+        return _SEPARATORS.sub(" ", name.strip().lower())
+
+    def find(self, title):
+        match = self.regex.search(title) if isinstance(title, str) else None
+        return self.canonical[self._key(match.group(1))] if match else None
+
+    def extract(self, titles):
+        matches = pd.Series(titles, dtype="string").str.extract(self.pattern, flags=re.IGNORECASE, expand=False)
+        return matches.str.lower().str.replace(_SEPARATORS.pattern, " ", regex=True).map(self.canonical)
+
+
+MAKE_MATCHER = TitleMatcher(MAKES, MAKE_ALIASES)
+
+
+@lru_cache(maxsize=256)
+def model_matcher(model_names):
+    # model_names is a tuple (e.g. the market guide's models for one make)
+    return TitleMatcher(model_names)
+
+
+# ---------------- PARSE ----------------
+def parse_titles(titles):
+    """Split a column of "2019 Ford F 150"-style titles into make, model and year.
+
+    Returns a DataFrame on the same index. model is the rest of the title
+    after the make (year removed), which for Autotrader titles is exactly
+    the model; make and model are None when no known make is found.
+    """
+    titles = pd.Series(titles, dtype="string")
+    parts = titles.str.extract(MAKE_MATCHER.pattern + r"(?:[\s-]+(.*\S))?", flags=re.IGNORECASE)
+    make = parts[0].str.lower().str.replace(_SEPARATORS.pattern, " ", regex=True).map(MAKE_MATCHER.canonical)
+    model = parts[1].str.replace(YEAR_PATTERN, "", regex=True).str.strip().replace("", pd.NA)
+    year = titles.str.extract(YEAR_PATTERN, expand=False).astype("Int64")
+    return pd.DataFrame({"make": make, "model": model, "year": year}, index=titles.index)